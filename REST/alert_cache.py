@@ -0,0 +1,91 @@
+"""
+Cache aktywnych komunikatów (Alert) dla grup.
+
+Każda grupa ma w cache listę aktualnie aktywnych komunikatów, już
+zserializowanych, ważną do najbliższej granicy czasowej: końca jednego z
+aktywnych komunikatów albo początku najbliższego przyszłego. Wpis jest
+unieważniany przez REST.signals po każdym zapisie i usunięciu komunikatu
+(także kaskadowym i z panelu administracyjnego). Identyfikatory grup
+użytkownika również są w cache, unieważniane przy zmianie członkostwa.
+Cache ALERTS_CACHE musi być wspólny dla procesów (sprawdza to REST.checks).
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+from REST import queries
+from REST.models import MyUser
+from REST.serializers import alert_list_data
+
+GROUP_KEY = 'alerts:group:{}'
+USER_GROUPS_KEY = 'alerts:user-groups:{}'
+
+
+def _cache():
+    return caches[getattr(settings, 'ALERTS_CACHE', 'default')]
+
+
+def _max_timeout():
+    return getattr(settings, 'ALERTS_CACHE_TIMEOUT', 300)
+
+
+def user_group_ids(user_id):
+    key = USER_GROUPS_KEY.format(user_id)
+    group_ids = _cache().get(key)
+    if group_ids is None:
+        group_ids = list(MyUser.groups.through.objects.filter(myuser_id=user_id).values_list('group_id', flat=True))
+        _cache().set(key, group_ids, _max_timeout())
+    return group_ids
+
+
+def _build_group_entries(group_ids, now):
+    """Wpisy dla grup bez aktualnego wpisu w cache, z jednego zapytania."""
+    alerts = list(queries.alerts().filter(group_id__in=group_ids, end_date__gte=now))
+    active = [alert for alert in alerts if alert.start_date <= now]
+    serialized = dict(zip((alert.id for alert in active), alert_list_data(active)))
+
+    by_group = {group_id: [] for group_id in group_ids}
+    for alert in alerts:
+        by_group[alert.group_id].append(alert)
+
+    entries = {}
+    for group_id, group_alerts in by_group.items():
+        group_active = [alert for alert in group_alerts if alert.start_date <= now]
+        # Komunikat przestaje być aktywny po end_date, przyszły staje się aktywny w start_date
+        boundaries = [alert.end_date + timedelta(microseconds=1) for alert in group_active]
+        boundaries += [alert.start_date for alert in group_alerts if alert.start_date > now]
+        entries[GROUP_KEY.format(group_id)] = {
+            'valid_until': min(boundaries + [now + timedelta(seconds=_max_timeout())]),
+            'alerts': [(alert.end_date, alert.id, serialized[alert.id]) for alert in group_active],
+        }
+    # valid_until jest sprawdzane przy odczycie, więc wspólny czas życia wpisów wystarcza
+    _cache().set_many(entries, _max_timeout())
+    return entries
+
+
+def active_alerts(user_id, now=None):
+    """Zserializowane aktywne komunikaty z grup użytkownika, posortowane po end_date."""
+    now = now or timezone.now()
+    group_ids = user_group_ids(user_id)
+    entries = _cache().get_many([GROUP_KEY.format(group_id) for group_id in group_ids])
+
+    stale = [group_id for group_id in group_ids
+             if GROUP_KEY.format(group_id) not in entries or now >= entries[GROUP_KEY.format(group_id)]['valid_until']]
+    if stale:
+        entries.update(_build_group_entries(stale, now))
+
+    alerts = []
+    for group_id in group_ids:
+        alerts.extend(entries[GROUP_KEY.format(group_id)]['alerts'])
+    alerts.sort(key=lambda item: item[:2])
+    return [data for _, _, data in alerts]
+
+
+def invalidate_group(group_id):
+    _cache().delete(GROUP_KEY.format(group_id))
+
+
+def invalidate_user_groups(user_ids):
+    _cache().delete_many([USER_GROUPS_KEY.format(user_id) for user_id in user_ids])
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class RestConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'REST'
+
+    def ready(self):
+        from REST import checks, signals  # noqa: F401
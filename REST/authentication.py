@@ -0,0 +1,53 @@
+"""
+Uwierzytelnianie JWT z cache użytkowników.
+
+JWTAuthentication odczytuje użytkownika z bazy przy każdym żądaniu. Tutaj
+użytkownik jest brany z cache AUTH_USER_CACHE (lokalny, ograniczony LRU
+w procesie) na AUTH_USER_CACHE_TIMEOUT sekund. Wpis jest usuwany przy
+każdym zapisie lub usunięciu użytkownika (REST.signals), a więc po zmianie
+hasła, edycji profilu i usunięciu konta.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+CACHE_KEY = 'auth-user:{}'
+
+
+def _cache():
+    return caches[getattr(settings, 'AUTH_USER_CACHE', 'default')]
+
+
+def _timeout():
+    return getattr(settings, 'AUTH_USER_CACHE_TIMEOUT', 60)
+
+
+def invalidate(user_id):
+    _cache().delete(CACHE_KEY.format(user_id))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+        key = CACHE_KEY.format(user_id)
+        user = _cache().get(key)
+        if user is None:
+            # Pełne sprawdzenie przez SimpleJWT, do cache trafia tylko poprawny użytkownik
+            user = super().get_user(validated_token)
+            _cache().set(key, user, _timeout())
+            return user
+
+        if not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        if api_settings.CHECK_REVOKE_TOKEN and \
+                validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+            raise AuthenticationFailed(_("The user's password has been changed."), code='password_changed')
+        return user
@@ -0,0 +1,268 @@
+"""
+Pomiar wydajności tras z REST.urls wewnątrz procesu (django.test.Client).
+
+Każdy scenariusz odpowiada jednej parze (trasa, metoda) i jest wykonywany
+na zbiorze danych z REST.seeding. Dla każdego scenariusza mierzone są
+czasy odpowiedzi (p50, p95), liczba zapytań SQL na żądanie oraz
+przepustowość. Scenariusze modyfikujące dane są ułożone tak, aby kolejne
+(np. odblokowanie po zablokowaniu) korzystały z danych poprzednich;
+scenariusze niszczące (destructive) są wykonywane na końcu. Wyjątek w
+trakcie żądania jest liczony jako błąd scenariusza i nie przerywa pomiaru.
+"""
+import json
+import time
+from datetime import timedelta
+from io import BytesIO
+from math import ceil
+
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+
+from REST import media
+from REST.models import MyUser, Message, Alert, Conversation
+from REST.seeding import seed, DEFAULT_PASSWORD
+from REST.utils import get_tokens_for_user
+
+API_PREFIX = '/api/'
+
+
+class Context:
+    """Dane wspólne dla scenariuszy: użytkownik wykonujący żądania, jego rozmówca, tokeny."""
+
+    def __init__(self, dataset):
+        self.user_ids = dataset['users']
+        self.group_ids = dataset['groups']
+        # Użytkownik z największą liczbą rozmów, aby skrzynka i wątki nie były puste
+        busiest = Conversation.objects.values('user_id').annotate(count=Count('id')).order_by('-count', 'user_id') \
+            .values_list('user_id', flat=True).first()
+        self.user = MyUser.objects.get(id=busiest or self.user_ids[0])
+        self.partner_id = Conversation.objects.filter(user=self.user).order_by('-last_message_at') \
+            .values_list('partner_id', flat=True).first() or next(i for i in self.user_ids if i != self.user.id)
+        self.others = [user_id for user_id in self.user_ids if user_id not in (self.user.id, self.partner_id)]
+        self.emails = list(MyUser.objects.filter(id__in=self.user_ids[:100]).values_list('email', flat=True))
+        self.tokens = get_tokens_for_user(self.user)
+        self.prepared = {}
+
+    def other(self, i):
+        return self.others[i % len(self.others)]
+
+    def group(self, i):
+        return self.group_ids[i % len(self.group_ids)]
+
+
+class Scenario:
+    def __init__(self, route, method, build, expected=200, prepare=None, anonymous=False, destructive=False):
+        self.route = route
+        self.method = method
+        # build(context, i) zwraca (ścieżka względem API_PREFIX, dane żądania)
+        self.build = build
+        self.expected = expected
+        self.prepare = prepare
+        self.anonymous = anonymous
+        # Usuwa lub unieważnia dane, z których korzystają inne scenariusze
+        self.destructive = destructive
+
+    @property
+    def name(self):
+        return f'{self.method} {self.route}'
+
+    def request(self, client, context, i):
+        path, data = self.build(context, i)
+        headers = {}
+        if not self.anonymous:
+            tokens = context.prepared.get(self.name, {}).get('tokens')
+            headers['HTTP_AUTHORIZATION'] = f'Bearer {tokens[i] if tokens else context.tokens["access"]}'
+        if self.method == 'GET':
+            return client.get(API_PREFIX + path, data, **headers)
+        if self.route == 'accounts/login':
+            # LoginView czyta request.POST, więc dane są wysyłane jako formularz
+            return client.post(API_PREFIX + path, data, **headers)
+        return client.generic(self.method, API_PREFIX + path, json.dumps(data or {}),
+                              content_type='application/json', **headers)
+
+
+def _prepare_victims(context, count):
+    """Osobni użytkownicy dla usuwania konta, po jednym na żądanie."""
+    dataset = seed(users=count, groups=0, messages=0, alerts=0, blocks=0, random_seed=0, prefix='victim')
+    victims = MyUser.objects.filter(id__in=dataset['users']).order_by('id')
+    return {'tokens': [get_tokens_for_user(user)['access'] for user in victims]}
+
+
+def _prepare_alerts(context, count):
+    now = timezone.now()
+    Alert.objects.bulk_create([Alert(user=context.user, title=f'delete {i}', content='benchmark',
+                                     start_date=now, end_date=now + timedelta(days=1),
+                                     group_id=context.group(i), style='primary') for i in range(count)])
+    return {'alerts': list(Alert.objects.filter(user=context.user, title__startswith='delete ')
+                           .order_by('id').values_list('id', flat=True))}
+
+
+def _prepare_picture(context, count):
+    picture = BytesIO()
+    Image.new('RGB', (512, 512), (200, 80, 40)).save(picture, 'PNG')
+    url = media.store(picture.getvalue(), 'png')
+    return {'file_name': url.rsplit('/', 1)[-1]}
+
+
+def _prepare_staff(context, count):
+    context.user.is_staff = True
+    context.user.save(update_fields=['is_staff'])
+    return {}
+
+
+def _alert_data(context, i):
+    now = timezone.now()
+    return {'title': f'benchmark {i}', 'content': 'benchmark', 'start_date': now.isoformat(),
+            'end_date': (now + timedelta(hours=1)).isoformat(), 'group': context.group(i), 'style': 'primary'}
+
+
+SCENARIOS = [
+    Scenario('accounts/register', 'POST', lambda c, i: ('accounts/register', {
+        'firstName': 'Bench', 'lastName': str(i), 'username': f'bench_{i}', 'email': f'bench.{i}@example.com',
+        'date_of_birth': '1990-01-01', 'password': DEFAULT_PASSWORD, 'password2': DEFAULT_PASSWORD}),
+             expected=201, anonymous=True),
+    Scenario('accounts/login', 'POST', lambda c, i: ('accounts/login', {
+        'email': c.emails[i % len(c.emails)], 'password': DEFAULT_PASSWORD}), anonymous=True),
+    Scenario('accounts/logout', 'POST', lambda c, i: ('accounts/logout', None)),
+    Scenario('accounts/change-password', 'POST', lambda c, i: ('accounts/change-password', {
+        'current_password': DEFAULT_PASSWORD, 'new_password': DEFAULT_PASSWORD})),
+    Scenario('accounts/token-refresh/', 'POST', lambda c, i: ('accounts/token-refresh/', {
+        'refresh': c.tokens['refresh']}), anonymous=True),
+    Scenario('accounts/blocked-user/', 'GET', lambda c, i: ('accounts/blocked-user/', None)),
+    Scenario('accounts/blocked-user/', 'POST', lambda c, i: ('accounts/blocked-user/', {
+        'blocked_user': c.other(i)}), expected=201),
+    Scenario('accounts/blocked-user/', 'DELETE', lambda c, i: ('accounts/blocked-user/', {
+        'blocked_user': c.other(i)}), expected=204),
+    Scenario('accounts/person/<int:person_id>/', 'GET', lambda c, i: (f'accounts/person/{c.other(i)}/', None)),
+    Scenario('accounts/person/<int:person_id>/patch/', 'PATCH', lambda c, i: (
+        f'accounts/person/{c.user.id}/patch/', {'description': f'benchmark {i}'})),
+    Scenario('messages/', 'GET', lambda c, i: ('messages/', {'receiver': c.partner_id, 'limit': 50})),
+    Scenario('messages/', 'POST', lambda c, i: ('messages/', {
+        'sender': c.user.id, 'receiver': c.partner_id, 'text': f'benchmark {i}'}), expected=201),
+    Scenario('messages/wait/', 'GET', lambda c, i: ('messages/wait/', {
+        'receiver': c.partner_id, 'after_id': 0, 'timeout': 0})),
+    Scenario('list_users_with_distance/', 'GET', lambda c, i: ('list_users_with_distance/', {'limit': 50})),
+    Scenario('list_users_by_recent_message/', 'GET', lambda c, i: ('list_users_by_recent_message/', None)),
+    Scenario('groups/<int:group_id>/users/', 'GET', lambda c, i: (f'groups/{c.group(i)}/users/', {'limit': 50})),
+    Scenario('groups/<int:pk>/', 'GET', lambda c, i: (f'groups/{c.group(i)}/', None)),
+    Scenario('group/create/', 'POST', lambda c, i: ('group/create/', {
+        'name': f'benchmark {i}', 'logo_url': 'https://example.com/logo.png', 'password': DEFAULT_PASSWORD}), expected=201),
+    Scenario('group/join/', 'POST', lambda c, i: ('group/join/', {
+        'group_id': c.group(i), 'password': DEFAULT_PASSWORD})),
+    Scenario('group/leave/', 'DELETE', lambda c, i: ('group/leave/', {'group_id': c.group(i)})),
+    Scenario('groups/alerts/', 'GET', lambda c, i: ('groups/alerts/', None)),
+    Scenario('groups/alerts/', 'POST', lambda c, i: ('groups/alerts/', _alert_data(c, i)), expected=201),
+    Scenario('accounts/alerts/', 'GET', lambda c, i: ('accounts/alerts/', None)),
+    Scenario('accounts/alerts/', 'DELETE', lambda c, i: ('accounts/alerts/', {
+        'id': c.prepared['DELETE accounts/alerts/']['alerts'][i]}), expected=204, prepare=_prepare_alerts),
+    Scenario('media/<str:file_name>', 'GET', lambda c, i: (
+        f'media/{c.prepared["GET media/<str:file_name>"]["file_name"]}', None), prepare=_prepare_picture),
+    Scenario('throttling/stats/', 'GET', lambda c, i: ('throttling/stats/', None), prepare=_prepare_staff),
+    Scenario('profiling/stats/', 'GET', lambda c, i: ('profiling/stats/', None), prepare=_prepare_staff),
+    # Usuwa konto, więc każde żądanie wykonuje inny, przygotowany wcześniej użytkownik
+    Scenario('accounts/delete-account/', 'DELETE', lambda c, i: ('accounts/delete-account/', None),
+             prepare=_prepare_victims, destructive=True),
+]
+
+
+def percentile(values, fraction):
+    """Percentyl metodą najbliższej rangi."""
+    ordered = sorted(values)
+    return ordered[max(0, ceil(fraction * len(ordered)) - 1)]
+
+
+def measure(scenario, context, requests, warmup):
+    client = Client()
+    total = warmup + requests
+    if scenario.prepare is not None:
+        context.prepared[scenario.name] = scenario.prepare(context, total)
+
+    timings, query_counts, errors = [], [], []
+    for i in range(total):
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            try:
+                response = scenario.request(client, context, i)
+            except Exception as error:
+                # Nieobsłużony wyjątek widoku (w serwerze byłby to błąd 500)
+                errors.append(type(error).__name__)
+                continue
+            elapsed = time.perf_counter() - start
+        if response.status_code != scenario.expected:
+            errors.append(response.status_code)
+        if i >= warmup:
+            timings.append(elapsed)
+            query_counts.append(len(captured.captured_queries))
+
+    result = {
+        'route': scenario.route,
+        'method': scenario.method,
+        'requests': requests,
+        'errors': len(errors),
+        'error_statuses': sorted(set(errors), key=str),
+    }
+    if not timings:
+        return {**result, 'p50_ms': None, 'p95_ms': None, 'mean_ms': None, 'queries_per_request': None,
+                'max_queries': None, 'throughput_rps': None}
+    return {
+        **result,
+        'p50_ms': round(percentile(timings, 0.5) * 1000, 3),
+        'p95_ms': round(percentile(timings, 0.95) * 1000, 3),
+        'mean_ms': round(sum(timings) / len(timings) * 1000, 3),
+        'queries_per_request': round(sum(query_counts) / len(query_counts), 2),
+        'max_queries': max(query_counts),
+        'throughput_rps': round(len(timings) / max(sum(timings), 1e-9), 1),
+    }
+
+
+def missing_routes(scenarios=SCENARIOS):
+    """Trasy z REST.urls bez żadnego scenariusza."""
+    from REST.urls import urlpatterns
+    covered = {scenario.route for scenario in scenarios}
+    return [str(pattern.pattern) for pattern in urlpatterns if str(pattern.pattern) not in covered]
+
+
+def run(dataset, requests=50, warmup=5, routes=None):
+    """Wykonuje scenariusze (opcjonalnie tylko dla podanych tras) i zwraca raport."""
+    cache.clear()
+    context = Context(dataset)
+    scenarios = [scenario for scenario in SCENARIOS if not routes or scenario.route in routes]
+    # Stabilne sortowanie: scenariusze niszczące na końcu, pozostałe w kolejności z SCENARIOS
+    scenarios.sort(key=lambda scenario: scenario.destructive)
+    return {
+        'database': connection.vendor,
+        'dataset': {
+            'users': MyUser.objects.count(),
+            'groups': len(dataset['groups']),
+            'messages': Message.objects.count(),
+            'alerts': Alert.objects.count(),
+        },
+        'requests': requests,
+        'warmup': warmup,
+        'results': [measure(scenario, context, requests, warmup) for scenario in scenarios],
+        'missing_routes': missing_routes(),
+    }
+
+
+def compare(report, baseline):
+    """Zmiana p50 i liczby zapytań względem wcześniejszego raportu, dla wspólnych scenariuszy."""
+    previous = {(result['route'], result['method']): result for result in baseline['results']}
+    changes = []
+    for result in report['results']:
+        before = previous.get((result['route'], result['method']))
+        # Scenariusz, którego wszystkie żądania zakończyły się wyjątkiem, nie ma pomiarów
+        if before is None or result['p50_ms'] is None or before['p50_ms'] is None:
+            continue
+        changes.append({
+            'route': result['route'],
+            'method': result['method'],
+            'p50_change': round((result['p50_ms'] - before['p50_ms']) / before['p50_ms'], 3)
+            if before['p50_ms'] else None,
+            'queries_change': round(result['queries_per_request'] - before['queries_per_request'], 2),
+        })
+    return changes
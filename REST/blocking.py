@@ -0,0 +1,67 @@
+"""
+Zbiory blokad użytkowników w cache BLOCKS_CACHE.
+
+Cache musi być wspólny dla wszystkich procesów (sprawdza to REST.checks),
+inaczej blokada byłaby widoczna w pozostałych procesach dopiero po
+BLOCKS_CACHE_TIMEOUT. Wysłanie wiadomości sprawdza blokady bezpośrednio w
+bazie (is_blocked_in_db), bo odczyt równoległy z dodaniem blokady może
+zapisać w cache nieaktualne zbiory.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Q
+
+from REST.models import BlockedUsers
+
+CACHE_KEY = 'blocks:{}'
+
+
+def _cache():
+    return caches[getattr(settings, 'BLOCKS_CACHE', 'default')]
+
+
+def _timeout():
+    return getattr(settings, 'BLOCKS_CACHE_TIMEOUT', 300)
+
+
+def get_block_sets(user_id):
+    """
+    Zwraca (zablokowani przeze mnie, blokujący mnie) jako zbiory identyfikatorów.
+    Przy pustym cache wykonuje jedno zapytanie obejmujące oba kierunki.
+    """
+    key = CACHE_KEY.format(user_id)
+    block_sets = _cache().get(key)
+    if block_sets is None:
+        blocked_by_me, blocked_me = set(), set()
+        rows = BlockedUsers.objects.filter(Q(user_id=user_id) | Q(blocked_user_id=user_id)) \
+            .values_list('user_id', 'blocked_user_id')
+        for blocker_id, blocked_id in rows:
+            if blocker_id == user_id:
+                blocked_by_me.add(blocked_id)
+            if blocked_id == user_id:
+                blocked_me.add(blocker_id)
+        block_sets = (frozenset(blocked_by_me), frozenset(blocked_me))
+        _cache().set(key, block_sets, _timeout())
+    return block_sets
+
+
+def blocked_me(user_id):
+    """Identyfikatory użytkowników, którzy zablokowali user_id."""
+    return get_block_sets(user_id)[1]
+
+
+def is_either_blocked(user_id, other_id):
+    """Zwraca True, jeżeli którykolwiek z użytkowników zablokował drugiego."""
+    blocked_by_me, blocked_me_ids = get_block_sets(user_id)
+    return other_id in blocked_by_me or other_id in blocked_me_ids
+
+
+def is_blocked_in_db(user_id, other_id):
+    """Jak is_either_blocked, ale jednym zapytaniem do bazy, z pominięciem cache."""
+    return BlockedUsers.objects.filter(Q(user_id=user_id, blocked_user_id=other_id)
+                                       | Q(user_id=other_id, blocked_user_id=user_id)).exists()
+
+
+def invalidate(user_id, blocked_user_id):
+    """Unieważnia zbiory obu stron po dodaniu lub usunięciu blokady."""
+    _cache().delete_many([CACHE_KEY.format(user_id), CACHE_KEY.format(blocked_user_id)])
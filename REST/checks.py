@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.checks import Error, register
+
+# Backendy lokalne dla procesu albo wykonujące przy każdym odczycie zapytanie do
+# bazy lub operację na plikach; cache z unieważnianiem wymaga Redis lub Memcached
+UNSUITABLE_SHARED_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.db.DatabaseCache',
+    'django.core.cache.backends.filebased.FileBasedCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register()
+def check_shared_caches(app_configs, **kwargs):
+    """Cache z unieważnianiem po zmianie danych musi być wspólny dla procesów i nie obciążać bazy."""
+    errors = []
+    for setting in ('BLOCKS_CACHE', 'ALERTS_CACHE'):
+        alias = getattr(settings, setting, 'default')
+        backend = settings.CACHES.get(alias, {}).get('BACKEND')
+        if backend in UNSUITABLE_SHARED_CACHES:
+            errors.append(Error(
+                f"{setting} wskazuje cache '{alias}' z nieodpowiednim backendem ({backend})",
+                hint='Użyj backendu wspólnego dla procesów, np. RedisCache lub PyMemcacheCache.',
+                id='REST.E001',
+            ))
+    return errors
@@ -0,0 +1,187 @@
+import heapq
+from math import radians, degrees, sin, cos, asin, atan2, sqrt, floor
+
+from django.db.models import Q
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - NumPy jest w requirements.txt, bez niego liczone w pętli
+    np = None
+
+EARTH_RADIUS_KM = 6371
+# Połowa obwodu Ziemi - żaden punkt nie jest dalej
+MAX_DISTANCE_KM = floor(EARTH_RADIUS_KM * 3.141592653589793)
+
+GEOHASH_PRECISION = 9
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def haversine_distance(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
+    dlon = lon2 - lon1
+    dlat = lat2 - lat1
+    a = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlon / 2) ** 2
+    c = 2 * atan2(sqrt(a), sqrt(1 - a))
+    distance = EARTH_RADIUS_KM * c  # Odległość w km
+    distance = floor(distance)  # Zaokrąglij w dół
+    return distance
+
+
+def _haversine_distances_numpy(latitude, longitude, latitudes, longitudes):
+    lat1, lon1 = np.radians(latitude), np.radians(longitude)
+    lat2 = np.radians(np.asarray(latitudes, dtype=np.float64))
+    lon2 = np.radians(np.asarray(longitudes, dtype=np.float64))
+    dlon = lon2 - lon1
+    dlat = lat2 - lat1
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    distance = EARTH_RADIUS_KM * c
+    floored = np.floor(distance)
+    distances = floored.astype(np.int64).tolist()
+
+    # NumPy i math mogą różnić się na ostatnich bitach; wartości tuż przy pełnym
+    # kilometrze liczymy ponownie, aby zaokrąglenie było identyczne
+    fraction = distance - floored
+    for index in np.flatnonzero((fraction < 1e-6) | (fraction > 1 - 1e-6)).tolist():
+        distances[index] = haversine_distance(latitude, longitude, latitudes[index], longitudes[index])
+    return distances
+
+
+def haversine_distances(latitude, longitude, latitudes, longitudes):
+    """
+    Zwraca listę odległości (w pełnych km, jak haversine_distance) od punktu
+    do każdej pary z latitudes/longitudes. Z NumPy liczone jednym przebiegiem.
+    """
+    if np is not None and len(latitudes):
+        return _haversine_distances_numpy(latitude, longitude, latitudes, longitudes)
+    return [haversine_distance(latitude, longitude, lat, lon) for lat, lon in zip(latitudes, longitudes)]
+
+
+def encode_geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    """Koduje współrzędne jako geohash o podanej liczbie znaków."""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    geohash = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(geohash) < precision:
+        if even:
+            value, interval = longitude, lon_range
+        else:
+            value, interval = latitude, lat_range
+        mid = (interval[0] + interval[1]) / 2
+        if value >= mid:
+            bits = bits * 2 + 1
+            interval[0] = mid
+        else:
+            bits = bits * 2
+            interval[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            geohash.append(GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(geohash)
+
+
+def geohash_cell_size(precision):
+    """Zwraca (wysokość, szerokość) komórki geohash w stopniach."""
+    total_bits = precision * 5
+    lat_bits = total_bits // 2
+    lon_bits = total_bits - lat_bits
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def bounding_box(latitude, longitude, radius_km):
+    """
+    Zwraca (min_lat, max_lat, min_lon, max_lon) prostokąta zawierającego okrąg
+    o promieniu radius_km. Gdy prostokąt obejmuje biegun lub przecina południk
+    180°, zakres długości obejmuje całą kulę.
+    """
+    angular_radius = radius_km / EARTH_RADIUS_KM
+    dlat = degrees(angular_radius)
+    min_lat = latitude - dlat
+    max_lat = latitude + dlat
+    if min_lat <= -90 or max_lat >= 90:
+        return max(min_lat, -90.0), min(max_lat, 90.0), -180.0, 180.0
+
+    # Najszerszy punkt okręgu leży bliżej bieguna niż jego środek
+    dlon = degrees(asin(sin(angular_radius) / cos(radians(latitude))))
+    min_lon = longitude - dlon
+    max_lon = longitude + dlon
+    if min_lon < -180 or max_lon > 180:
+        return min_lat, max_lat, -180.0, 180.0
+    return min_lat, max_lat, min_lon, max_lon
+
+
+def covering_geohashes(min_lat, max_lat, min_lon, max_lon):
+    """
+    Zwraca prefiksy geohash pokrywające prostokąt. Wybierana jest najdłuższa
+    precyzja, przy której komórka jest nie mniejsza niż prostokąt, więc
+    wystarczają komórki jego narożników (najwyżej cztery).
+    """
+    precision = 0
+    for candidate in range(GEOHASH_PRECISION, 0, -1):
+        cell_lat, cell_lon = geohash_cell_size(candidate)
+        if cell_lat >= max_lat - min_lat and cell_lon >= max_lon - min_lon:
+            precision = candidate
+            break
+    if precision == 0:
+        return set()
+    corners = [(min_lat, min_lon), (min_lat, max_lon), (max_lat, min_lon), (max_lat, max_lon)]
+    return {encode_geohash(lat, lon, precision) for lat, lon in corners}
+
+
+def nearby_filter(latitude, longitude, radius_km):
+    """Filtr SQL (komórki geohash + prostokąt) dla użytkowników w promieniu radius_km."""
+    min_lat, max_lat, min_lon, max_lon = bounding_box(latitude, longitude, radius_km)
+    condition = Q(latitude__range=(min_lat, max_lat), longitude__range=(min_lon, max_lon))
+    prefixes = covering_geohashes(min_lat, max_lat, min_lon, max_lon)
+    if prefixes:
+        cells = Q()
+        for prefix in prefixes:
+            cells |= Q(geohash__startswith=prefix)
+        condition &= cells
+    return condition
+
+
+def candidates(queryset, latitude, longitude, radius_km):
+    """Zapytanie o (id, latitude, longitude) kandydatów w promieniu radius_km; wykonywane przez nearest_users."""
+    if radius_km < MAX_DISTANCE_KM:
+        # Odległości są zaokrąglane w dół, więc prostokąt ma 1 km zapasu
+        queryset = queryset.filter(nearby_filter(latitude, longitude, radius_km + 1))
+    return queryset.values_list('id', 'latitude', 'longitude')
+
+
+def nearest_users(queryset, latitude, longitude, radius_km=None, limit=None, initial_radius_km=10):
+    """
+    Zwraca listę (odległość, użytkownik) posortowaną rosnąco po odległości.
+
+    Przy podanym radius_km przeszukiwany jest tylko prostokąt wokół punktu.
+    Przy samym limit promień jest podwajany od initial_radius_km, aż znajdzie
+    się limit użytkowników, więc reszta tabeli nie jest odczytywana.
+    """
+    if radius_km is None and limit is None:
+        radius_km = MAX_DISTANCE_KM
+    expanding = radius_km is None
+    radius = initial_radius_km if expanding else radius_km
+
+    while True:
+        bounded = radius < MAX_DISTANCE_KM
+        rows = list(candidates(queryset, latitude, longitude, radius))
+        ids = [row[0] for row in rows]
+        distances = haversine_distances(latitude, longitude, [row[1] for row in rows], [row[2] for row in rows])
+        in_range = [(distance, user_id) for distance, user_id in zip(distances, ids) if distance <= radius]
+
+        if not expanding or not bounded or (limit is not None and len(in_range) >= limit):
+            break
+        radius = min(radius * 2, MAX_DISTANCE_KM)
+
+    if limit is None:
+        nearest = sorted(in_range)
+    else:
+        nearest = heapq.nsmallest(limit, in_range)
+    users = queryset.in_bulk([user_id for _, user_id in nearest])
+    return [(distance, users[user_id]) for distance, user_id in nearest if user_id in users]
@@ -0,0 +1,98 @@
+"""
+Haszowanie haseł w osobnej puli wątków.
+
+PBKDF2 zajmuje setki milisekund procesora. Obliczenia trafiają do puli
+PASSWORD_HASHING_WORKERS wątków (hashlib zwalnia GIL), a liczba zadań
+oczekujących i wykonywanych jest ograniczona do PASSWORD_HASHING_QUEUE_SIZE.
+Gdy kolejka jest pełna dłużej niż PASSWORD_HASHING_QUEUE_TIMEOUT sekund,
+żądanie kończy się odpowiedzią 503 zamiast blokować kolejne wątki serwera.
+
+Widoki są synchroniczne, więc wątek żądania czeka na wynik z puli. Pula nie
+skraca pojedynczego logowania, tylko ogranicza liczbę równoczesnych obliczeń
+PBKDF2 do PASSWORD_HASHING_WORKERS, aby fala logowań nie zajęła wszystkich
+rdzeni i nie zagłodziła pozostałych żądań.
+
+Skróty zapisane ze starszymi parametrami (lub innym algorytmem) są
+przeliczane po poprawnym sprawdzeniu hasła, tak jak w Django.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.utils.translation import gettext_lazy as _
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+_lock = threading.Lock()
+_executor = None
+_slots = None
+
+
+class HashingUnavailable(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = _('Server is busy, try again later.')
+    default_code = 'hashing_unavailable'
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    """PBKDF2-SHA256 z liczbą iteracji z ustawienia PASSWORD_HASH_ITERATIONS."""
+
+    @property
+    def iterations(self):
+        return getattr(settings, 'PASSWORD_HASH_ITERATIONS', hashers.PBKDF2PasswordHasher.iterations)
+
+
+def _pool():
+    global _executor, _slots
+    with _lock:
+        if _executor is None:
+            # Pula tworzona leniwie, aby nie powstawała przed fork() serwera aplikacji
+            workers = getattr(settings, 'PASSWORD_HASHING_WORKERS', min(4, os.cpu_count() or 1))
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hashing')
+            _slots = threading.BoundedSemaphore(getattr(settings, 'PASSWORD_HASHING_QUEUE_SIZE', 64))
+    return _executor, _slots
+
+
+def run(func, *args):
+    """
+    Wykonuje func w puli haszowania i czeka na wynik (limit współbieżności, nie
+    przetwarzanie w tle); HashingUnavailable przy pełnej kolejce.
+    """
+    executor, slots = _pool()
+    if not slots.acquire(timeout=getattr(settings, 'PASSWORD_HASHING_QUEUE_TIMEOUT', 5)):
+        raise HashingUnavailable()
+    try:
+        future = executor.submit(func, *args)
+    except BaseException:
+        slots.release()
+        raise
+    future.add_done_callback(lambda _: slots.release())
+    return future.result()
+
+
+def make_password(password):
+    return run(hashers.make_password, password)
+
+
+def _verify(password, encoded):
+    if not hashers.check_password(password, encoded):
+        return False, False
+    preferred = hashers.get_hasher('default')
+    hasher = hashers.identify_hasher(encoded)
+    return True, hasher.algorithm != preferred.algorithm or preferred.must_update(encoded)
+
+
+def check_password(password, encoded, setter=None):
+    """
+    Jak django.contrib.auth.hashers.check_password, ale w puli haszowania.
+    setter(password) zapisuje nowy skrót, gdy parametry haszowania się zmieniły;
+    jest wywoływany w bieżącym wątku, więc korzysta z jego połączenia z bazą.
+    """
+    if password is None or not hashers.is_password_usable(encoded):
+        return False
+    is_correct, must_update = run(_verify, password, encoded)
+    if is_correct and must_update and setter is not None:
+        setter(password)
+    return is_correct
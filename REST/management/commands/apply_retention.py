@@ -0,0 +1,40 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from REST.retention import get_policies, apply_policy
+
+
+class Command(BaseCommand):
+    help = 'Archiwizuje i usuwa wygasłe komunikaty oraz stare wiadomości zgodnie z RETENTION_POLICIES.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--policy', action='append', help='Nazwa polityki (domyślnie wszystkie)')
+        parser.add_argument('--batch-size', type=int, help='Rozmiar partii (domyślnie RETENTION_BATCH_SIZE)')
+        parser.add_argument('--pause', type=float, default=0.0, help='Przerwa między partiami w sekundach')
+        parser.add_argument('--archive-dir', help='Katalog archiwum (domyślnie RETENTION_ARCHIVE_DIR)')
+        parser.add_argument('--dry-run', action='store_true', help='Tylko liczy wiersze do usunięcia')
+        parser.add_argument('--json', action='store_true', help='Statystyki w formacie JSON')
+
+    def handle(self, *args, **options):
+        policies = get_policies()
+        if options['policy']:
+            unknown = set(options['policy']) - {policy.name for policy in policies}
+            if unknown:
+                raise CommandError(f'Nieznane polityki: {", ".join(sorted(unknown))}')
+            policies = [policy for policy in policies if policy.name in options['policy']]
+
+        results = [apply_policy(policy, batch_size=options['batch_size'], archive_dir=options['archive_dir'],
+                                dry_run=options['dry_run'], pause=options['pause'])
+                   for policy in policies]
+
+        if options['json']:
+            self.stdout.write(json.dumps(results))
+            return
+        for stats in results:
+            if stats['dry_run']:
+                self.stdout.write(f'{stats["policy"]}: {stats["deleted"]} wierszy do usunięcia')
+            else:
+                self.stdout.write(f'{stats["policy"]}: zarchiwizowano {stats["archived"]}, usunięto {stats["deleted"]} '
+                                  f'w {stats["batches"]} partiach ({stats["seconds"]} s)'
+                                  + (f' -> {stats["archive"]}' if stats['archive'] else ''))
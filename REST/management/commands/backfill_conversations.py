@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+
+from REST.models import Message, Conversation
+
+
+class Command(BaseCommand):
+    help = 'Odbudowuje tabelę Conversation na podstawie istniejących wiadomości.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        # Ostatnia wiadomość dla każdej pary (nadawca, odbiorca)
+        last_ids = {}
+        pairs = Message.objects.values('sender_id', 'receiver_id').annotate(last_id=Max('id')).order_by()
+        for row in pairs.iterator():
+            for owner, partner in ((row['sender_id'], row['receiver_id']), (row['receiver_id'], row['sender_id'])):
+                key = (owner, partner)
+                last_ids[key] = max(last_ids.get(key, 0), row['last_id'])
+
+        created_at = {}
+        message_ids = sorted(set(last_ids.values()))
+        for start in range(0, len(message_ids), batch_size):
+            chunk = message_ids[start:start + batch_size]
+            created_at.update(Message.objects.filter(id__in=chunk).values_list('id', 'created_at'))
+
+        with transaction.atomic():
+            # Liczniki nieprzeczytanych nie wynikają z wiadomości, więc są zachowywane
+            unread = {(user_id, partner_id): count for user_id, partner_id, count in
+                      Conversation.objects.values_list('user_id', 'partner_id', 'unread_count')}
+            Conversation.objects.all().delete()
+            Conversation.objects.bulk_create(
+                (Conversation(user_id=owner, partner_id=partner, last_message_id=message_id,
+                              last_message_at=created_at[message_id], unread_count=unread.get((owner, partner), 0))
+                 for (owner, partner), message_id in last_ids.items()),
+                batch_size=batch_size,
+            )
+
+        self.stdout.write(self.style.SUCCESS(f'Odbudowano {len(last_ids)} rozmów'))
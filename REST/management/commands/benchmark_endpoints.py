@@ -0,0 +1,80 @@
+import json
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_databases, teardown_databases, setup_test_environment, \
+    teardown_test_environment, override_settings
+
+from REST import benchmark
+from REST.seeding import seed
+
+
+class Command(BaseCommand):
+    help = ('Mierzy czasy odpowiedzi (p50/p95), liczbę zapytań i przepustowość wszystkich tras API na '
+            'syntetycznych danych. Dane są zapisywane w bazie testowej (test_<NAME>), usuwanej po pomiarze.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument('--messages', type=int, default=20000)
+        parser.add_argument('--alerts', type=int, default=200)
+        parser.add_argument('--blocks', type=int, default=100)
+        parser.add_argument('--seed', type=int, default=0, help='Ziarno generatora danych')
+        parser.add_argument('--requests', type=int, default=50, help='Liczba mierzonych żądań na scenariusz')
+        parser.add_argument('--warmup', type=int, default=5, help='Liczba żądań rozgrzewających na scenariusz')
+        parser.add_argument('--route', action='append', help='Tylko podana trasa, np. messages/ (domyślnie wszystkie)')
+        parser.add_argument('--throttle', action='store_true',
+                            help='Pozostawia ograniczanie żądań (domyślnie wyłączone na czas pomiaru)')
+        parser.add_argument('--json', action='store_true', help='Raport w formacie JSON')
+        parser.add_argument('--output', help='Zapisuje raport JSON do pliku')
+        parser.add_argument('--compare', help='Raport JSON z wcześniejszego pomiaru do porównania')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1:
+            raise CommandError('--requests musi być większe od zera')
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as file:
+                baseline = json.load(file)
+
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            overrides = {} if options['throttle'] else {'THROTTLE_BUCKETS': {}}
+            with tempfile.TemporaryDirectory() as media_root, \
+                    override_settings(PROFILE_PICTURE_ROOT=media_root, **overrides):
+                dataset = seed(users=options['users'], groups=options['groups'], messages=options['messages'],
+                               alerts=options['alerts'], blocks=options['blocks'], random_seed=options['seed'])
+                report = benchmark.run(dataset, requests=options['requests'], warmup=options['warmup'],
+                                       routes=options['route'])
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+        report['dataset']['seed'] = options['seed']
+        if baseline is not None:
+            report['comparison'] = benchmark.compare(report, baseline)
+
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(report, file, indent=2)
+        if options['json']:
+            self.stdout.write(json.dumps(report))
+            return
+
+        self.stdout.write(f'{"scenariusz":<46} {"p50 ms":>9} {"p95 ms":>9} {"zapytań":>8} {"req/s":>8} {"błędy":>6}')
+        for result in report['results']:
+            name = result['method'] + ' ' + result['route']
+            if result['p50_ms'] is None:
+                self.stdout.write(f'{name:<46} {"-":>9} {"-":>9} {"-":>8} {"-":>8} {result["errors"]:>6}')
+                continue
+            self.stdout.write(f'{name:<46} {result["p50_ms"]:>9.2f} '
+                              f'{result["p95_ms"]:>9.2f} {result["queries_per_request"]:>8.1f} '
+                              f'{result["throughput_rps"]:>8.1f} {result["errors"]:>6}')
+        for change in report.get('comparison', []):
+            if change['p50_change'] is not None:
+                self.stdout.write(f'{change["method"]} {change["route"]}: p50 {change["p50_change"]:+.1%}, '
+                                  f'zapytania {change["queries_change"]:+}')
+        if report['missing_routes']:
+            self.stdout.write(self.style.WARNING(f'Trasy bez scenariusza: {", ".join(report["missing_routes"])}'))
+        if any(result['errors'] for result in report['results']):
+            self.stdout.write(self.style.WARNING('Część żądań zwróciła nieoczekiwany status lub wyjątek (kolumna błędy)'))
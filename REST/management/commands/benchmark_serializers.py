@@ -0,0 +1,63 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.test.utils import setup_databases, teardown_databases, setup_test_environment, \
+    teardown_test_environment
+from rest_framework.renderers import JSONRenderer
+
+from REST import queries
+from REST.models import Message
+from REST.seeding import seed
+from REST.serializers import MessageSerializer, UserWithDistanceSerializer, AlertSerializer, \
+    message_list_data, user_with_distance_list_data, alert_list_data
+
+
+class Command(BaseCommand):
+    help = ('Porównuje szybkość (wiersze/s) serializerów DRF i szybkiej serializacji list '
+            'oraz sprawdza, czy JSON jest identyczny. Dane są zapisywane w bazie testowej '
+            '(test_<NAME>), usuwanej po pomiarze.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0, help='Ziarno generatora danych')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            self.run(options['rows'], options['repeat'], options['seed'])
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+    def run(self, rows, repeat, random_seed):
+        # Identyfikatory z REST.seeding, ponownie odczytane z bazy (MySQL nie zwraca ich z bulk_create)
+        dataset = seed(users=rows, groups=5, messages=rows, alerts=rows, blocks=0, random_seed=random_seed)
+        # Najdłuższy wątek jako lista wiadomości
+        sender_id, receiver_id, _ = Message.objects.values_list('sender_id', 'receiver_id') \
+            .annotate(count=Count('id')).order_by('-count').first()
+        cases = [
+            ('messages', queries.thread_messages(sender_id, receiver_id),
+             lambda objs: MessageSerializer(objs, many=True).data, message_list_data),
+            ('list_users_with_distance', list(queries.people().filter(id__in=dataset['users'])),
+             lambda objs: [UserWithDistanceSerializer(user).data for user in objs],
+             user_with_distance_list_data),
+            ('alerts', list(queries.alerts().filter(group__in=dataset['groups'])),
+             lambda objs: AlertSerializer(objs, many=True).data, alert_list_data),
+        ]
+        for name, objects, slow, fast in cases:
+            renderer = JSONRenderer()
+            if renderer.render(slow(objects)) != renderer.render(fast(objects)):
+                raise CommandError(f'{name}: szybka serializacja daje inny JSON niż serializer DRF')
+            before = self.rows_per_second(slow, objects, repeat)
+            after = self.rows_per_second(fast, objects, repeat)
+            self.stdout.write(f'{name:<26} {len(objects):>7} wierszy  '
+                              f'przed: {before:>10.0f}/s  po: {after:>10.0f}/s  x{after / before:.1f}')
+
+    def rows_per_second(self, serialize, objects, repeat):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            serialize(objects)
+        return len(objects) * repeat / max(time.perf_counter() - start, 1e-9)
@@ -0,0 +1,125 @@
+import json
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+
+from REST import queries
+from REST.geo import MAX_DISTANCE_KM, candidates
+from REST.models import MyUser, Membership, BlockedUsers, Conversation, Group
+from REST.retention import get_policies
+
+
+# Fragmenty planu oznaczające pełny odczyt tabeli, dla każdej bazy osobno
+SQLITE_FULL_SCAN_RE = re.compile(r'\bSCAN (?!.*\bUSING\b)(?P<table>\S+)')
+POSTGRESQL_FULL_SCAN_RE = re.compile(r'\bSeq Scan on (?P<table>\S+)')
+# Sortowanie wyniku poza indeksem (tymczasowe drzewo, filesort)
+SQLITE_SORT_RE = re.compile(r'\bUSE TEMP B-TREE FOR (?:RIGHT PART OF )?ORDER BY\b')
+POSTGRESQL_SORT_RE = re.compile(r'^\s*(?:->\s*)?Sort\b', re.MULTILINE)
+
+
+def endpoint_queries(user_id, partner_id, group_id, now):
+    """
+    Główne zapytania widoków i zadań w tle, budowane tymi samymi funkcjami
+    (REST.queries, REST.geo) co w widokach.
+    """
+    latitude, longitude = 52.23, 21.01
+    group = Group(pk=group_id)
+    members = queries.group_member_page(group, (), with_groups=False)
+    position = {'t': now, 'id': user_id}
+    return {
+        'messages: thread': queries.thread_direction(user_id, partner_id),
+        'messages: latest page': queries.thread_direction_keys(user_id, partner_id, Q(), newest_first=True),
+        'messages: before cursor': queries.thread_direction_keys(
+            user_id, partner_id, queries.thread_cursor(now, 0, newer=False), newest_first=True),
+        'messages: after cursor': queries.thread_direction_keys(
+            user_id, partner_id, queries.thread_cursor(now, 0, newer=True), newest_first=False),
+        'messages: page': queries.thread_queryset(user_id, partner_id).filter(pk__in=[1, 2]),
+        'messages: mark read': Conversation.objects.filter(user_id=user_id, partner_id=partner_id),
+        'users: recent conversations': queries.conversations(user_id),
+        # Bez parametrów list_users_with_distance odczytuje wszystkich użytkowników (indeks lokalizacji)
+        'users: nearby (default)': candidates(queries.other_people(user_id, [partner_id]),
+                                              latitude, longitude, MAX_DISTANCE_KM),
+        'users: nearby (radius)': candidates(queries.other_people(user_id, [partner_id]), latitude, longitude, 50),
+        'groups: members': queries.group_members(group),
+        'groups: member page (id)': queries.group_member_keys(group_id, 'id'),
+        'groups: member page (id, cursor)': queries.group_member_keys(group_id, 'id', {'id': user_id}),
+        'groups: member page (online)': queries.group_member_keys(group_id, 'online'),
+        'groups: member page (online, cursor)': queries.group_member_keys(group_id, 'online', position),
+        'groups: member page (distance)': candidates(members, latitude, longitude, 10),
+        'groups: member page users': members.filter(pk__in=[user_id, partner_id]),
+        'groups: user groups': Membership.objects.filter(myuser_id=user_id).values_list('group_id', flat=True),
+        'groups: detail': Group.objects.filter(pk=group_id),
+        'alerts: active in group': queries.alerts().filter(group_id=group_id, end_date__gte=now),
+        'alerts: by author': queries.alerts().filter(user=user_id).order_by('end_date'),
+        'blocks: both directions': BlockedUsers.objects.filter(Q(user_id=user_id) | Q(blocked_user_id=user_id))
+            .values_list('user_id', 'blocked_user_id'),
+        'blocks: list': queries.blocked_users(user_id),
+        **{f'retention: {policy.name}': policy.batch(now, last=(now - policy.after, 0)) for policy in get_policies()},
+    }
+
+
+def _mysql_problems(plan):
+    """Tabele z access_type ALL oraz tabele sortowane przez filesort w planie MySQL w formacie JSON."""
+    full_scans, sorts = [], []
+    stack = [json.loads(plan)]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            if node.get('access_type') == 'ALL':
+                full_scans.append(node.get('table_name', '?'))
+            if node.get('using_filesort'):
+                table = node.get('table')
+                sorts.append(table.get('table_name', '?') if isinstance(table, dict) else 'filesort')
+            stack.extend(node.values())
+        elif isinstance(node, list):
+            stack.extend(node)
+    return full_scans, sorts
+
+
+def explain(queryset):
+    """Zwraca (plan, tabele odczytywane w całości, sortowania poza indeksem)."""
+    if connection.vendor == 'mysql':
+        plan = queryset.explain(format='JSON')
+        return (plan, *_mysql_problems(plan))
+    plan = queryset.explain()
+    if connection.vendor == 'postgresql':
+        full_scan_re, sort_re = POSTGRESQL_FULL_SCAN_RE, POSTGRESQL_SORT_RE
+    else:
+        full_scan_re, sort_re = SQLITE_FULL_SCAN_RE, SQLITE_SORT_RE
+    sorts = [match.group(0).strip() for match in sort_re.finditer(plan)]
+    return plan, [match.group('table') for match in full_scan_re.finditer(plan)], sorts
+
+
+class Command(BaseCommand):
+    help = ('Sprawdza plany zapytań (EXPLAIN) dla zapytań widoków i kończy się błędem, '
+            'jeżeli któreś z nich odczytuje całą tabelę lub sortuje wynik poza indeksem.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose-plans', action='store_true', help='Wypisuje pełne plany zapytań')
+
+    def handle(self, *args, **options):
+        # Wartości z bazy, aby plany odpowiadały rzeczywistym danym; bez danych - dowolne identyfikatory
+        user_id = MyUser.objects.values_list('id', flat=True).first() or 1
+        partner_id = MyUser.objects.exclude(id=user_id).values_list('id', flat=True).first() or 2
+        group_id = Group.objects.values_list('id', flat=True).first() or 1
+
+        failures = []
+        for name, queryset in endpoint_queries(user_id, partner_id, group_id, timezone.now()).items():
+            plan, full_scans, sorts = explain(queryset)
+            if full_scans:
+                self.stdout.write(self.style.ERROR(f'{name}: pełny odczyt tabeli {", ".join(full_scans)}'))
+            if sorts:
+                self.stdout.write(self.style.ERROR(f'{name}: sortowanie poza indeksem ({", ".join(sorts)})'))
+            if full_scans or sorts:
+                failures.append(name)
+            else:
+                self.stdout.write(f'{name}: OK')
+            if options['verbose_plans'] or full_scans or sorts:
+                self.stdout.write(plan)
+
+        if failures:
+            raise CommandError(f'Zapytania bez indeksu lub z sortowaniem: {len(failures)}')
+        self.stdout.write(self.style.SUCCESS('Wszystkie zapytania korzystają z indeksów'))
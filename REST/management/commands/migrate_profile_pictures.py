@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from REST.media import InvalidImage, store_profile_picture
+from REST.models import MyUser
+
+
+class Command(BaseCommand):
+    help = 'Przenosi zdjęcia profilowe zapisane jako data URI do magazynu plików.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        moved = cleared = 0
+        last_id = 0
+        while True:
+            # Partiami po kluczu głównym, aby nie trzymać wszystkich obrazów w pamięci
+            batch = list(MyUser.objects.filter(id__gt=last_id, profile_picture__startswith='data:')
+                         .order_by('id').values_list('id', 'profile_picture')[:batch_size])
+            if not batch:
+                break
+            for user_id, picture in batch:
+                try:
+                    url = store_profile_picture(picture)
+                except InvalidImage:
+                    # Nieczytelny obraz jest usuwany, inaczej każdy pełny zapis użytkownika by się nie powiódł
+                    url = ''
+                if url == picture:
+                    continue
+                MyUser.objects.filter(id=user_id).update(profile_picture=url)
+                if url:
+                    moved += 1
+                else:
+                    cleared += 1
+            last_id = batch[-1][0]
+
+        self.stdout.write(self.style.SUCCESS(f'Przeniesiono {moved} zdjęć, usunięto {cleared} nieprawidłowych'))
@@ -0,0 +1,31 @@
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = ('Usuwa partiami sesje Django pozostałe po logowaniu z sesją (przed JWT_ONLY_LOGIN). '
+            'Domyślnie wszystkie, z --expired-only tylko wygasłe.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--expired-only', action='store_true', help='Usuwa tylko wygasłe sesje')
+        parser.add_argument('--dry-run', action='store_true', help='Tylko liczy sesje do usunięcia')
+
+    def handle(self, *args, **options):
+        sessions = Session.objects.all()
+        if options['expired_only']:
+            sessions = sessions.filter(expire_date__lt=timezone.now())
+
+        if options['dry_run']:
+            self.stdout.write(f'Sesji do usunięcia: {sessions.count()}')
+            return
+
+        deleted = 0
+        while True:
+            # Krótkie transakcje zamiast jednego usunięcia całej tabeli
+            keys = list(sessions.values_list('session_key', flat=True)[:options['batch_size']])
+            if not keys:
+                break
+            deleted += Session.objects.filter(session_key__in=keys).delete()[0]
+        self.stdout.write(self.style.SUCCESS(f'Usunięto {deleted} sesji'))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from REST.models import Group
+
+
+class Command(BaseCommand):
+    help = 'Porównuje Group.member_count z faktyczną liczbą członków i poprawia rozbieżności.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--dry-run', action='store_true', help='Tylko raportuje rozbieżności')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        checked = fixed = 0
+        last_id = 0
+        while True:
+            batch = list(Group.objects.filter(id__gt=last_id).order_by('id')
+                         .annotate(actual=Count('users')).values_list('id', 'member_count', 'actual')[:batch_size])
+            if not batch:
+                break
+            for group_id, member_count, actual in batch:
+                checked += 1
+                if member_count != actual:
+                    fixed += 1
+                    self.stdout.write(f'Grupa {group_id}: member_count={member_count}, członków={actual}')
+                    if not options['dry_run']:
+                        Group.objects.filter(id=group_id).update(member_count=actual)
+            last_id = batch[-1][0]
+
+        verb = 'Znaleziono' if options['dry_run'] else 'Poprawiono'
+        self.stdout.write(self.style.SUCCESS(f'Sprawdzono {checked} grup. {verb} {fixed} rozbieżności'))
@@ -0,0 +1,56 @@
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from REST.models import MyUser
+from REST.seeding import seed, DEFAULT_PASSWORD
+
+
+class Command(BaseCommand):
+    help = ('Generuje syntetyczne dane (użytkownicy, grupy, wiadomości, komunikaty, blokady) przez bulk_create '
+            'partiami. Ten sam --seed i --now dają te same dane.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=50)
+        parser.add_argument('--messages', type=int, default=10000)
+        parser.add_argument('--alerts', type=int, default=500)
+        parser.add_argument('--blocks', type=int, default=200)
+        parser.add_argument('--memberships', type=int, default=2, help='Średnia liczba grup na użytkownika')
+        parser.add_argument('--seed', type=int, default=0, help='Ziarno generatora')
+        parser.add_argument('--prefix', help='Przedrostek nazw użytkowników i grup (domyślnie s<seed>)')
+        parser.add_argument('--password', default=DEFAULT_PASSWORD, help='Hasło wszystkich użytkowników i grup')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--days', type=int, default=365, help='Okres, z którego pochodzą wiadomości')
+        parser.add_argument('--now', help='Chwila odniesienia (ISO 8601) zamiast bieżącej, dla powtarzalności')
+
+    def handle(self, *args, **options):
+        prefix = options['prefix'] or f's{options["seed"]}'
+        if MyUser.objects.filter(email__startswith=f'{prefix}.', email__endswith='@example.com').exists():
+            raise CommandError(f'Dane z przedrostkiem {prefix} już istnieją; użyj innego --seed lub --prefix')
+        now = None
+        if options['now']:
+            try:
+                now = datetime.fromisoformat(options['now'])
+            except ValueError:
+                raise CommandError(f'Niepoprawna wartość --now: {options["now"]!r} (oczekiwano ISO 8601)')
+            if timezone.is_naive(now):
+                now = timezone.make_aware(now)
+
+        def progress(name, count, seconds):
+            if count is None:
+                self.stdout.write(f'{name}: {seconds:.1f} s')
+            else:
+                self.stdout.write(f'{name}: {count} wierszy w {seconds:.1f} s ({count / max(seconds, 1e-6):.0f}/s)')
+
+        started = time.monotonic()
+        dataset = seed(users=options['users'], groups=options['groups'], messages=options['messages'],
+                       alerts=options['alerts'], blocks=options['blocks'],
+                       memberships_per_user=options['memberships'], random_seed=options['seed'],
+                       password=options['password'], batch_size=options['batch_size'], prefix=prefix, now=now,
+                       days=options['days'], progress=progress)
+        self.stdout.write(self.style.SUCCESS(
+            f'Utworzono {len(dataset["users"])} użytkowników i {len(dataset["groups"])} grup '
+            f'w {time.monotonic() - started:.1f} s'))
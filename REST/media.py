@@ -0,0 +1,125 @@
+"""
+Magazyn zdjęć profilowych adresowany treścią (SHA-256).
+
+Obrazy przesłane jako data URI są zapisywane w PROFILE_PICTURE_ROOT, a w
+MyUser.profile_picture zostaje tylko krótki URL. Dla każdego obrazu tworzona
+jest miniatura do widoków list (Pillow); dane, których Pillow nie potrafi
+odczytać, są odrzucane (InvalidImage), zamiast zapisywać je bez miniatury.
+"""
+import base64
+import binascii
+import hashlib
+import os
+import re
+import tempfile
+from io import BytesIO
+from pathlib import Path
+
+from django.conf import settings
+
+from PIL import Image
+
+CONTENT_TYPES = {
+    'image/png': 'png',
+    'image/jpeg': 'jpg',
+    'image/gif': 'gif',
+    'image/webp': 'webp',
+}
+PIL_FORMATS = {'png': 'PNG', 'jpg': 'JPEG', 'gif': 'GIF', 'webp': 'WEBP'}
+
+DATA_URI_RE = re.compile(r'^data:(?P<content_type>[\w/+.-]+);base64,(?P<data>.*)$', re.DOTALL)
+FILE_NAME_RE = re.compile(r'^(?P<digest>[0-9a-f]{64})(?P<thumb>_thumb)?\.(?P<ext>png|jpg|gif|webp)$')
+
+
+class InvalidImage(ValueError):
+    """Dane obrazu, z których nie da się utworzyć miniatury."""
+
+
+def get_root():
+    return Path(getattr(settings, 'PROFILE_PICTURE_ROOT', Path(settings.BASE_DIR) / 'media'))
+
+
+def get_url_prefix():
+    return getattr(settings, 'PROFILE_PICTURE_URL', '/api/media/')
+
+
+def parse_data_uri(value):
+    """Zwraca (bajty, rozszerzenie) dla obrazu w postaci data URI albo None."""
+    match = DATA_URI_RE.match(value or '')
+    if match is None or match.group('content_type') not in CONTENT_TYPES:
+        return None
+    try:
+        data = base64.b64decode(match.group('data'), validate=True)
+    except (binascii.Error, ValueError):
+        return None
+    return data, CONTENT_TYPES[match.group('content_type')]
+
+
+def file_path(file_name):
+    """Ścieżka pliku w magazynie; pliki są rozkładane po katalogach wg dwóch pierwszych znaków skrótu."""
+    return get_root() / file_name[:2] / file_name
+
+
+def _write(path, data):
+    if path.exists():
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Zapis atomowy: inny proces nigdy nie zobaczy niepełnego pliku
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent)
+    with os.fdopen(fd, 'wb') as tmp:
+        tmp.write(data)
+    os.replace(tmp_path, path)
+
+
+def make_thumbnail(data, ext):
+    """Zwraca miniaturę obrazu (mały obraz bez zmian); InvalidImage dla nieczytelnych danych."""
+    size = getattr(settings, 'PROFILE_THUMBNAIL_SIZE', 128)
+    try:
+        with Image.open(BytesIO(data)) as image:
+            # Pełne dekodowanie, aby uszkodzony obraz został wykryty także wtedy, gdy jest mały
+            image.load()
+            if image.width <= size and image.height <= size:
+                return data
+            image.thumbnail((size, size))
+            if ext == 'jpg' and image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+            output = BytesIO()
+            image.save(output, PIL_FORMATS[ext])
+            return output.getvalue()
+    except (OSError, ValueError, Image.DecompressionBombError) as error:
+        raise InvalidImage(str(error)) from error
+
+
+def store(data, ext):
+    """Zapisuje obraz i jego miniaturę; zwraca URL obrazu. InvalidImage, jeżeli obraz jest nieczytelny."""
+    digest = hashlib.sha256(data).hexdigest()
+    file_name = f'{digest}.{ext}'
+    thumb_path = file_path(f'{digest}_thumb.{ext}')
+    # Miniatura przed zapisem oryginału, aby nieczytelny obraz nie trafił do magazynu
+    thumbnail = None if thumb_path.exists() else make_thumbnail(data, ext)
+    _write(file_path(file_name), data)
+    if thumbnail is not None:
+        _write(thumb_path, thumbnail)
+    return get_url_prefix() + file_name
+
+
+def store_profile_picture(value):
+    """
+    Zamienia obraz w postaci data URI na URL w magazynie; inne wartości zwraca
+    bez zmian. InvalidImage dla data URI z nieczytelnym obrazem.
+    """
+    parsed = parse_data_uri(value)
+    if parsed is None:
+        return value
+    return store(*parsed)
+
+
+def thumbnail_url(profile_picture):
+    """URL miniatury dla obrazu z magazynu; dla innych wartości - sama wartość."""
+    prefix = get_url_prefix()
+    if not profile_picture.startswith(prefix):
+        return profile_picture
+    match = FILE_NAME_RE.match(profile_picture[len(prefix):])
+    if match is None or match.group('thumb'):
+        return profile_picture
+    return f'{prefix}{match.group("digest")}_thumb.{match.group("ext")}'
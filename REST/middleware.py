@@ -1,14 +1,121 @@
-from django.utils import timezone
-from .models import MyUser
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth import middleware as auth_middleware
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.messages import middleware as messages_middleware
+from django.contrib.sessions import middleware as sessions_middleware
+from django.core.exceptions import MiddlewareNotUsed
+from django.middleware import csrf
+
+from REST import profiling
+from REST.presence import tracker
+
+
+def is_sessionless(request):
+    """
+    Żądania API uwierzytelniane wyłącznie tokenem JWT (JWT_ONLY_LOGIN) nie
+    potrzebują sesji, CSRF ani komunikatów Django dla ścieżek SESSIONLESS_PATHS.
+    """
+    if not getattr(settings, 'JWT_ONLY_LOGIN', False):
+        return False
+    return request.path_info.startswith(tuple(getattr(settings, 'SESSIONLESS_PATHS', ())))
+
+
+class SessionlessPathsMixin:
+    """Pomija middleware dla ścieżek bez sesji (patrz is_sessionless)."""
+
+    def __call__(self, request):
+        if is_sessionless(request):
+            return self.get_response(request)
+        return super().__call__(request)
+
+
+class SessionMiddleware(SessionlessPathsMixin, sessions_middleware.SessionMiddleware):
+    pass
+
+
+class CsrfViewMiddleware(SessionlessPathsMixin, csrf.CsrfViewMiddleware):
+    pass
+
+
+class MessageMiddleware(SessionlessPathsMixin, messages_middleware.MessageMiddleware):
+    pass
+
+
+class AuthenticationMiddleware(auth_middleware.AuthenticationMiddleware):
+    # Bez sesji użytkownik jest anonimowy, dopóki DRF nie uwierzytelni go tokenem
+    def process_request(self, request):
+        if is_sessionless(request):
+            request.user = AnonymousUser()
+            return
+        super().process_request(request)
 
 
 class LastActivityMiddleware:
+    # Obsługuje też tryb asynchroniczny, aby widoki async (np. long-poll)
+    # nie zajmowały wątku podczas oczekiwania
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
         response = self.get_response(request)
-        if request.user.is_authenticated:
-            # Aktualizacja czasu ostatniej aktywności
-            MyUser.objects.filter(id=request.user.id).update(last_activity=timezone.now())
+        self.record_activity(request)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        await sync_to_async(self.record_activity)(request)
+        return response
+
+    def record_activity(self, request):
+        user = getattr(request, 'user', None)
+        # Po usunięciu konta (DeleteCurrentUserView) użytkownik nie ma już klucza głównego
+        if user is not None and user.is_authenticated and user.pk is not None:
+            # Aktualizacja czasu ostatniej aktywności (zapis zbiorczy, patrz REST.presence)
+            tracker.heartbeat(user.id)
+
+
+class ProfilingMiddleware:
+    """
+    Czasy, zapytania SQL i rozmiary odpowiedzi dla tras (REST.profiling).
+    Włączane ustawieniem PROFILING_ENABLED; powinno być pierwsze w MIDDLEWARE,
+    aby czas żądania obejmował pozostałe middleware.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILING_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        profiling.enable()
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats, token = profiling.start()
+        profiler = profiling.start_profiler()
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            if profiler is not None:
+                profiler.disable()
+            raise
+        profiling.finish(request, response, stats, token, profiler)
+        return response
+
+    async def __acall__(self, request):
+        # cProfile działa w obrębie jednego wątku, więc żądania async nie są próbkowane
+        stats, token = profiling.start()
+        response = await self.get_response(request)
+        profiling.finish(request, response, stats, token)
         return response
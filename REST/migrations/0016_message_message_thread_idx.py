@@ -0,0 +1,17 @@
+# Generated by Django 4.2.5 on 2026-10-18 12:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('REST', '0015_delete_friend'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['sender', 'receiver', 'created_at', 'id'], name='message_thread_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.5 on 2026-10-18 12:40
+
+from django.db import migrations, models
+
+from REST.geo import encode_geohash
+
+
+def fill_geohash(apps, schema_editor):
+    MyUser = apps.get_model('REST', 'MyUser')
+    users = list(MyUser.objects.only('id', 'latitude', 'longitude'))
+    for user in users:
+        user.geohash = encode_geohash(user.latitude, user.longitude)
+    MyUser.objects.bulk_update(users, ['geohash'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('REST', '0016_message_message_thread_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='myuser',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, max_length=12),
+        ),
+        migrations.AddIndex(
+            model_name='myuser',
+            index=models.Index(fields=['latitude', 'longitude'], name='myuser_location_idx'),
+        ),
+        migrations.RunPython(fill_geohash, migrations.RunPython.noop),
+    ]
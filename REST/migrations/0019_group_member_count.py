@@ -0,0 +1,27 @@
+# Generated by Django 4.2.5 on 2026-10-18 14:20
+
+from django.db import migrations, models
+
+
+def fill_member_count(apps, schema_editor):
+    Group = apps.get_model('REST', 'Group')
+    groups = list(Group.objects.annotate(actual=models.Count('users')))
+    for group in groups:
+        group.member_count = group.actual
+    Group.objects.bulk_update(groups, ['member_count'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('REST', '0018_conversation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='group',
+            name='member_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_member_count, migrations.RunPython.noop),
+    ]
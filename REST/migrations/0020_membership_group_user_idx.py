@@ -0,0 +1,25 @@
+# Generated by Django 4.2.5 on 2026-10-18 14:50
+
+from django.db import migrations, models
+
+INDEX = models.Index(fields=['group', 'myuser'], name='myuser_groups_group_user_idx')
+
+
+def add_index(apps, schema_editor):
+    # Tabela pośrednia MyUser.groups jest tworzona automatycznie i nie ma własnego Meta
+    schema_editor.add_index(apps.get_model('REST', 'MyUser').groups.through, INDEX)
+
+
+def remove_index(apps, schema_editor):
+    schema_editor.remove_index(apps.get_model('REST', 'MyUser').groups.through, INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('REST', '0019_group_member_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_index, remove_index),
+    ]
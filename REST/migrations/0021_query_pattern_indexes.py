@@ -0,0 +1,33 @@
+# Generated by Django 4.2.5 on 2026-10-18 15:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('REST', '0020_membership_group_user_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['created_at'], name='message_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='alert',
+            index=models.Index(fields=['group', 'end_date', 'start_date'], name='alert_group_window_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='alert',
+            index=models.Index(fields=['user', 'end_date'], name='alert_user_end_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='alert',
+            index=models.Index(fields=['end_date'], name='alert_end_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='blockedusers',
+            index=models.Index(fields=['blocked_user', 'user'], name='blocked_reverse_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.5 on 2026-10-18 17:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('REST', '0021_query_pattern_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='myuser',
+            name='is_staff',
+            field=models.BooleanField(default=False),
+        ),
+    ]
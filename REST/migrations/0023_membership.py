@@ -0,0 +1,58 @@
+# Generated by Django 4.2.5 on 2026-10-18 18:40
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def copy_last_activity(apps, schema_editor):
+    Membership = apps.get_model('REST', 'Membership')
+    MyUser = apps.get_model('REST', 'MyUser')
+    Membership.objects.update(
+        last_activity=Subquery(MyUser.objects.filter(id=OuterRef('myuser_id')).values('last_activity')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('REST', '0022_myuser_is_staff'),
+    ]
+
+    operations = [
+        # Istniejąca tabela pośrednia MyUser.groups staje się jawnym modelem; w bazie
+        # nic się nie zmienia, a indeks (group, myuser) z 0020 trafia do stanu modeli
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='Membership',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('myuser', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                        ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='REST.group')),
+                    ],
+                    options={
+                        'db_table': 'REST_myuser_groups',
+                        'unique_together': {('myuser', 'group')},
+                        'indexes': [models.Index(fields=['group', 'myuser'], name='myuser_groups_group_user_idx')],
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='myuser',
+                    name='groups',
+                    field=models.ManyToManyField(related_name='users', through='REST.Membership', to='REST.group'),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name='membership',
+            name='last_activity',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(copy_last_activity, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='membership',
+            index=models.Index(fields=['group', 'last_activity', 'myuser'], name='membership_activity_idx'),
+        ),
+    ]
@@ -1,10 +1,14 @@
 from datetime import date
 
-from django.contrib.auth.hashers import make_password, check_password
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django.contrib.auth.base_user import BaseUserManager, AbstractBaseUser
-from django.db import models
+from django.db import models, transaction, IntegrityError
+from django.db.models import F
+
+from REST import hashing
+from REST.geo import encode_geohash
+from REST.media import store_profile_picture
 
 
 class Group(models.Model):
@@ -12,16 +16,38 @@ class Group(models.Model):
     logo_url = models.CharField(max_length=255)
     group_site_url = models.URLField(default='')
     password = models.CharField(max_length=255)
+    # Liczba członków utrzymywana przez sygnały m2m_changed (REST.signals)
+    member_count = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return self.name
 
+    # Skrót hasła odczytany z bazy; inna wartość pola password oznacza nowe, jawne hasło
+    _stored_password = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._stored_password = instance.__dict__.get('password')
+        return instance
+
     def save(self, *args, **kwargs):
-        self.password = make_password(self.password)
+        # Haszowanie tylko przy zmianie hasła, a nie przy każdym zapisie grupy
+        if 'password' not in self.get_deferred_fields() and self.password != self._stored_password:
+            self.set_password(self.password)
         super().save(*args, **kwargs)
 
+    def set_password(self, raw_password):
+        self.password = hashing.make_password(raw_password)
+        self._stored_password = self.password
+
     def check_password(self, raw_password):
-        return check_password(raw_password, self.password)
+        def setter(raw_password):
+            # Skrót z nieaktualnymi parametrami jest przeliczany po poprawnym haśle
+            self.set_password(raw_password)
+            Group.objects.filter(pk=self.pk).update(password=self.password)
+
+        return hashing.check_password(raw_password, self.password, setter)
 
 
 class MyUserManager(BaseUserManager):
@@ -59,16 +85,49 @@ class MyUser(AbstractBaseUser):
     gender = models.CharField(max_length=1, choices=sexType.choices, default='M')
     latitude = models.FloatField(default=55)
     longitude = models.FloatField(default=55)
+    geohash = models.CharField(max_length=12, blank=True, db_index=True)
     description = models.TextField(blank=True)
-    groups = models.ManyToManyField(Group, related_name='users')
+    groups = models.ManyToManyField(Group, related_name='users', through='Membership')
+    # Dostęp do punktów diagnostycznych API (np. statystyki ograniczania żądań)
+    is_staff = models.BooleanField(default=False)
     objects = MyUserManager()
     last_activity = models.DateTimeField(auto_now_add=True)
 
     USERNAME_FIELD = 'email'
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['latitude', 'longitude'], name='myuser_location_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # Komórka geohash musi zawsze odpowiadać aktualnej lokalizacji
+        self.geohash = encode_geohash(self.latitude, self.longitude)
+        update_fields = kwargs.get('update_fields')
+        # Obraz przesłany jako data URI trafia do magazynu, w wierszu zostaje URL; zapis
+        # wybranych pól bez profile_picture (np. hasła) nie przetwarza obrazu
+        if update_fields is None or 'profile_picture' in update_fields:
+            self.profile_picture = store_profile_picture(self.profile_picture)
+        if update_fields is not None and ({'latitude', 'longitude'} & set(update_fields)):
+            kwargs['update_fields'] = set(update_fields) | {'geohash'}
+        super().save(*args, **kwargs)
+
+    def set_password(self, raw_password):
+        self.password = hashing.make_password(raw_password)
+        self._password = raw_password
+
+    def check_password(self, raw_password):
+        def setter(raw_password):
+            self.set_password(raw_password)
+            self._password = None
+            self.save(update_fields=['password'])
+
+        return hashing.check_password(raw_password, self.password, setter)
+
     def update_last_activity(self):
         self.last_activity = timezone.now()
-        self.save()
+        self.save(update_fields=['last_activity'])
+        Membership.objects.filter(myuser=self).update(last_activity=self.last_activity)
 
     def age(self):
         today = date.today()
@@ -79,16 +138,94 @@ class MyUser(AbstractBaseUser):
         return self.email
 
 
+class Membership(models.Model):
+    """
+    Członkostwo w grupie (tabela pośrednia MyUser.groups). last_activity to kopia
+    MyUser.last_activity, aby członków grupy można było stronicować w kolejności
+    aktywności po indeksie, bez sortowania całej grupy. Kopia jest uzupełniana
+    przy dodaniu członka (REST.signals) i przy zapisie obecności (REST.presence).
+    """
+    myuser = models.ForeignKey(MyUser, on_delete=models.CASCADE)
+    group = models.ForeignKey(Group, on_delete=models.CASCADE)
+    last_activity = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'REST_myuser_groups'
+        unique_together = ('myuser', 'group')
+        indexes = [
+            models.Index(fields=['group', 'myuser'], name='myuser_groups_group_user_idx'),
+            models.Index(fields=['group', 'last_activity', 'myuser'], name='membership_activity_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.myuser_id} in {self.group_id}'
+
+
 class Message(models.Model):
     sender = models.ForeignKey(MyUser, on_delete=models.CASCADE, related_name='sent_messages')
     receiver = models.ForeignKey(MyUser, on_delete=models.CASCADE, related_name='received_messages')
     text = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['sender', 'receiver', 'created_at', 'id'], name='message_thread_idx'),
+            models.Index(fields=['created_at'], name='message_created_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        is_new = self._state.adding
+        super().save(*args, **kwargs)
+        if is_new:
+            Conversation.objects.record_message(self)
+
     def __str__(self):
         return f'{self.sender.username} -> {self.receiver.username}'
 
 
+class ConversationManager(models.Manager):
+    def record_message(self, message):
+        """Aktualizuje rozmowy nadawcy i odbiorcy po zapisaniu nowej wiadomości."""
+        self._touch(message.sender_id, message.receiver_id, message, unread=False)
+        self._touch(message.receiver_id, message.sender_id, message, unread=True)
+
+    def mark_read(self, user_id, partner_id):
+        self.filter(user_id=user_id, partner_id=partner_id, unread_count__gt=0).update(unread_count=0)
+
+    def _touch(self, user_id, partner_id, message, unread):
+        values = {'last_message': message, 'last_message_at': message.created_at}
+        if unread:
+            values['unread_count'] = F('unread_count') + 1
+        if self.filter(user_id=user_id, partner_id=partner_id).update(**values):
+            return
+        try:
+            with transaction.atomic():
+                self.create(user_id=user_id, partner_id=partner_id, last_message=message,
+                            last_message_at=message.created_at, unread_count=1 if unread else 0)
+        except IntegrityError:
+            # Rozmowa została utworzona równolegle przez inne żądanie
+            self.filter(user_id=user_id, partner_id=partner_id).update(**values)
+
+
+class Conversation(models.Model):
+    """Zdenormalizowana skrzynka: jeden wiersz na (właściciel, rozmówca)."""
+    user = models.ForeignKey(MyUser, on_delete=models.CASCADE, related_name='conversations')
+    partner = models.ForeignKey(MyUser, on_delete=models.CASCADE, related_name='+')
+    last_message = models.ForeignKey(Message, on_delete=models.SET_NULL, null=True, related_name='+')
+    last_message_at = models.DateTimeField()
+    unread_count = models.PositiveIntegerField(default=0)
+    objects = ConversationManager()
+
+    class Meta:
+        unique_together = ('user', 'partner')
+        indexes = [
+            models.Index(fields=['user', '-last_message_at'], name='conversation_inbox_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id} <-> {self.partner_id}'
+
+
 class Alert(models.Model):
     user = models.ForeignKey(MyUser, on_delete=models.CASCADE, related_name='alert_by_me')
     title = models.CharField(max_length=100)
@@ -98,6 +235,13 @@ class Alert(models.Model):
     group = models.ForeignKey(Group, on_delete=models.CASCADE)
     style = models.CharField(max_length=50)  # np. primary, secondary itp.
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['group', 'end_date', 'start_date'], name='alert_group_window_idx'),
+            models.Index(fields=['user', 'end_date'], name='alert_user_end_idx'),
+            models.Index(fields=['end_date'], name='alert_end_idx'),
+        ]
+
     def __str__(self):
         return self.title
 
@@ -108,3 +252,6 @@ class BlockedUsers(models.Model):
 
     class Meta:
         unique_together = ('user', 'blocked_user')
+        indexes = [
+            models.Index(fields=['blocked_user', 'user'], name='blocked_reverse_idx'),
+        ]
@@ -0,0 +1,120 @@
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Case, DateTimeField, Value, When
+from django.utils import timezone
+
+from REST.models import MyUser, Membership
+
+
+class PresenceTracker:
+    """
+    Śledzenie aktywności użytkowników z opóźnionym zapisem (write-behind).
+
+    Heartbeaty trafiają do pamięci procesu i są zapisywane do
+    MyUser.last_activity zbiorczo, nie częściej niż co PRESENCE_FLUSH_INTERVAL,
+    i tylko gdy zapisana wartość jest starsza niż PRESENCE_WRITE_THRESHOLD.
+    Ta sama wartość trafia do Membership.last_activity (kolejność członków grup).
+    Przy zamknięciu procesu tracone są co najwyżej heartbeaty z jednego okresu.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._seen = {}
+        self._persisted = {}
+        self._last_flush = timezone.now()
+
+    @property
+    def flush_interval(self):
+        return getattr(settings, 'PRESENCE_FLUSH_INTERVAL', timedelta(seconds=15))
+
+    @property
+    def write_threshold(self):
+        return getattr(settings, 'PRESENCE_WRITE_THRESHOLD', timedelta(seconds=30))
+
+    @property
+    def online_window(self):
+        return getattr(settings, 'PRESENCE_ONLINE_WINDOW', timedelta(minutes=1))
+
+    def heartbeat(self, user_id, now=None):
+        if user_id is None:
+            return
+        now = now or timezone.now()
+        with self._lock:
+            self._pending[user_id] = now
+            self._seen[user_id] = now
+            due = now - self._last_flush >= self.flush_interval
+        if due:
+            self.flush(now)
+
+    def flush(self, now=None):
+        """Zapisuje zaległe heartbeaty jednym UPDATE na partię; zwraca liczbę zapisanych użytkowników."""
+        now = now or timezone.now()
+        threshold = self.write_threshold
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = now
+            to_write = {user_id: seen for user_id, seen in pending.items()
+                        if user_id not in self._persisted or seen - self._persisted[user_id] >= threshold}
+            self._persisted.update(to_write)
+            self._prune(now - threshold - self.online_window)
+
+        if to_write:
+            MyUser.objects.bulk_update(
+                [MyUser(id=user_id, last_activity=seen) for user_id, seen in to_write.items()],
+                ['last_activity'], batch_size=500,
+            )
+            items = list(to_write.items())
+            for start in range(0, len(items), 500):
+                batch = items[start:start + 500]
+                Membership.objects.filter(myuser_id__in=[user_id for user_id, _ in batch]).update(
+                    last_activity=Case(*[When(myuser_id=user_id, then=Value(seen)) for user_id, seen in batch],
+                                       output_field=DateTimeField()))
+        return len(to_write)
+
+    def _prune(self, cutoff):
+        # Po tym czasie wartość w bazie wystarcza do ustalenia statusu
+        for user_id in [user_id for user_id, seen in self._seen.items() if seen < cutoff]:
+            del self._seen[user_id]
+            self._persisted.pop(user_id, None)
+
+    def last_seen(self, user_id):
+        return self._seen.get(user_id)
+
+    def _is_recent(self, user_id, last_activity, now, window):
+        seen = self._seen.get(user_id)
+        if seen is not None and now - seen <= window:
+            return True
+        return last_activity is not None and now - last_activity <= window
+
+    def online_status(self, users, now=None):
+        """
+        Zwraca {user_id: bool} dla już pobranych obiektów MyUser, bez zapytań
+        do bazy; aktualny czas i okno są ustalane raz dla całej partii.
+        """
+        now = now or timezone.now()
+        window = self.online_window
+        return {user.id: self._is_recent(user.id, user.last_activity, now, window) for user in users}
+
+    def is_online(self, user_ids, now=None):
+        """Zwraca {user_id: bool}; użytkownicy spoza pamięci są sprawdzani jednym zapytaniem."""
+        now = now or timezone.now()
+        window = self.online_window
+        result = {}
+        missing = []
+        for user_id in user_ids:
+            if self._is_recent(user_id, None, now, window):
+                result[user_id] = True
+            else:
+                missing.append(user_id)
+
+        if missing:
+            stored = dict(MyUser.objects.filter(id__in=missing).values_list('id', 'last_activity'))
+            for user_id in missing:
+                result[user_id] = self._is_recent(user_id, stored.get(user_id), now, window)
+        return result
+
+
+tracker = PresenceTracker()
@@ -0,0 +1,263 @@
+"""
+Statystyki wydajności żądań (ProfilingMiddleware, włączane PROFILING_ENABLED).
+
+Dla każdej trasy z REST.urls zbierane są histogramy: czas całego żądania,
+liczba i łączny czas zapytań SQL, czas serializacji oraz rozmiar odpowiedzi.
+Zapytania są liczone przez execute_wrapper dołączany do każdego połączenia z
+bazą, serializacja - przez BaseSerializer.data z DRF oraz szybkie funkcje z
+REST.serializers (dekorator timed_serialization). Część żądań
+(PROFILING_CPROFILE_SAMPLE_RATE) jest wykonywana pod cProfile, a profil
+zapisywany, jeżeli żądanie trwało co najmniej PROFILING_SLOW_MS.
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import random
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from functools import wraps
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+_current = ContextVar('profiling_request', default=None)
+_lock = threading.Lock()
+_endpoints = {}
+_slow_profiles = deque(maxlen=20)
+_enabled = False
+_last_dump = time.monotonic()
+
+# Górne granice przedziałów histogramów; ostatni przedział jest otwarty
+MS_BOUNDS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+METRICS = {
+    'wall_ms': MS_BOUNDS,
+    'db_ms': MS_BOUNDS,
+    'serializer_ms': MS_BOUNDS,
+    'queries': (0, 1, 2, 3, 5, 10, 20, 50, 100),
+    'response_bytes': (256, 1024, 4096, 16384, 65536, 262144, 1048576),
+}
+
+
+class Histogram:
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def add(self, value):
+        index = next((i for i, bound in enumerate(self.bounds) if value <= bound), len(self.bounds))
+        self.buckets[index] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, fraction):
+        """Górna granica przedziału, w którym leży percentyl (dla ostatniego - maksimum)."""
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= rank:
+                return self.bounds[index] if index < len(self.bounds) else self.max
+        return 0
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'mean': round(self.total / self.count, 3) if self.count else 0,
+            'max': round(self.max, 3),
+            'p50': self.percentile(0.5),
+            'p95': self.percentile(0.95),
+            'buckets': {('le_%s' % bound): count for bound, count in zip(self.bounds, self.buckets)}
+            | {'inf': self.buckets[-1]},
+        }
+
+
+class RequestStats:
+    """Liczniki jednego żądania, uzupełniane w trakcie jego obsługi."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializing = False
+
+
+def record_query(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.db_time += time.perf_counter() - started
+
+
+def _install_query_wrapper(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def timed_serialization(func):
+    """Dolicza czas wywołania do serializacji żądania; wywołania zagnieżdżone liczone są raz."""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        stats = _current.get()
+        if stats is None or stats.serializing:
+            return func(*args, **kwargs)
+        stats.serializing = True
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            stats.serializer_time += time.perf_counter() - started
+            stats.serializing = False
+    return wrapper
+
+
+def enable():
+    """Dołącza liczenie zapytań do połączeń i pomiar BaseSerializer.data; wywoływane raz przez middleware."""
+    global _enabled
+    with _lock:
+        if _enabled:
+            return
+        from rest_framework.serializers import BaseSerializer
+        BaseSerializer.data = property(timed_serialization(BaseSerializer.data.fget))
+        connection_created.connect(_install_query_wrapper)
+        for connection in connections.all(initialized_only=True):
+            _install_query_wrapper(None, connection)
+        _enabled = True
+
+
+def start():
+    stats = RequestStats()
+    return stats, _current.set(stats)
+
+
+def start_profiler():
+    """Zwraca uruchomiony cProfile dla wylosowanej części żądań albo None."""
+    if random.random() >= getattr(settings, 'PROFILING_CPROFILE_SAMPLE_RATE', 0.0):
+        return None
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Inny profiler jest już aktywny w tym wątku
+        return None
+    return profiler
+
+
+def endpoint_key(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved', None
+    return match.route, match.url_name
+
+
+def response_size(response):
+    if response.streaming:
+        return int(response.get('Content-Length') or 0)
+    return len(response.content)
+
+
+def finish(request, response, stats, token, profiler=None):
+    wall_ms = (time.perf_counter() - stats.started) * 1000
+    _current.reset(token)
+    if profiler is not None:
+        profiler.disable()
+    route, url_name = endpoint_key(request)
+    values = {
+        'wall_ms': wall_ms,
+        'db_ms': stats.db_time * 1000,
+        'serializer_ms': stats.serializer_time * 1000,
+        'queries': stats.queries,
+        'response_bytes': response_size(response),
+    }
+    with _lock:
+        endpoint = _endpoints.get(route)
+        if endpoint is None:
+            endpoint = _endpoints[route] = {
+                'url_name': url_name,
+                'statuses': {},
+                'metrics': {metric: Histogram(bounds) for metric, bounds in METRICS.items()},
+            }
+        for metric, value in values.items():
+            endpoint['metrics'][metric].add(value)
+        status = str(response.status_code)
+        endpoint['statuses'][status] = endpoint['statuses'].get(status, 0) + 1
+
+    if profiler is not None and wall_ms >= getattr(settings, 'PROFILING_SLOW_MS', 500):
+        save_profile(profiler, request, route, wall_ms)
+    dump_if_due()
+
+
+def save_profile(profiler, request, route, wall_ms):
+    summary = io.StringIO()
+    pstats.Stats(profiler, stream=summary).sort_stats('cumulative').print_stats(15)
+    entry = {'time': time.time(), 'route': route, 'method': request.method, 'wall_ms': round(wall_ms, 1),
+             'summary': summary.getvalue(), 'file': None}
+    profile_dir = getattr(settings, 'PROFILING_PROFILE_DIR', None)
+    if profile_dir:
+        profile_dir = Path(profile_dir)
+        profile_dir.mkdir(parents=True, exist_ok=True)
+        slug = ''.join(char if char.isalnum() else '_' for char in route).strip('_') or 'root'
+        path = profile_dir / f'{slug}-{int(entry["time"] * 1000)}-{int(wall_ms)}ms.prof'
+        profiler.dump_stats(path)
+        entry['file'] = str(path)
+    _slow_profiles.append(entry)
+
+
+def snapshot():
+    with _lock:
+        endpoints = {
+            route: {
+                'url_name': endpoint['url_name'],
+                'statuses': dict(endpoint['statuses']),
+                **{metric: histogram.to_dict() for metric, histogram in endpoint['metrics'].items()},
+            }
+            for route, endpoint in _endpoints.items()
+        }
+    return {'enabled': _enabled, 'pid': os.getpid(), 'endpoints': endpoints, 'slow_profiles': list(_slow_profiles)}
+
+
+def jsonl_lines():
+    """Migawka w postaci JSONL: jeden wiersz na trasę."""
+    data = snapshot()
+    now = time.time()
+    for route, endpoint in data['endpoints'].items():
+        yield json.dumps({'time': now, 'pid': data['pid'], 'route': route, **endpoint}) + '\n'
+
+
+def dump(path):
+    with open(path, 'a', encoding='utf-8') as file:
+        file.writelines(jsonl_lines())
+
+
+def dump_if_due():
+    """Dopisuje migawkę do PROFILING_DUMP_PATH co PROFILING_DUMP_INTERVAL sekund."""
+    global _last_dump
+    path = getattr(settings, 'PROFILING_DUMP_PATH', None)
+    if not path or time.monotonic() - _last_dump < getattr(settings, 'PROFILING_DUMP_INTERVAL', 60):
+        return
+    with _lock:
+        if time.monotonic() - _last_dump < getattr(settings, 'PROFILING_DUMP_INTERVAL', 60):
+            return
+        _last_dump = time.monotonic()
+    dump(path)
+
+
+def reset():
+    with _lock:
+        _endpoints.clear()
+        _slow_profiles.clear()
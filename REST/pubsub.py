@@ -0,0 +1,114 @@
+import asyncio
+import threading
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class Subscription:
+    """Kolejka zdarzeń jednego połączenia, obsługiwana w pętli zdarzeń tego połączenia."""
+
+    def __init__(self, user_id, loop, maxsize):
+        self.user_id = user_id
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize)
+        self.overflowed = False
+
+    def deliver(self, event):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Klient nie nadąża - kolejka jest czyszczona, a połączenie zamykane,
+            # klient pobiera brakujące wiadomości przez after_id
+            self.overflowed = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+    async def get(self):
+        """Zwraca kolejne zdarzenie albo None, gdy połączenie należy zamknąć."""
+        return await self.queue.get()
+
+
+class BaseBackend:
+    """Interfejs backendu publikacji zdarzeń do połączonych użytkowników."""
+
+    def subscribe(self, user_id):
+        raise NotImplementedError
+
+    def unsubscribe(self, subscription):
+        raise NotImplementedError
+
+    def publish(self, user_ids, event):
+        raise NotImplementedError
+
+    def is_connected(self, user_id):
+        raise NotImplementedError
+
+    def has_subscribers(self):
+        raise NotImplementedError
+
+
+class InProcessBackend(BaseBackend):
+    """
+    Backend w pamięci procesu. publish może być wywoływane z dowolnego wątku
+    (np. synchronicznego widoku), zdarzenia trafiają do pętli połączeń przez
+    call_soon_threadsafe. Zdarzenia nie przechodzą między procesami.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = {}
+
+    @property
+    def queue_size(self):
+        return getattr(settings, 'REALTIME_QUEUE_SIZE', 100)
+
+    def subscribe(self, user_id):
+        subscription = Subscription(user_id, asyncio.get_running_loop(), self.queue_size)
+        with self._lock:
+            self._subscriptions.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self._subscriptions.pop(subscription.user_id, None)
+
+    def publish(self, user_ids, event):
+        with self._lock:
+            targets = [subscription for user_id in set(user_ids)
+                       for subscription in self._subscriptions.get(user_id, ())]
+        for subscription in targets:
+            subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+        return len(targets)
+
+    def is_connected(self, user_id):
+        return bool(self._subscriptions.get(user_id))
+
+    def has_subscribers(self):
+        return bool(self._subscriptions)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                backend_class = getattr(settings, 'REALTIME_BACKEND', 'REST.pubsub.InProcessBackend')
+                _backend = import_string(backend_class)()
+    return _backend
+
+
+def set_backend(backend):
+    """Podmienia backend (np. na lokalny zamiennik w testach)."""
+    global _backend
+    _backend = backend
@@ -0,0 +1,129 @@
+"""
+Zapytania dla poszczególnych widoków, pobierające z wyprzedzeniem dokładnie
+te relacje, których używają ich serializery (bez zapytań N+1).
+"""
+import heapq
+from itertools import groupby, islice
+from operator import attrgetter
+
+from django.db.models import Q, prefetch_related_objects
+
+from REST.models import MyUser, Membership, Message, Alert, BlockedUsers, Conversation
+
+
+def people():
+    """Użytkownicy dla PersonSerializer i UserWithDistanceSerializer (zagnieżdżone grupy)."""
+    return MyUser.objects.prefetch_related('groups')
+
+
+def other_people(user_id, excluded_ids):
+    """Użytkownicy poza user_id i excluded_ids (np. tymi, którzy go zablokowali)."""
+    return people().exclude(id=user_id).exclude(id__in=excluded_ids)
+
+
+def group_members(group):
+    return group.users.prefetch_related('groups')
+
+
+def group_member_page(group, columns, with_groups):
+    """Członkowie grupy z kolumnami potrzebnymi do projekcji pól i kolejności."""
+    members = group.users.only('last_activity', 'latitude', 'longitude', *columns)
+    return members.prefetch_related('groups') if with_groups else members
+
+
+# Kolejności członków grupy stronicowane kursorem po indeksach tabeli Membership
+MEMBER_ORDERINGS = {
+    'id': ('myuser_id',),
+    'online': ('-last_activity', '-myuser_id'),
+}
+
+
+def group_member_keys(group_id, ordering, position=None):
+    """
+    Pary (myuser_id, last_activity) członków grupy w kolejności ordering, po
+    pozycji kursora position ({'id'} lub {'t', 'id'}); odczyt zakresu indeksu
+    (group, myuser) lub (group, last_activity, myuser), bez sortowania grupy.
+    """
+    rows = Membership.objects.filter(group_id=group_id)
+    if position and ordering == 'online':
+        # Nadmiarowy warunek last_activity <= t ogranicza zakres indeksu
+        rows = rows.filter(Q(last_activity__lt=position['t']) |
+                           Q(last_activity=position['t'], myuser_id__lt=position['id']),
+                           last_activity__lte=position['t'])
+    elif position:
+        rows = rows.filter(myuser_id__gt=position['id'])
+    return rows.order_by(*MEMBER_ORDERINGS[ordering]).values_list('myuser_id', 'last_activity')
+
+
+def thread_queryset(user_id, partner_id):
+    """Wszystkie wiadomości wymienione pomiędzy dwoma użytkownikami, dla MessageSerializer."""
+    return Message.objects.filter(
+        Q(sender=user_id, receiver=partner_id) | Q(sender=partner_id, receiver=user_id)
+    ).select_related('sender', 'receiver').prefetch_related('sender__groups', 'receiver__groups')
+
+
+def thread_direction(sender, receiver):
+    """Wiadomości od sender do receiver w kolejności indeksu message_thread_idx."""
+    return Message.objects.filter(sender=sender, receiver=receiver).select_related('sender', 'receiver') \
+        .order_by('created_at', 'id')
+
+
+def thread_messages(user_id, partner_id):
+    """
+    Cały wątek chronologicznie, dla MessageSerializer: oba kierunki rozmowy są
+    odczytywane w kolejności indeksu i scalane tutaj, a grupy autorów pobierane
+    raz dla całej listy.
+    """
+    merged = heapq.merge(thread_direction(user_id, partner_id), thread_direction(partner_id, user_id),
+                         key=attrgetter('created_at', 'id'))
+    messages = [next(group) for _, group in groupby(merged, key=attrgetter('id'))]
+    prefetch_related_objects(messages, 'sender__groups', 'receiver__groups')
+    return messages
+
+
+def thread_cursor(created_at, message_id, newer):
+    """Warunek (created_at, id) > / < kursora, zgodny z indeksem message_thread_idx."""
+    # Nadmiarowy warunek na samym created_at zawęża zakres indeksu przy zachowaniu jego kolejności
+    if newer:
+        return Q(Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=message_id),
+                 created_at__gte=created_at)
+    return Q(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=message_id),
+             created_at__lte=created_at)
+
+
+def thread_direction_keys(sender, receiver, condition, newest_first):
+    """Klucze (created_at, id) wiadomości od sender do receiver, w kolejności indeksu message_thread_idx."""
+    ordering = ('-created_at', '-id') if newest_first else ('created_at', 'id')
+    return Message.objects.filter(condition, sender=sender, receiver=receiver) \
+        .order_by(*ordering).values_list('created_at', 'id')
+
+
+def thread_page_keys(user_id, partner_id, condition, newest_first, limit):
+    """
+    Najwyżej limit kluczy (created_at, id) wiadomości wątku spełniających
+    condition, od najnowszej lub od najstarszej. Każdy kierunek rozmowy to
+    osobny odczyt zakresu indeksu; wyniki są scalane tutaj, więc baza nie
+    sortuje całego wątku.
+    """
+    directions = [thread_direction_keys(sender, receiver, condition, newest_first)[:limit]
+                  for sender, receiver in ((user_id, partner_id), (partner_id, user_id))]
+    # groupby usuwa powtórzenia, gdy oba kierunki są tym samym wątkiem (wiadomości do siebie)
+    merged = (key for key, _ in groupby(heapq.merge(*directions, reverse=newest_first)))
+    return list(islice(merged, limit))
+
+
+def conversations(user_id):
+    """Rozmowy użytkownika od najnowszej, z rozmówcą i jego grupami."""
+    return Conversation.objects.filter(user=user_id).select_related('partner') \
+        .prefetch_related('partner__groups').order_by('-last_message_at')
+
+
+def alerts():
+    """Komunikaty dla AlertSerializer (grupa oraz autor z jego grupami)."""
+    return Alert.objects.select_related('group', 'user').prefetch_related('user__groups')
+
+
+def blocked_users(user):
+    """Blokady dla BlockedUsersListSerializer."""
+    return BlockedUsers.objects.filter(user=user).select_related('blocked_user') \
+        .prefetch_related('blocked_user__groups')
@@ -0,0 +1,113 @@
+"""
+Powiadomienia w czasie rzeczywistym przez WebSocket (ASGI).
+
+Klient łączy się z REALTIME_PATH, przekazując token dostępu SimpleJWT w
+parametrze ``token`` lub nagłówku Authorization, i otrzymuje zdarzenia JSON:
+``message`` (nowa wiadomość), ``alert`` (nowy komunikat w grupie) oraz
+``presence`` (rozmówca połączył się lub rozłączył).
+
+Wymaga serwera ASGI z obsługą WebSocket, np.
+``uvicorn testChatREST.asgi:application``.
+"""
+import asyncio
+import json
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from REST.models import MyUser, Conversation
+from REST.presence import tracker
+from REST.pubsub import get_backend
+from REST.serializers import compact_message_data
+
+REALTIME_PATH = '/api/realtime/'
+
+# Kod zamknięcia dla brakującego lub nieważnego tokenu
+CLOSE_UNAUTHORIZED = 4401
+# Kod zamknięcia dla klienta, który nie nadąża z odbiorem zdarzeń
+CLOSE_TRY_AGAIN_LATER = 1013
+
+
+def publish_message(message):
+    get_backend().publish([message.sender_id, message.receiver_id],
+                          {'type': 'message', 'message': compact_message_data(message)})
+
+
+def publish_alert(alert, data):
+    backend = get_backend()
+    if not backend.has_subscribers():
+        return
+    member_ids = MyUser.groups.through.objects.filter(group_id=alert.group_id).values_list('myuser_id', flat=True)
+    backend.publish(list(member_ids), {'type': 'alert', 'alert': data})
+
+
+def publish_presence(user_id, online):
+    partner_ids = Conversation.objects.filter(user_id=user_id).values_list('partner_id', flat=True)
+    get_backend().publish(list(partner_ids), {'type': 'presence', 'user_id': user_id, 'online': online})
+
+
+def get_token(scope):
+    token = parse_qs(scope.get('query_string', b'').decode()).get('token')
+    if token:
+        return token[0]
+    for name, value in scope.get('headers', []):
+        if name == b'authorization':
+            parts = value.decode().split()
+            if len(parts) == 2 and parts[0] in api_settings.AUTH_HEADER_TYPES:
+                return parts[1]
+    return None
+
+
+def authenticate(scope):
+    """Zwraca identyfikator użytkownika z tokenu dostępu albo None; bez zapytań do bazy."""
+    token = get_token(scope)
+    if token is None:
+        return None
+    try:
+        return AccessToken(token)[api_settings.USER_ID_CLAIM]
+    except (TokenError, KeyError):
+        return None
+
+
+async def _forward(subscription, send):
+    while True:
+        event = await subscription.get()
+        if event is None:
+            await send({'type': 'websocket.close', 'code': CLOSE_TRY_AGAIN_LATER})
+            return
+        await send({'type': 'websocket.send', 'text': json.dumps(event)})
+
+
+async def websocket_application(scope, receive, send):
+    event = await receive()
+    if event['type'] != 'websocket.connect':
+        return
+
+    user_id = authenticate(scope)
+    if user_id is None:
+        await send({'type': 'websocket.close', 'code': CLOSE_UNAUTHORIZED})
+        return
+    await send({'type': 'websocket.accept'})
+
+    backend = get_backend()
+    was_connected = backend.is_connected(user_id)
+    subscription = backend.subscribe(user_id)
+    if not was_connected:
+        await sync_to_async(publish_presence)(user_id, True)
+
+    writer = asyncio.ensure_future(_forward(subscription, send))
+    try:
+        while True:
+            event = await receive()
+            if event['type'] == 'websocket.disconnect':
+                break
+            # Każda wiadomość od klienta (np. ping) oznacza aktywność
+            await sync_to_async(tracker.heartbeat)(user_id)
+    finally:
+        writer.cancel()
+        backend.unsubscribe(subscription)
+        if not backend.is_connected(user_id):
+            await sync_to_async(publish_presence)(user_id, False)
@@ -0,0 +1,129 @@
+"""
+Usuwanie i archiwizacja starych danych.
+
+Polityki z RETENTION_POLICIES określają, po jakim czasie wiersze danego
+modelu są usuwane (``delete``) albo najpierw zapisywane do skompresowanego
+pliku JSONL, a potem usuwane (``archive``). Wiersze są przetwarzane partiami
+w kolejności (data, klucz główny), każda partia w osobnej krótkiej
+transakcji, aby nie blokować tabel na długo.
+"""
+import gzip
+import json
+import logging
+import time
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from REST.models import Alert, Message
+
+logger = logging.getLogger(__name__)
+
+# Model i pole daty, od którego liczony jest wiek wiersza
+TARGETS = {
+    'alerts': (Alert, 'end_date'),
+    'messages': (Message, 'created_at'),
+}
+
+DEFAULT_POLICIES = {
+    'alerts': {'after': timedelta(days=30), 'action': 'archive'},
+    'messages': {'after': timedelta(days=365), 'action': 'archive'},
+}
+
+
+class RetentionPolicy:
+    def __init__(self, name, after, action='archive'):
+        if name not in TARGETS:
+            raise ValueError(f'Unknown retention target: {name}')
+        if action not in ('archive', 'delete'):
+            raise ValueError(f'Unknown retention action: {action}')
+        self.name = name
+        self.model, self.date_field = TARGETS[name]
+        self.after = after
+        self.action = action
+
+    def expired(self, now):
+        return self.model.objects.filter(**{f'{self.date_field}__lt': now - self.after})
+
+    def batch(self, now, last=None):
+        """Wygasłe wiersze po kluczu last (data, id), w kolejności indeksu daty."""
+        rows = self.expired(now)
+        if last is not None:
+            date_field = self.date_field
+            # Nadmiarowy warunek data >= last zawęża zakres indeksu przy zachowaniu jego kolejności
+            rows = rows.filter(Q(**{f'{date_field}__gt': last[0]}) | Q(**{date_field: last[0], 'id__gt': last[1]}),
+                               **{f'{date_field}__gte': last[0]})
+        return rows.order_by(self.date_field, 'id')
+
+
+def get_policies():
+    policies = getattr(settings, 'RETENTION_POLICIES', DEFAULT_POLICIES)
+    return [RetentionPolicy(name, **options) for name, options in policies.items()]
+
+
+def get_archive_dir():
+    return Path(getattr(settings, 'RETENTION_ARCHIVE_DIR', Path(settings.BASE_DIR) / 'archive'))
+
+
+def get_batch_size():
+    return getattr(settings, 'RETENTION_BATCH_SIZE', 1000)
+
+
+def apply_policy(policy, batch_size=None, archive_dir=None, dry_run=False, pause=0.0, now=None):
+    """
+    Stosuje politykę i zwraca statystyki: liczbę wierszy zarchiwizowanych,
+    usuniętych, partii, czas trwania oraz ścieżkę archiwum. Domyślny rozmiar
+    partii pochodzi z RETENTION_BATCH_SIZE.
+    """
+    now = now or timezone.now()
+    batch_size = batch_size or get_batch_size()
+    started = time.monotonic()
+    stats = {'policy': policy.name, 'action': policy.action, 'archived': 0, 'deleted': 0, 'batches': 0,
+             'archive': None, 'dry_run': dry_run}
+    if dry_run:
+        stats['deleted'] = policy.expired(now).count()
+        stats['seconds'] = round(time.monotonic() - started, 3)
+        return stats
+
+    archive = None
+    date_field = policy.date_field
+    last = None
+    try:
+        while True:
+            # Kolejność (data, id) pozwala przejść partiami po indeksie daty zamiast po całej tabeli
+            rows = list(policy.batch(now, last).values()[:batch_size])
+            if not rows:
+                break
+            ids = [row['id'] for row in rows]
+            if policy.action == 'archive':
+                if archive is None:
+                    # Plik archiwum powstaje dopiero, gdy jest co do niego zapisać
+                    archive_dir = Path(archive_dir or get_archive_dir())
+                    archive_dir.mkdir(parents=True, exist_ok=True)
+                    path = archive_dir / f'{policy.name}-{now:%Y%m%dT%H%M%S}.jsonl.gz'
+                    archive = gzip.open(path, 'at', encoding='utf-8')
+                    stats['archive'] = str(path)
+                # Najpierw zapis do archiwum, dopiero potem usunięcie partii
+                archive.writelines(json.dumps(row, cls=DjangoJSONEncoder) + '\n' for row in rows)
+                archive.flush()
+                stats['archived'] += len(rows)
+            with transaction.atomic():
+                policy.model.objects.filter(id__in=ids).delete()
+            stats['deleted'] += len(ids)
+            stats['batches'] += 1
+            last = (rows[-1][date_field], ids[-1])
+            if pause:
+                time.sleep(pause)
+    finally:
+        if archive is not None:
+            archive.close()
+
+    stats['seconds'] = round(time.monotonic() - started, 3)
+    logger.info('Retention %(policy)s: archived=%(archived)d deleted=%(deleted)d batches=%(batches)d '
+                'seconds=%(seconds)s', stats)
+    return stats
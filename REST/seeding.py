@@ -0,0 +1,243 @@
+"""
+Syntetyczne dane testowe: użytkownicy z lokalizacją, grupy, wiadomości,
+komunikaty i blokady.
+
+Obiekty są generowane strumieniowo i zapisywane przez bulk_create partiami,
+więc w pamięci jest naraz tylko jedna partia. bulk_create pomija save() i
+sygnały, dlatego pola wyliczane w save() (geohash) oraz dane utrzymywane
+przez sygnały i menedżery (member_count, Conversation) są uzupełniane tutaj.
+Ten sam seed (i ta sama chwila ``now``) daje ten sam zbiór danych.
+
+Rozkłady: użytkownicy skupieni wokół dużych miast proporcjonalnie do ich
+wielkości, aktywność użytkowników i długość rozmów o rozkładzie Pareto
+(niewielu bardzo aktywnych), rozmówcy najczęściej z tego samego miasta,
+wiadomości w rozmowie rozłożone w czasie z wykładniczymi odstępami.
+"""
+import random
+import time
+from contextlib import contextmanager
+from datetime import date, timedelta
+from io import StringIO
+from itertools import accumulate, islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.db.models import Count
+from django.utils import timezone
+
+from REST.geo import encode_geohash
+from REST.models import MyUser, Group, Membership, Message, Alert, BlockedUsers
+
+
+DEFAULT_PASSWORD = 'benchmark'
+
+# (szerokość, długość, liczba mieszkańców w tysiącach)
+CITIES = [
+    (52.23, 21.01, 1860), (50.06, 19.94, 800), (51.76, 19.46, 660), (51.11, 17.03, 670),
+    (52.41, 16.93, 540), (54.35, 18.65, 470), (53.43, 14.55, 390), (53.12, 18.01, 330),
+    (51.25, 22.57, 330), (53.13, 23.16, 290), (50.26, 19.02, 280), (50.04, 22.00, 200),
+]
+# Część użytkowników poza miastami, rozmieszczona równomiernie w tym obszarze (Polska)
+RURAL_SHARE = 0.15
+LATITUDE_RANGE = (49.0, 54.8)
+LONGITUDE_RANGE = (14.1, 24.1)
+# Rozrzut wokół centrum miasta w stopniach (ok. 8 km)
+CITY_SPREAD = 0.07
+# Prawdopodobieństwo, że rozmówca pochodzi z tego samego miasta
+SAME_CITY_PARTNER = 0.7
+MAX_CONVERSATION_LENGTH = 500
+
+FIRST_NAMES = ['Anna', 'Maria', 'Katarzyna', 'Agnieszka', 'Piotr', 'Krzysztof', 'Tomasz', 'Paweł', 'Michał',
+               'Ewa', 'Marek', 'Magdalena', 'Jakub', 'Zofia', 'Jan', 'Julia']
+LAST_NAMES = ['Nowak', 'Kowalski', 'Wiśniewski', 'Wójcik', 'Kamiński', 'Lewandowski', 'Zieliński', 'Szymański',
+              'Woźniak', 'Dąbrowski', 'Kozłowski', 'Mazur']
+WORDS = ['cześć', 'co', 'słychać', 'spotkanie', 'jutro', 'dzisiaj', 'może', 'kawa', 'tak', 'nie', 'dzięki',
+         'gdzie', 'jesteś', 'o', 'której', 'super', 'do', 'zobaczenia', 'wieczorem', 'ok']
+
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def bulk_insert(model, objects, batch_size):
+    """Zapisuje obiekty z generatora partiami; zwraca ich liczbę."""
+    count = 0
+    for batch in batches(objects, batch_size):
+        model.objects.bulk_create(batch)
+        count += len(batch)
+    return count
+
+
+@contextmanager
+def explicit_created_at():
+    """Wyłącza auto_now_add dla Message.created_at, aby bulk_create zapisał wygenerowane daty."""
+    field = Message._meta.get_field('created_at')
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+class Generator:
+    def __init__(self, random_seed=0, prefix=None, password=DEFAULT_PASSWORD, now=None, days=365):
+        self.rng = random.Random(random_seed)
+        self.prefix = prefix or f's{random_seed}'
+        # Jeden skrót hasła dla wszystkich: pełne haszowanie dla każdego trwałoby godzinami
+        self.password_hash = make_password(password)
+        self.now = now or timezone.now()
+        self.days = days
+        self.city_weights = list(accumulate(population for _, _, population in CITIES))
+        self.user_ids = []
+        self.user_cities = []
+        self.group_ids = []
+
+    def location(self):
+        """Zwraca (indeks miasta lub None, szerokość, długość)."""
+        rng = self.rng
+        if rng.random() < RURAL_SHARE:
+            return None, rng.uniform(*LATITUDE_RANGE), rng.uniform(*LONGITUDE_RANGE)
+        city = rng.choices(range(len(CITIES)), cum_weights=self.city_weights)[0]
+        latitude, longitude, _ = CITIES[city]
+        return city, rng.gauss(latitude, CITY_SPREAD), rng.gauss(longitude, CITY_SPREAD * 1.5)
+
+    def users(self, count):
+        rng = self.rng
+        for i in range(count):
+            city, latitude, longitude = self.location()
+            self.user_cities.append(city)
+            yield MyUser(
+                username=f'{self.prefix}_{i}'[:20], email=f'{self.prefix}.{i}@example.com',
+                firstName=rng.choice(FIRST_NAMES), lastName=rng.choice(LAST_NAMES),
+                date_of_birth=date(1960, 1, 1) + timedelta(days=rng.randrange(45 * 365)),
+                gender=rng.choice('MF'), password=self.password_hash, latitude=latitude, longitude=longitude,
+                geohash=encode_geohash(latitude, longitude),
+            )
+
+    def groups(self, count):
+        for i in range(count):
+            yield Group(name=f'{self.prefix} group {i}', logo_url='', password=self.password_hash)
+
+    def memberships(self, per_user):
+        rng = self.rng
+        # Kilka grup jest bardzo popularnych, większość ma niewielu członków
+        weights = list(accumulate(1 / (rank + 1) for rank in range(len(self.group_ids))))
+        for user_id in self.user_ids:
+            chosen = set(rng.choices(self.group_ids, cum_weights=weights, k=rng.randint(0, per_user * 2)))
+            for group_id in sorted(chosen):
+                yield Membership(myuser_id=user_id, group_id=group_id)
+
+    def partner(self, user, city_members):
+        rng = self.rng
+        city = self.user_cities[user]
+        if city is not None and len(city_members[city]) > 1 and rng.random() < SAME_CITY_PARTNER:
+            return rng.choice(city_members[city])
+        return rng.randrange(len(self.user_ids))
+
+    def messages(self, count):
+        """Wiadomości rozmowa po rozmowie, w kolejności chronologicznej wewnątrz rozmowy."""
+        rng = self.rng
+        users = len(self.user_ids)
+        if users < 2:
+            return
+        activity = list(accumulate(rng.paretovariate(1.16) for _ in range(users)))
+        city_members = {}
+        for index, city in enumerate(self.user_cities):
+            city_members.setdefault(city, []).append(index)
+
+        pairs = set()
+        remaining = count
+        attempts = 0
+        while remaining > 0 and attempts < count * 10:
+            attempts += 1
+            user = rng.choices(range(users), cum_weights=activity)[0]
+            partner = self.partner(user, city_members)
+            pair = (min(user, partner), max(user, partner))
+            # Jedna seria wiadomości na parę, aby najnowsza wiadomość pary miała największe id
+            if user == partner or pair in pairs:
+                continue
+            pairs.add(pair)
+            length = max(1, min(remaining, MAX_CONVERSATION_LENGTH, int(rng.paretovariate(1.2) * 3)))
+            created_at = self.now - timedelta(days=rng.uniform(0, self.days))
+            sender, receiver = self.user_ids[user], self.user_ids[partner]
+            for _ in range(length):
+                if rng.random() < 0.6:
+                    sender, receiver = receiver, sender
+                created_at = min(created_at + timedelta(minutes=rng.expovariate(1 / 30)), self.now)
+                text = ' '.join(rng.choices(WORDS, k=rng.randint(1, 12)))
+                yield Message(sender_id=sender, receiver_id=receiver, text=text, created_at=created_at)
+            remaining -= length
+
+    def alerts(self, count):
+        rng = self.rng
+        for i in range(count):
+            start_date = self.now + timedelta(hours=rng.randint(-24 * 60, 24 * 7))
+            yield Alert(
+                user_id=rng.choice(self.user_ids), title=f'alert {i}', content=' '.join(rng.choices(WORDS, k=20)),
+                start_date=start_date, end_date=start_date + timedelta(hours=rng.randint(1, 24 * 14)),
+                group_id=rng.choice(self.group_ids), style=rng.choice(('primary', 'secondary', 'warning')),
+            )
+
+    def blocks(self, count):
+        rng = self.rng
+        pairs = set()
+        limit = min(count, len(self.user_ids) * (len(self.user_ids) - 1))
+        while len(pairs) < limit:
+            pair = tuple(rng.sample(self.user_ids, 2))
+            if pair not in pairs:
+                pairs.add(pair)
+                yield BlockedUsers(user_id=pair[0], blocked_user_id=pair[1])
+
+
+def seed(users=1000, groups=20, messages=10000, alerts=200, blocks=100, memberships_per_user=2,
+         random_seed=0, password=DEFAULT_PASSWORD, batch_size=1000, prefix=None, now=None, days=365,
+         progress=None):
+    """
+    Zapisuje zbiór danych i zwraca słownik z identyfikatorami utworzonych
+    użytkowników i grup. Wszyscy użytkownicy i grupy mają hasło password.
+    progress(nazwa, liczba wierszy, sekundy) jest wywoływane po każdej tabeli.
+    """
+    generator = Generator(random_seed, prefix, password, now, days)
+    prefix = generator.prefix
+
+    def insert(name, model, objects):
+        started = time.monotonic()
+        count = bulk_insert(model, objects, batch_size)
+        if progress is not None:
+            progress(name, count, time.monotonic() - started)
+
+    insert('users', MyUser, generator.users(users))
+    # MySQL nie zwraca kluczy z bulk_create, więc identyfikatory są odczytywane ponownie
+    generator.user_ids = list(MyUser.objects.filter(email__startswith=f'{prefix}.', email__endswith='@example.com')
+                              .order_by('id').values_list('id', flat=True))
+
+    insert('groups', Group, generator.groups(groups))
+    generator.group_ids = list(Group.objects.filter(name__startswith=f'{prefix} group ').order_by('id')
+                               .values_list('id', flat=True))
+
+    if generator.group_ids:
+        insert('memberships', Membership, generator.memberships(memberships_per_user))
+        for group_id, count in Membership.objects.filter(group_id__in=generator.group_ids).values('group_id') \
+                .annotate(count=Count('id')).values_list('group_id', 'count'):
+            Group.objects.filter(id=group_id).update(member_count=count)
+
+    if messages and len(generator.user_ids) > 1:
+        with explicit_created_at():
+            insert('messages', Message, generator.messages(messages))
+        started = time.monotonic()
+        call_command('backfill_conversations', batch_size=batch_size, stdout=StringIO())
+        if progress is not None:
+            progress('conversations', None, time.monotonic() - started)
+
+    if alerts and generator.group_ids and generator.user_ids:
+        insert('alerts', Alert, generator.alerts(alerts))
+
+    if blocks and len(generator.user_ids) > 1:
+        insert('blocks', BlockedUsers, generator.blocks(blocks))
+
+    return {'users': generator.user_ids, 'groups': generator.group_ids}
@@ -1,5 +1,7 @@
 from rest_framework import serializers
 
+from REST.media import InvalidImage, make_thumbnail, parse_data_uri, thumbnail_url
+from REST.profiling import timed_serialization
 from REST.models import Message, MyUser, Group, Alert, BlockedUsers
 
 
@@ -44,7 +46,7 @@ class GroupDetailSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'logo_url', 'user_count')
 
     def get_user_count(self, obj):
-        return obj.users.count()
+        return obj.member_count
 
 
 class GroupSerializer(serializers.ModelSerializer):
@@ -58,13 +60,33 @@ class GroupSerializer(serializers.ModelSerializer):
 
 class PersonSerializer(serializers.ModelSerializer):
     groups = GroupSerializer(many=True, read_only=True)
+    profile_thumbnail = serializers.SerializerMethodField()
 
     class Meta:
         model = MyUser
         fields = ('id', 'firstName', 'lastName', 'username', 'email', 'age', 'date_of_birth', 'profile_picture',
-                  'gender', 'latitude', 'longitude', 'description',
+                  'profile_thumbnail', 'gender', 'latitude', 'longitude', 'description',
                   'groups')
 
+    def get_profile_thumbnail(self, obj):
+        return thumbnail_url(obj.profile_picture)
+
+    def validate_profile_picture(self, value):
+        parsed = parse_data_uri(value)
+        if parsed is not None:
+            try:
+                make_thumbnail(*parsed)
+            except InvalidImage:
+                raise serializers.ValidationError('Invalid image.')
+        return value
+
+    def update(self, instance, validated_data):
+        # Zdjęcie zapisane jako data URI przed przeniesieniem do magazynu może być nieczytelne
+        try:
+            return super().update(instance, validated_data)
+        except InvalidImage:
+            raise serializers.ValidationError({'profile_picture': ['Invalid image.']})
+
 
 class MessageSerializer(serializers.ModelSerializer):
     sender = PersonSerializer(read_only=True)
@@ -85,13 +107,17 @@ class UserWithDistanceSerializer(serializers.ModelSerializer):
     groups = GroupSerializer(many=True, read_only=True)
     distance = serializers.FloatField(required=False)
     online = serializers.BooleanField(required=False)
+    profile_thumbnail = serializers.SerializerMethodField()
 
     class Meta:
         model = MyUser
-        fields = ('id', 'firstName', 'lastName', 'username', 'email', 'age', 'profile_picture', 'gender', 'latitude',
-                  'longitude', 'description', 'distance', 'online',
+        fields = ('id', 'firstName', 'lastName', 'username', 'email', 'age', 'profile_picture', 'profile_thumbnail',
+                  'gender', 'latitude', 'longitude', 'description', 'distance', 'online',
                   'groups')
 
+    def get_profile_thumbnail(self, obj):
+        return thumbnail_url(obj.profile_picture)
+
 
 class AlertSerializer(serializers.ModelSerializer):
     group = GroupSerializer(read_only=True)
@@ -120,3 +146,166 @@ class BlockedUsersSerializer(serializers.ModelSerializer):
     class Meta:
         model = BlockedUsers
         fields = '__all__'
+
+
+# Szybka serializacja tylko do odczytu dla najczęściej wywoływanych list.
+# Wynik musi być identyczny (po renderowaniu JSON) z odpowiednimi ModelSerializer
+# powyżej - przy zmianie pól należy zmienić obie wersje. timed_serialization
+# dolicza czas wykonania do statystyk ProfilingMiddleware; oznaczone są tylko
+# funkcje całych list, aby nie dokładać kosztu do każdego wiersza.
+
+_datetime_representation = serializers.DateTimeField().to_representation
+
+
+def group_data(group):
+    """Odpowiednik GroupSerializer(group).data."""
+    return {'id': group.id, 'name': group.name, 'logo_url': group.logo_url, 'group_site_url': group.group_site_url}
+
+
+def person_data(user):
+    """Odpowiednik PersonSerializer(user).data."""
+    return {
+        'id': user.id,
+        'firstName': user.firstName,
+        'lastName': user.lastName,
+        'username': user.username,
+        'email': user.email,
+        'age': user.age(),
+        'date_of_birth': user.date_of_birth.isoformat(),
+        'profile_picture': user.profile_picture,
+        'profile_thumbnail': thumbnail_url(user.profile_picture),
+        'gender': user.gender,
+        'latitude': float(user.latitude),
+        'longitude': float(user.longitude),
+        'description': user.description,
+        'groups': [group_data(group) for group in user.groups.all()],
+    }
+
+
+# Pola PersonSerializer: funkcja pobierająca wartość i kolumny modelu, których wymaga
+PERSON_FIELDS = {
+    'id': (lambda user: user.id, ()),
+    'firstName': (lambda user: user.firstName, ('firstName',)),
+    'lastName': (lambda user: user.lastName, ('lastName',)),
+    'username': (lambda user: user.username, ('username',)),
+    'email': (lambda user: user.email, ('email',)),
+    'age': (lambda user: user.age(), ('date_of_birth',)),
+    'date_of_birth': (lambda user: user.date_of_birth.isoformat(), ('date_of_birth',)),
+    'profile_picture': (lambda user: user.profile_picture, ('profile_picture',)),
+    'profile_thumbnail': (lambda user: thumbnail_url(user.profile_picture), ('profile_picture',)),
+    'gender': (lambda user: user.gender, ('gender',)),
+    'latitude': (lambda user: float(user.latitude), ('latitude',)),
+    'longitude': (lambda user: float(user.longitude), ('longitude',)),
+    'description': (lambda user: user.description, ('description',)),
+    'groups': (lambda user: [group_data(group) for group in user.groups.all()], ()),
+}
+
+
+def person_columns(fields):
+    """Kolumny MyUser potrzebne do zbudowania podanych pól (dla QuerySet.only)."""
+    return {column for field in fields for column in PERSON_FIELDS[field][1]}
+
+
+def projected_person_data(user, fields):
+    """Odpowiednik PersonSerializer(user).data ograniczony do podanych pól (w kolejności serializera)."""
+    return {field: PERSON_FIELDS[field][0](user) for field in fields}
+
+
+@timed_serialization
+def projected_person_list_data(users, fields):
+    """projected_person_data dla każdego użytkownika z listy."""
+    return [projected_person_data(user, fields) for user in users]
+
+
+def user_with_distance_data(user):
+    """Odpowiednik UserWithDistanceSerializer(user).data (bez distance i online)."""
+    return {
+        'id': user.id,
+        'firstName': user.firstName,
+        'lastName': user.lastName,
+        'username': user.username,
+        'email': user.email,
+        'age': user.age(),
+        'profile_picture': user.profile_picture,
+        'profile_thumbnail': thumbnail_url(user.profile_picture),
+        'gender': user.gender,
+        'latitude': float(user.latitude),
+        'longitude': float(user.longitude),
+        'description': user.description,
+        'groups': [group_data(group) for group in user.groups.all()],
+    }
+
+
+@timed_serialization
+def user_with_distance_list_data(users):
+    """Odpowiednik [UserWithDistanceSerializer(user).data for user in users]."""
+    return [user_with_distance_data(user) for user in users]
+
+
+def _cached_person(user, people):
+    data = people.get(user.id)
+    if data is None:
+        data = people[user.id] = person_data(user)
+    return data
+
+
+@timed_serialization
+def message_list_data(messages):
+    """Odpowiednik MessageSerializer(messages, many=True).data; profil każdej osoby budowany raz."""
+    people = {}
+    return [{
+        'id': message.id,
+        'sender': _cached_person(message.sender, people),
+        'receiver': _cached_person(message.receiver, people),
+        'text': message.text,
+        'created_at': _datetime_representation(message.created_at),
+    } for message in messages]
+
+
+def compact_message_data(message):
+    """Wiadomość z identyfikatorami nadawcy i odbiorcy zamiast profili."""
+    return {
+        'id': message.id,
+        'sender_id': message.sender_id,
+        'receiver_id': message.receiver_id,
+        'text': message.text,
+        'created_at': _datetime_representation(message.created_at),
+    }
+
+
+@timed_serialization
+def compact_message_list_data(messages):
+    """
+    Zwięzła postać wątku: wiadomości zawierają tylko sender_id/receiver_id, a
+    profile (jak w PersonSerializer) zwracane są raz w słowniku users.
+    """
+    people = {}
+    results = []
+    for message in messages:
+        _cached_person(message.sender, people)
+        _cached_person(message.receiver, people)
+        results.append(compact_message_data(message))
+    return results, people
+
+
+@timed_serialization
+def alert_list_data(alerts):
+    """Odpowiednik AlertSerializer(alerts, many=True).data."""
+    people = {}
+    groups = {}
+    result = []
+    for alert in alerts:
+        group = groups.get(alert.group_id)
+        if group is None:
+            group = groups[alert.group_id] = group_data(alert.group)
+        result.append({
+            'id': alert.id,
+            'user': _cached_person(alert.user, people),
+            'title': alert.title,
+            'content': alert.content,
+            'start_date': _datetime_representation(alert.start_date),
+            'end_date': _datetime_representation(alert.end_date),
+            'group': group,
+            'style': alert.style,
+        })
+    return result
@@ -0,0 +1,87 @@
+from django.db.models import F, OuterRef, Subquery
+from django.db import transaction
+from django.db.models.signals import m2m_changed, pre_delete, pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from REST import alert_cache, authentication
+from REST.models import MyUser, Group, Membership, Alert
+
+
+def _existing_memberships(instance, reverse, pk_set):
+    """Zwraca pary (użytkownik, grupa), które faktycznie istnieją wśród pk_set."""
+    if reverse:
+        rows = Membership.objects.filter(group_id=instance.pk, myuser_id__in=pk_set)
+    else:
+        rows = Membership.objects.filter(myuser_id=instance.pk, group_id__in=pk_set)
+    return list(rows.values_list('myuser_id', 'group_id'))
+
+
+def _adjust(group_ids, delta):
+    counts = {}
+    for group_id in group_ids:
+        counts[group_id] = counts.get(group_id, 0) + 1
+    for group_id, count in counts.items():
+        Group.objects.filter(id=group_id).update(member_count=F('member_count') + delta * count)
+
+
+def _copy_last_activity(memberships):
+    """Nowe członkostwa przejmują last_activity użytkownika (kolejność członków wg aktywności)."""
+    memberships.update(
+        last_activity=Subquery(MyUser.objects.filter(id=OuterRef('myuser_id')).values('last_activity')[:1]))
+
+
+@receiver(m2m_changed, sender=Membership)
+def update_member_count(sender, instance, action, reverse, pk_set, **kwargs):
+    """Aktualizuje Group.member_count przy dodawaniu i usuwaniu członków z obu stron relacji."""
+    if action == 'post_add':
+        # Django przekazuje tutaj tylko faktycznie dodane identyfikatory
+        group_ids = [instance.pk] * len(pk_set) if reverse else list(pk_set)
+        _adjust(group_ids, 1)
+        if reverse:
+            _copy_last_activity(Membership.objects.filter(group_id=instance.pk, myuser_id__in=pk_set))
+        else:
+            _copy_last_activity(Membership.objects.filter(myuser_id=instance.pk, group_id__in=pk_set))
+        alert_cache.invalidate_user_groups(pk_set if reverse else [instance.pk])
+    elif action == 'pre_remove':
+        # remove() przekazuje wszystkie podane identyfikatory, także nieistniejące członkostwa
+        instance._removed_memberships = _existing_memberships(instance, reverse, pk_set)
+    elif action == 'pre_clear':
+        if reverse:
+            pk_set = Membership.objects.filter(group_id=instance.pk).values_list('myuser_id', flat=True)
+        else:
+            pk_set = Membership.objects.filter(myuser_id=instance.pk).values_list('group_id', flat=True)
+        instance._removed_memberships = _existing_memberships(instance, reverse, list(pk_set))
+    elif action in ('post_remove', 'post_clear'):
+        removed = getattr(instance, '_removed_memberships', [])
+        instance._removed_memberships = []
+        _adjust([group_id for _, group_id in removed], -1)
+        alert_cache.invalidate_user_groups({user_id for user_id, _ in removed})
+
+
+@receiver(pre_delete, sender=MyUser)
+def release_memberships(sender, instance, **kwargs):
+    """Usunięcie użytkownika kasuje członkostwa kaskadowo, bez sygnału m2m_changed."""
+    _adjust(list(Membership.objects.filter(myuser_id=instance.pk).values_list('group_id', flat=True)), -1)
+
+
+@receiver(post_save, sender=MyUser)
+@receiver(post_delete, sender=MyUser)
+def invalidate_cached_user(sender, instance, **kwargs):
+    """Zmiana hasła, edycja profilu i usunięcie konta unieważniają użytkownika w cache uwierzytelniania."""
+    authentication.invalidate(instance.pk)
+
+
+@receiver(pre_save, sender=Alert)
+def remember_alert_group(sender, instance, **kwargs):
+    """Zmiana grupy komunikatu (np. w panelu administracyjnym) unieważnia także poprzednią grupę."""
+    if instance.pk is not None and not instance._state.adding:
+        instance._previous_group_id = Alert.objects.filter(pk=instance.pk).values_list('group_id', flat=True).first()
+
+
+@receiver(post_save, sender=Alert)
+@receiver(post_delete, sender=Alert)
+def invalidate_group_alerts(sender, instance, **kwargs):
+    """Każdy zapis i usunięcie komunikatu, także kaskadowe, unieważnia cache aktywnych komunikatów grupy."""
+    group_ids = {instance.group_id, getattr(instance, '_previous_group_id', None)} - {None}
+    # Po zatwierdzeniu, aby równoległy odczyt nie zapisał w cache stanu sprzed zmiany
+    transaction.on_commit(lambda: [alert_cache.invalidate_group(group_id) for group_id in group_ids])
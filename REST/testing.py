@@ -0,0 +1,24 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+def count_queries(func, *args, **kwargs):
+    """Zwraca (wynik, liczba zapytań SQL) dla wywołania func."""
+    with CaptureQueriesContext(connection) as context:
+        result = func(*args, **kwargs)
+    return result, len(context.captured_queries)
+
+
+class QueryCountAssertionsMixin:
+    """Mixin dla TestCase sprawdzający, że endpoint nie wykonuje zapytań N+1."""
+
+    def assertConstantQueries(self, request, grow, rounds=2):
+        """
+        Wywołuje request(), następnie rounds razy grow() i ponownie request().
+        Liczba zapytań musi być taka sama niezależnie od ilości danych.
+        """
+        _, expected = count_queries(request)
+        for _ in range(rounds):
+            grow()
+            _, actual = count_queries(request)
+            self.assertEqual(actual, expected, f'Liczba zapytań wzrosła z {expected} do {actual} wraz z danymi')
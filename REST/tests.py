@@ -1,3 +1,1278 @@
-from django.test import TestCase
+import asyncio
+import base64
+import gzip
+import json
+import math
+import random
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from io import BytesIO, StringIO
+from itertools import count
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.core.cache import caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models.signals import pre_delete
+from django.test import TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from REST import alert_cache, authentication, benchmark, blocking, checks, geo, hashing, media, profiling, pubsub, queries, realtime, retention, serializers
+from REST.middleware import ProfilingMiddleware
+from REST.presence import PresenceTracker
+from REST.seeding import seed
+from REST.throttling import InProcessStore
+from REST.models import MyUser, Group, Message, Alert, BlockedUsers, Conversation
+from REST.testing import QueryCountAssertionsMixin
+from REST.utils import get_tokens_for_user
+
+# Szybkie haszowanie, bez ograniczania żądań i bez zapisu obecności w trakcie testu;
+# testy działają w jednym procesie, więc cache 'shared' może być lokalny
+TEST_SETTINGS = {
+    'PASSWORD_HASHERS': ['django.contrib.auth.hashers.MD5PasswordHasher'],
+    'CACHES': {
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'shared'},
+        'users': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'users'},
+    },
+    'THROTTLE_BUCKETS': {},
+    'PRESENCE_FLUSH_INTERVAL': timedelta(days=1),
+}
+
+_names = count()
+
+# Cache z ustawień projektu (Redis), dla testów, które muszą działać na nim, a nie na lokalnym zamienniku
+CONFIGURED_CACHES = settings.CACHES
+
+
+def configured_shared_cache_available():
+    try:
+        caches['shared'].get('availability-check')
+    except Exception:
+        return False
+    return True
+
+
+def make_user(latitude=52.23, longitude=21.01):
+    name = f'user{next(_names)}'
+    return MyUser.objects.create(username=name, email=f'{name}@example.com', firstName=name, lastName='Test',
+                                 date_of_birth=date(1990, 1, 1), latitude=latitude, longitude=longitude,
+                                 password='!')
+
+
+def make_group():
+    return Group.objects.create(name=f'group{next(_names)}', logo_url='', password='secret')
+
+
+def make_alert(user, group, starts_in=timedelta(hours=-1)):
+    now = timezone.now()
+    return Alert.objects.create(user=user, group=group, title='alert', content='test', style='primary',
+                                start_date=now + starts_in, end_date=now + starts_in + timedelta(hours=2))
+
+
+@override_settings(**TEST_SETTINGS)
+class ListQueryCountTests(QueryCountAssertionsMixin, TestCase):
+    """Liczba zapytań endpointów listujących nie zależy od liczby zwracanych obiektów."""
+
+    def setUp(self):
+        self.user = make_user()
+        self.partner = make_user()
+        self.group = make_group()
+        self.user.groups.add(self.group)
+        self.partner.groups.add(self.group)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get(self, path, params=None):
+        # Pusty cache, aby każde żądanie wykonywało pełny zestaw zapytań
+        for cache in caches.all():
+            cache.clear()
+        response = self.client.get('/api/' + path, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response
+
+    def new_member(self):
+        """Nowy użytkownik w grupie self.group i we własnej grupie (zagnieżdżone grupy w profilu)."""
+        user = make_user(latitude=52.24, longitude=21.02)
+        user.groups.add(self.group, make_group())
+        return user
+
+    def test_message_thread(self):
+        def grow():
+            Message.objects.create(sender=self.user, receiver=self.partner, text='a')
+            Message.objects.create(sender=self.partner, receiver=self.user, text='b')
+            self.partner.groups.add(make_group())
+
+        grow()
+        for params in ({}, {'compact': 'true'}, {'limit': 50}, {'limit': 50, 'compact': 'true'}):
+            with self.subTest(**params):
+                self.assertConstantQueries(lambda: self.get('messages/', {'receiver': self.partner.id, **params}),
+                                           grow)
+
+    def test_users_with_distance(self):
+        self.assertConstantQueries(lambda: self.get('list_users_with_distance/'), self.new_member)
+        self.assertConstantQueries(lambda: self.get('list_users_with_distance/', {'limit': 50}), self.new_member)
+
+    def test_users_by_recent_message(self):
+        def grow():
+            Message.objects.create(sender=self.new_member(), receiver=self.user, text='a')
+
+        grow()
+        self.assertConstantQueries(lambda: self.get('list_users_by_recent_message/'), grow)
+
+    def test_group_members(self):
+        path = f'groups/{self.group.id}/users/'
+        self.assertConstantQueries(lambda: self.get(path), self.new_member)
+        for ordering in ('id', 'online', 'distance'):
+            with self.subTest(ordering=ordering):
+                self.assertConstantQueries(
+                    lambda: self.get(path, {'ordering': ordering, 'fields': 'id,groups,online'}), self.new_member)
+
+    def test_group_alerts(self):
+        def grow():
+            group = make_group()
+            self.user.groups.add(group)
+            make_alert(self.new_member(), group)
+            make_alert(self.new_member(), self.group)
+
+        grow()
+        self.assertConstantQueries(lambda: self.get('groups/alerts/'), grow)
+
+    def test_user_alerts(self):
+        def grow():
+            make_alert(self.user, make_group())
+
+        grow()
+        self.assertConstantQueries(lambda: self.get('accounts/alerts/'), grow)
+
+    def test_blocked_users(self):
+        def grow():
+            BlockedUsers.objects.create(user=self.user, blocked_user=self.new_member())
+
+        grow()
+        self.assertConstantQueries(lambda: self.get('accounts/blocked-user/'), grow)
+
+
+@override_settings(**TEST_SETTINGS)
+class MessageWaitTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.partner = make_user()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + get_tokens_for_user(self.user)['access'])
+
+    def wait(self, timeout):
+        return self.client.get('/api/messages/wait/', {'receiver': self.partner.id, 'after_id': 0, 'timeout': timeout})
+
+    def test_rejects_non_finite_timeout(self):
+        for timeout in ('nan', 'inf', '-inf', 'abc'):
+            with self.subTest(timeout=timeout):
+                self.assertEqual(self.wait(timeout).status_code, 400)
+
+    def test_returns_new_messages_without_waiting(self):
+        message = Message.objects.create(sender=self.partner, receiver=self.user, text='a')
+        response = self.wait(0)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['id'] for item in response.json()['results']], [message.id])
+
+
+@override_settings(**TEST_SETTINGS)
+class MessageThreadTests(TestCase):
+    """Strony wątku scalane z obu kierunków rozmowy zachowują kolejność (created_at, id)."""
+
+    def setUp(self):
+        self.user = make_user()
+        self.partner = make_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        start = timezone.now()
+        self.messages = []
+        for index in range(9):
+            sender, receiver = (self.user, self.partner) if index % 3 else (self.partner, self.user)
+            message = Message.objects.create(sender=sender, receiver=receiver, text=str(index))
+            # Co druga para wiadomości ma ten sam czas, aby o kolejności decydowało id
+            Message.objects.filter(pk=message.pk).update(created_at=start + timedelta(seconds=index // 2))
+            self.messages.append(message.id)
+
+    def get(self, params):
+        response = self.client.get('/api/messages/', {'receiver': self.partner.id, **params})
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_full_thread(self):
+        self.assertEqual([item['id'] for item in self.get({})], self.messages)
+
+    def test_history_pages(self):
+        ids = []
+        params = {'limit': 4}
+        while True:
+            data = self.get(params)
+            ids[:0] = [item['id'] for item in data['results']]
+            if not data['has_more']:
+                break
+            params['before_id'] = data['before_id']
+        self.assertEqual(ids, self.messages)
+
+    def test_new_message_pages(self):
+        ids = []
+        params = {'limit': 4, 'after_id': self.messages[0]}
+        while True:
+            data = self.get(params)
+            ids.extend(item['id'] for item in data['results'])
+            if not data['has_more']:
+                break
+            params['after_id'] = data['after_id']
+        self.assertEqual(ids, self.messages[1:])
+
+    def test_messages_to_self_are_not_duplicated(self):
+        note = Message.objects.create(sender=self.user, receiver=self.user, text='note')
+        response = self.client.get('/api/messages/', {'receiver': self.user.id})
+        self.assertEqual([item['id'] for item in response.json()], [note.id])
+        response = self.client.get('/api/messages/', {'receiver': self.user.id, 'limit': 5})
+        self.assertEqual([item['id'] for item in response.json()['results']], [note.id])
+
+
+@override_settings(**TEST_SETTINGS)
+class QueryPlanTests(TestCase):
+    def test_view_queries_use_indexes_without_sorting(self):
+        user, partner = make_user(), make_user()
+        group = make_group()
+        user.groups.add(group)
+        Message.objects.create(sender=user, receiver=partner, text='a')
+        make_alert(user, group)
+        call_command('check_query_plans', stdout=StringIO())
+
+
+@override_settings(**TEST_SETTINGS)
+class SeedCommandTests(TestCase):
+    def test_invalid_now_is_rejected(self):
+        for args in (['--now', 'yesterday'], ['--now=2024-13-01']):
+            with self.subTest(args=args), self.assertRaises(CommandError):
+                call_command('seed', *args, '--users', '0', stdout=StringIO())
+        self.assertFalse(MyUser.objects.exists())
+
+
+class InProcessStoreTests(TestCase):
+    @override_settings(THROTTLE_MAX_ENTRIES=10)
+    def test_prune_is_amortized_while_buckets_are_active(self):
+        store = InProcessStore()
+        with mock.patch.object(store, 'prune', wraps=store.prune) as prune:
+            for index in range(1000):
+                store.take(f'client-{index}', burst=5, rate=0.001)
+        # Wszystkie buckety są aktywne, więc każde przeglądanie kończy się podwojeniem progu
+        self.assertLessEqual(prune.call_count, 7)
+        self.assertEqual(len(store), 1000)
+
+    @override_settings(THROTTLE_MAX_ENTRIES=10)
+    def test_prune_drops_refilled_buckets(self):
+        store = InProcessStore()
+        for index in range(11):
+            store.take(f'client-{index}', burst=1, rate=1000)
+        # Jedenasty wpis przekroczył próg, ale żaden bucket nie był jeszcze pełny
+        self.assertEqual((len(store), store.prune_at), (11, 22))
+        store.prune(time.monotonic() + 1)
+        self.assertEqual((len(store), store.prune_at), (0, 10))
+
+
+@override_settings(**TEST_SETTINGS)
+class PresenceTests(TestCase):
+    def test_flush_after_account_deletion(self):
+        tracker = PresenceTracker()
+        other = make_user()
+        user = make_user()
+        client = APIClient()
+        client.force_authenticate(user)
+        with mock.patch('REST.middleware.tracker', tracker):
+            tracker.heartbeat(other.id)
+            response = client.delete('/api/accounts/delete-account/')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(tracker.flush(), 1)
+        other.refresh_from_db()
+        self.assertEqual(other.last_activity, tracker.last_seen(other.id))
+
+    def test_heartbeat_without_user_is_ignored(self):
+        tracker = PresenceTracker()
+        tracker.heartbeat(None)
+        self.assertEqual(tracker.flush(), 0)
+
+
+@override_settings(**TEST_SETTINGS)
+class BlockingTests(TestCase):
+    def setUp(self):
+        caches['shared'].clear()
+        self.user = make_user()
+        self.other = make_user()
+        self.stranger = make_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_block_sets_cover_both_directions(self):
+        BlockedUsers.objects.create(user=self.user, blocked_user=self.other)
+        BlockedUsers.objects.create(user=self.stranger, blocked_user=self.user)
+        with self.assertNumQueries(1):
+            self.assertEqual(blocking.get_block_sets(self.user.id), ({self.other.id}, {self.stranger.id}))
+        with self.assertNumQueries(0):
+            self.assertTrue(blocking.is_either_blocked(self.user.id, self.other.id))
+            self.assertTrue(blocking.is_either_blocked(self.user.id, self.stranger.id))
+            self.assertEqual(blocking.blocked_me(self.user.id), {self.stranger.id})
+        self.assertFalse(blocking.is_either_blocked(self.other.id, self.stranger.id))
+
+    def test_block_and_unblock_invalidate_both_sides(self):
+        self.assertFalse(blocking.is_either_blocked(self.user.id, self.other.id))
+        self.assertFalse(blocking.is_either_blocked(self.other.id, self.user.id))
+        response = self.client.post('/api/accounts/blocked-user/', {'blocked_user': self.other.id}, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertTrue(blocking.is_either_blocked(self.user.id, self.other.id))
+        self.assertEqual(blocking.blocked_me(self.other.id), {self.user.id})
+
+        response = self.client.delete('/api/accounts/blocked-user/', {'blocked_user': self.other.id}, format='json')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(blocking.is_either_blocked(self.user.id, self.other.id))
+        self.assertEqual(blocking.blocked_me(self.other.id), set())
+
+
+@skipUnless(configured_shared_cache_available(), 'wspólny cache z ustawień (Redis) jest niedostępny')
+@override_settings(CACHES=CONFIGURED_CACHES)
+class ConfiguredCacheBlockingTests(BlockingTests):
+    """Jak BlockingTests, ale na cache z ustawień: odczyt z ciepłego cache bez zapytań do bazy."""
+
+
+class SharedCacheCheckTests(TestCase):
+    def errors(self, backend):
+        with override_settings(CACHES={'default': {'BACKEND': backend}}, BLOCKS_CACHE='default',
+                               ALERTS_CACHE='default'):
+            return [error.id for error in checks.check_shared_caches(None)]
+
+    def test_only_redis_or_memcached_is_accepted(self):
+        for backend in checks.UNSUITABLE_SHARED_CACHES:
+            with self.subTest(backend=backend):
+                self.assertEqual(self.errors(backend), ['REST.E001', 'REST.E001'])
+        for backend in ('django.core.cache.backends.redis.RedisCache',
+                        'django.core.cache.backends.memcached.PyMemcacheCache'):
+            with self.subTest(backend=backend):
+                self.assertEqual(self.errors(backend), [])
+
+
+@override_settings(**TEST_SETTINGS)
+class FastSerializationTests(TestCase):
+    """Szybka serializacja list daje ten sam JSON co serializery DRF."""
+
+    def setUp(self):
+        self.user = make_user(latitude=52.5, longitude=21)
+        self.partner = make_user(latitude=50.06, longitude=19.94)
+        MyUser.objects.filter(pk=self.partner.pk).update(
+            gender='F', description='opis', profile_picture='/api/media/' + 'a' * 64 + '.png')
+        self.group = make_group()
+        self.user.groups.add(self.group, make_group())
+        self.partner.groups.add(self.group)
+        Message.objects.create(sender=self.user, receiver=self.partner, text='a')
+        Message.objects.create(sender=self.partner, receiver=self.user, text='zażółć')
+        make_alert(self.user, self.group)
+        make_alert(self.partner, self.group, starts_in=timedelta(days=-2))
+
+    def assertSameJSON(self, fast, slow):
+        renderer = JSONRenderer()
+        self.assertEqual(renderer.render(fast), renderer.render(slow))
+
+    def test_lists_match_drf_serializers(self):
+        messages = queries.thread_messages(self.user.id, self.partner.id)
+        self.assertSameJSON(serializers.message_list_data(messages),
+                            serializers.MessageSerializer(messages, many=True).data)
+        people = list(queries.people().order_by('id'))
+        self.assertSameJSON([serializers.user_with_distance_data(user) for user in people],
+                            [serializers.UserWithDistanceSerializer(user).data for user in people])
+        self.assertSameJSON([serializers.person_data(user) for user in people],
+                            serializers.PersonSerializer(people, many=True).data)
+        alerts = list(queries.alerts().order_by('id'))
+        self.assertSameJSON(serializers.alert_list_data(alerts), serializers.AlertSerializer(alerts, many=True).data)
+
+    def test_projected_person_matches_drf_fields(self):
+        user = queries.people().get(pk=self.partner.pk)
+        full = serializers.PersonSerializer(user).data
+        for fields in (['id'], ['id', 'groups', 'latitude'], list(serializers.PERSON_FIELDS)):
+            with self.subTest(fields=fields):
+                ordered = [field for field in full if field in fields]
+                self.assertSameJSON(serializers.projected_person_data(user, ordered),
+                                    {field: full[field] for field in ordered})
+
+
+@override_settings(**TEST_SETTINGS)
+class CachedUserTests(TestCase):
+    """Wpis CachedJWTAuthentication znika po każdej zmianie użytkownika."""
+
+    def setUp(self):
+        self.user = make_user()
+        self.user.set_password('secret')
+        self.user.save(update_fields=['password'])
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + get_tokens_for_user(self.user)['access'])
+        self.key = authentication.CACHE_KEY.format(self.user.id)
+        response = self.client.get(f'/api/accounts/person/{self.user.id}/')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertIsNotNone(authentication._cache().get(self.key))
+
+    def test_password_change(self):
+        # Zmiana profilu w innym procesie, niewidoczna w użytkowniku z cache
+        MyUser.objects.filter(pk=self.user.pk).update(description='z innego procesu')
+        response = self.client.post('/api/accounts/change-password',
+                                    {'current_password': 'secret', 'new_password': 'changed'}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertIsNone(authentication._cache().get(self.key))
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.description, 'z innego procesu')
+        self.assertTrue(self.user.check_password('changed'))
+
+    def test_profile_patch(self):
+        response = self.client.patch(f'/api/accounts/person/{self.user.id}/patch/', {'description': 'nowy'},
+                                     format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertIsNone(authentication._cache().get(self.key))
+
+    def test_account_delete(self):
+        response = self.client.delete('/api/accounts/delete-account/')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertIsNone(authentication._cache().get(self.key))
+        self.assertEqual(self.client.get(f'/api/accounts/person/{self.user.id}/').status_code, 401)
+
+
+@override_settings(**TEST_SETTINGS)
+class ProfilingTests(TestCase):
+    def setUp(self):
+        profiling.reset()
+        self.addCleanup(profiling.reset)
+        self.user = make_user()
+        self.user.groups.add(make_group())
+        self.admin = make_user()
+        MyUser.objects.filter(pk=self.admin.pk).update(is_staff=True)
+        self.admin.refresh_from_db()
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def test_only_list_functions_are_timed(self):
+        # Funkcje pojedynczych wierszy są wywoływane w pętli, więc nie mają opakowania
+        for function in (serializers.group_data, serializers.person_data, serializers.projected_person_data,
+                         serializers.user_with_distance_data, serializers.compact_message_data):
+            self.assertFalse(hasattr(function, '__wrapped__'), function.__name__)
+        self.assertTrue(hasattr(serializers.message_list_data, '__wrapped__'))
+
+    def test_disabled_middleware_is_not_used(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            ProfilingMiddleware(lambda request: None)
+        self.assertEqual(self.client_for(self.user).get('/api/list_users_with_distance/').status_code, 200)
+        self.assertEqual(profiling.snapshot()['endpoints'], {})
+
+    @override_settings(PROFILING_ENABLED=True, PROFILING_CPROFILE_SAMPLE_RATE=0.0, PROFILING_DUMP_PATH=None)
+    def test_requests_are_recorded_per_route(self):
+        client = self.client_for(self.user)
+        for _ in range(2):
+            self.assertEqual(client.get('/api/list_users_with_distance/').status_code, 200)
+        endpoint = profiling.snapshot()['endpoints']['api/list_users_with_distance/']
+        self.assertEqual(endpoint['statuses'], {'200': 2})
+        for metric in ('wall_ms', 'db_ms', 'serializer_ms', 'queries', 'response_bytes'):
+            self.assertEqual(endpoint[metric]['count'], 2, metric)
+        self.assertGreater(endpoint['queries']['max'], 0)
+        self.assertGreater(endpoint['response_bytes']['max'], 0)
+
+    @override_settings(PROFILING_ENABLED=True, PROFILING_CPROFILE_SAMPLE_RATE=0.0, PROFILING_DUMP_PATH=None)
+    def test_stats_endpoint(self):
+        self.client_for(self.user).get('/api/list_users_with_distance/')
+        client = self.client_for(self.admin)
+        self.assertEqual(self.client_for(self.user).get('/api/profiling/stats/').status_code, 403)
+
+        data = client.get('/api/profiling/stats/').json()
+        self.assertIn('api/list_users_with_distance/', data['endpoints'])
+        lines = client.get('/api/profiling/stats/', {'output': 'jsonl'}).content.decode().splitlines()
+        routes = {json.loads(line)['route'] for line in lines}
+        self.assertIn('api/list_users_with_distance/', routes)
+
+        self.assertEqual(client.delete('/api/profiling/stats/').status_code, 204)
+        # Po wyzerowaniu zostaje tylko samo żądanie DELETE
+        self.assertEqual(list(profiling.snapshot()['endpoints']), ['api/profiling/stats/'])
+
+
+@override_settings(**TEST_SETTINGS)
+class BenchmarkTests(TestCase):
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        storage = override_settings(PROFILE_PICTURE_ROOT=root.name)
+        storage.enable()
+        self.addCleanup(storage.disable)
+
+    def test_all_scenarios_run_without_errors(self):
+        dataset = seed(users=20, groups=3, messages=60, alerts=5, blocks=3, random_seed=0)
+        report = benchmark.run(dataset, requests=1, warmup=1)
+        self.assertEqual(report['missing_routes'], [])
+        self.assertEqual({f'{result["method"]} {result["route"]}': result['error_statuses']
+                          for result in report['results'] if result['errors']}, {})
+        self.assertEqual(report['results'][-1]['route'], 'accounts/delete-account/')
+
+    def test_request_exception_is_counted_as_error(self):
+        dataset = seed(users=5, groups=1, messages=5, alerts=0, blocks=0, random_seed=0)
+        failing = benchmark.Scenario('failing/', 'GET', lambda context, i: (1 / 0, None))
+        with mock.patch.object(benchmark, 'SCENARIOS', [failing, *benchmark.SCENARIOS[:1]]):
+            report = benchmark.run(dataset, requests=2, warmup=0)
+        self.assertEqual(report['results'][0]['errors'], 2)
+        self.assertEqual(report['results'][0]['error_statuses'], ['ZeroDivisionError'])
+        self.assertIsNone(report['results'][0]['p50_ms'])
+        self.assertEqual(report['results'][1]['errors'], 0)
+
+
+@override_settings(**TEST_SETTINGS)
+class PasswordHashingTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.client = APIClient()
+
+    def login(self, password='secret'):
+        return self.client.post('/api/accounts/login', {'email': self.user.email, 'password': password})
+
+    @override_settings(PASSWORD_HASHERS=['REST.hashing.PBKDF2PasswordHasher',
+                                         'django.contrib.auth.hashers.MD5PasswordHasher'],
+                       PASSWORD_HASH_ITERATIONS=1000)
+    def test_login_rehashes_outdated_password(self):
+        MyUser.objects.filter(pk=self.user.pk).update(password=hashers.make_password('secret', hasher='md5'))
+        self.assertEqual(self.login().status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$1000$'))
+        self.assertEqual(self.login().status_code, 200)
+
+    @override_settings(PASSWORD_HASHERS=['REST.hashing.PBKDF2PasswordHasher'], PASSWORD_HASH_ITERATIONS=1000)
+    def test_wrong_password_is_not_rehashed(self):
+        stored = hashing.PBKDF2PasswordHasher().encode('secret', 'salt', iterations=500)
+        MyUser.objects.filter(pk=self.user.pk).update(password=stored)
+        self.assertEqual(self.login('wrong').status_code, 401)
+        self.assertEqual(MyUser.objects.get(pk=self.user.pk).password, stored)
+
+    @override_settings(PASSWORD_HASHING_QUEUE_TIMEOUT=0)
+    def test_full_queue_returns_503(self):
+        self.user.set_password('secret')
+        self.user.save(update_fields=['password'])
+        executor, _ = hashing._pool()
+        slots = threading.BoundedSemaphore(1)
+        slots.acquire()
+        with mock.patch.object(hashing, '_pool', return_value=(executor, slots)):
+            response = self.login()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.data['detail'].code, 'hashing_unavailable')
+
+    def test_group_save_keeps_hashed_password(self):
+        group = make_group()
+        stored = group.password
+        self.assertNotEqual(stored, 'secret')
+        group = Group.objects.get(pk=group.pk)
+        group.name = 'renamed'
+        with mock.patch.object(hashing, 'make_password', wraps=hashing.make_password) as make_password:
+            group.save()
+        make_password.assert_not_called()
+        group.refresh_from_db()
+        self.assertEqual(group.password, stored)
+        self.assertTrue(group.check_password('secret'))
+
+    def test_group_save_hashes_new_password(self):
+        group = Group.objects.get(pk=make_group().pk)
+        group.password = 'changed'
+        group.save()
+        group.refresh_from_db()
+        self.assertTrue(group.check_password('changed'))
+        self.assertFalse(group.check_password('secret'))
+
+
+@override_settings(**TEST_SETTINGS)
+class ConversationTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def send(self, sender, receiver, seconds=0):
+        message = Message.objects.create(sender=sender, receiver=receiver, text='hi')
+        created_at = timezone.now() + timedelta(seconds=seconds)
+        Message.objects.filter(pk=message.pk).update(created_at=created_at)
+        Conversation.objects.filter(last_message=message).update(last_message_at=created_at)
+        return message
+
+    def inbox(self):
+        response = self.client.get('/api/list_users_by_recent_message/')
+        self.assertEqual(response.status_code, 200)
+        return [(item['id'], item['unread_count']) for item in response.json()]
+
+    def updates(self, params):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/messages/', params)
+        self.assertEqual(response.status_code, 200)
+        return [query['sql'] for query in context.captured_queries if query['sql'].startswith('UPDATE')]
+
+    def test_inbox_ordered_by_latest_message_with_unread_counts(self):
+        first, second, third = make_user(), make_user(), make_user()
+        self.send(first, self.user, seconds=1)
+        self.send(self.user, second, seconds=2)
+        self.send(third, self.user, seconds=3)
+        self.send(first, self.user, seconds=4)
+        self.assertEqual(self.inbox(), [(first.id, 2), (third.id, 1), (second.id, 0)])
+
+    def test_newest_page_marks_conversation_read(self):
+        partner = make_user()
+        for seconds in range(3):
+            self.send(partner, self.user, seconds=seconds)
+        self.assertEqual(len(self.updates({'receiver': partner.id, 'limit': 2})), 1)
+        self.assertEqual(self.inbox(), [(partner.id, 0)])
+        self.assertEqual(Conversation.objects.get(user=partner, partner=self.user).unread_count, 0)
+
+    def test_history_and_empty_poll_do_not_update(self):
+        partner = make_user()
+        messages = [self.send(partner, self.user, seconds=seconds) for seconds in range(3)]
+        self.assertEqual(self.updates({'receiver': partner.id, 'before_id': messages[-1].id}), [])
+        self.assertEqual(self.updates({'receiver': partner.id, 'after_id': messages[-1].id}), [])
+        self.assertEqual(self.inbox(), [(partner.id, 3)])
+        self.assertEqual(len(self.updates({'receiver': partner.id, 'after_id': messages[0].id})), 1)
+        self.assertEqual(self.inbox(), [(partner.id, 0)])
+
+    def test_backfill_rebuilds_conversations_and_keeps_unread(self):
+        first, second = make_user(), make_user()
+        self.send(first, self.user, seconds=1)
+        latest = self.send(self.user, first, seconds=2)
+        self.send(second, self.user, seconds=3)
+        expected = sorted(Conversation.objects.values_list('user_id', 'partner_id', 'last_message_id',
+                                                           'last_message_at', 'unread_count'))
+        Conversation.objects.update(last_message=None, last_message_at=timezone.now() - timedelta(days=1))
+        Conversation.objects.filter(user=second).delete()
+        call_command('backfill_conversations', batch_size=1, stdout=StringIO())
+        rows = sorted(Conversation.objects.values_list('user_id', 'partner_id', 'last_message_id',
+                                                       'last_message_at', 'unread_count'))
+        self.assertEqual(rows, expected)
+        self.assertEqual(Conversation.objects.get(user=first, partner=self.user).last_message_id, latest.id)
+        self.assertEqual(self.inbox(), [(second.id, 1), (first.id, 1)])
+
+
+@override_settings(**TEST_SETTINGS)
+class RealtimeTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.partner = make_user()
+        pubsub.set_backend(pubsub.InProcessBackend())
+        self.addCleanup(pubsub.set_backend, None)
+
+    def scope(self, query_string=b'', headers=()):
+        return {'type': 'websocket', 'path': realtime.REALTIME_PATH, 'query_string': query_string,
+                'headers': list(headers)}
+
+    def connect(self, scope):
+        """Łączy się z aplikacją WebSocket i zwraca zdarzenia wysłane do klienta."""
+        async def session():
+            incoming = asyncio.Queue()
+            sent = []
+            await incoming.put({'type': 'websocket.connect'})
+            await incoming.put({'type': 'websocket.disconnect', 'code': 1000})
+
+            async def send(event):
+                sent.append(event)
+
+            await realtime.websocket_application(scope, incoming.get, send)
+            return sent
+
+        return async_to_sync(session)()
+
+    def test_rejects_missing_or_invalid_token(self):
+        refresh = get_tokens_for_user(self.user)['refresh']
+        scopes = {
+            'missing': self.scope(),
+            'malformed': self.scope(b'token=abc'),
+            'refresh token': self.scope(f'token={refresh}'.encode()),
+            'wrong header type': self.scope(headers=[(b'authorization', b'Token abc')]),
+        }
+        for name, scope in scopes.items():
+            with self.subTest(name):
+                self.assertEqual(self.connect(scope), [{'type': 'websocket.close',
+                                                        'code': realtime.CLOSE_UNAUTHORIZED}])
+        self.assertFalse(pubsub.get_backend().has_subscribers())
+
+    def test_accepts_token_in_query_string_or_header(self):
+        access = get_tokens_for_user(self.user)['access']
+        for scope in (self.scope(f'token={access}'.encode()),
+                      self.scope(headers=[(b'authorization', f'Bearer {access}'.encode())])):
+            self.assertEqual(self.connect(scope), [{'type': 'websocket.accept'}])
+
+    def test_message_is_published_to_subscriber_on_commit(self):
+        client = APIClient()
+        client.force_authenticate(self.partner)
+        scope = self.scope(f'token={get_tokens_for_user(self.user)["access"]}'.encode())
+
+        def post_message():
+            with self.captureOnCommitCallbacks() as callbacks:
+                response = client.post('/api/messages/', {'receiver': self.user.id, 'text': 'hi'}, format='json')
+            self.assertEqual(response.status_code, 201)
+            return callbacks
+
+        async def session():
+            incoming = asyncio.Queue()
+            sent = asyncio.Queue()
+            await incoming.put({'type': 'websocket.connect'})
+            connection_task = asyncio.ensure_future(
+                realtime.websocket_application(scope, incoming.get, sent.put))
+            self.assertEqual(await asyncio.wait_for(sent.get(), 1), {'type': 'websocket.accept'})
+
+            callbacks = await sync_to_async(post_message)()
+            await asyncio.sleep(0)
+            # Przed zatwierdzeniem transakcji nic nie jest publikowane
+            self.assertTrue(sent.empty())
+            for callback in callbacks:
+                await sync_to_async(callback)()
+            event = await asyncio.wait_for(sent.get(), 1)
+
+            await incoming.put({'type': 'websocket.disconnect', 'code': 1000})
+            await asyncio.wait_for(connection_task, 1)
+            return event
+
+        event = async_to_sync(session)()
+        message = Message.objects.get(sender=self.partner, receiver=self.user)
+        self.assertEqual(event['type'], 'websocket.send')
+        self.assertEqual(json.loads(event['text']), {'type': 'message',
+                                                     'message': serializers.compact_message_data(message)})
+        self.assertFalse(pubsub.get_backend().is_connected(self.user.id))
+
+
+@override_settings(**TEST_SETTINGS, RETENTION_BATCH_SIZE=3)
+class RetentionTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.partner = make_user()
+        archive_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(archive_dir.cleanup)
+        self.archive_dir = archive_dir.name
+        self.policy = retention.RetentionPolicy('messages', after=timedelta(days=30))
+        old = timezone.now() - timedelta(days=60)
+        self.expired = []
+        for index in range(7):
+            message = Message.objects.create(sender=self.user, receiver=self.partner, text=str(index))
+            Message.objects.filter(pk=message.pk).update(created_at=old + timedelta(minutes=index))
+            self.expired.append(message.id)
+        self.recent = Message.objects.create(sender=self.user, receiver=self.partner, text='recent')
+
+    def apply(self):
+        return retention.apply_policy(self.policy, archive_dir=self.archive_dir)
+
+    def test_deletes_in_batches_of_configured_size(self):
+        table = connection.ops.quote_name(Message._meta.db_table)
+        with CaptureQueriesContext(connection) as context:
+            stats = self.apply()
+        deletes = [query['sql'] for query in context.captured_queries
+                   if query['sql'].startswith(f'DELETE FROM {table}')]
+        self.assertEqual((stats['batches'], stats['archived'], stats['deleted']), (3, 7, 7))
+        self.assertEqual(len(deletes), 3)
+        self.assertEqual(list(Message.objects.values_list('id', flat=True)), [self.recent.id])
+
+    def test_rows_are_archived_before_delete(self):
+        archived = []
+
+        class Archive:
+            def writelines(self, lines):
+                archived.extend(json.loads(line)['id'] for line in lines)
+
+            def flush(self):
+                pass
+
+            def close(self):
+                pass
+
+        def check_archived(sender, instance, **kwargs):
+            self.assertIn(instance.id, archived)
+
+        pre_delete.connect(check_archived, sender=Message)
+        self.addCleanup(pre_delete.disconnect, check_archived, sender=Message)
+        with mock.patch.object(retention.gzip, 'open', return_value=Archive()):
+            self.apply()
+        self.assertEqual(archived, self.expired)
+
+    def test_second_run_is_idempotent(self):
+        first = self.apply()
+        with gzip.open(first['archive'], 'rt', encoding='utf-8') as archive:
+            self.assertEqual([json.loads(line)['id'] for line in archive], self.expired)
+        second = self.apply()
+        self.assertEqual((second['batches'], second['archived'], second['deleted'], second['archive']),
+                         (0, 0, 0, None))
+        self.assertEqual(list(Message.objects.values_list('id', flat=True)), [self.recent.id])
+
+
+@override_settings(**TEST_SETTINGS)
+class GeoTests(TestCase):
+    def brute_force(self, latitude, longitude, radius_km=geo.MAX_DISTANCE_KM):
+        return sorted((distance, user_id) for distance, user_id in
+                      ((geo.haversine_distance(latitude, longitude, lat, lon), user_id)
+                       for user_id, lat, lon in MyUser.objects.values_list('id', 'latitude', 'longitude'))
+                      if distance <= radius_km)
+
+    def nearest(self, latitude, longitude, **kwargs):
+        return [(distance, user.id) for distance, user in
+                geo.nearest_users(MyUser.objects.all(), latitude, longitude, **kwargs)]
+
+    @skipUnless(geo.np is not None, 'NumPy nie jest zainstalowany')
+    def test_numpy_distances_match_pure_python(self):
+        generator = random.Random(0)
+        points = [(generator.uniform(-90, 90), generator.uniform(-180, 180)) for _ in range(2000)]
+        # Punkty dokładnie co pełny kilometr wzdłuż południka, antypody i ten sam punkt
+        points += [(52.0 + km / geo.EARTH_RADIUS_KM * 180 / math.pi, 21.0) for km in range(1, 200)]
+        points += [(-52.0, -159.0), (52.0, 21.0)]
+        latitudes, longitudes = [lat for lat, _ in points], [lon for _, lon in points]
+        expected = [geo.haversine_distance(52.0, 21.0, lat, lon) for lat, lon in points]
+        self.assertEqual(geo.haversine_distances(52.0, 21.0, latitudes, longitudes), expected)
+        with mock.patch.object(geo, 'np', None):
+            self.assertEqual(geo.haversine_distances(52.0, 21.0, latitudes, longitudes), expected)
+
+    def test_nearest_users_match_brute_force(self):
+        generator = random.Random(1)
+        for _ in range(60):
+            make_user(52.23 + generator.uniform(-1, 1), 21.01 + generator.uniform(-1.5, 1.5))
+        for radius_km in (0, 5, 20, 50, 200):
+            with self.subTest(radius_km=radius_km):
+                self.assertEqual(self.nearest(52.23, 21.01, radius_km=radius_km),
+                                 self.brute_force(52.23, 21.01, radius_km))
+        for limit in (1, 5, 20, 100):
+            with self.subTest(limit=limit):
+                self.assertEqual(self.nearest(52.23, 21.01, limit=limit, initial_radius_km=1),
+                                 self.brute_force(52.23, 21.01)[:limit])
+
+    def test_neighbours_across_geohash_cell_boundary(self):
+        # Pary punktów po dwóch stronach granicy komórek geohash (także na równiku,
+        # południku zerowym i południku 180°)
+        pairs = [((52.0, 22.5 + 1e-6), (52.0, 22.5 - 0.005)),
+                 ((1e-5, 1e-5), (-0.001, -0.001)),
+                 ((10.0, 179.999), (10.0, -179.999))]
+        for (latitude, longitude), neighbour in pairs + [(neighbour, point) for point, neighbour in pairs]:
+            with self.subTest(point=(latitude, longitude)):
+                self.assertNotEqual(geo.encode_geohash(latitude, longitude, 2), geo.encode_geohash(*neighbour, 2))
+                MyUser.objects.all().delete()
+                user = make_user(*neighbour)
+                make_user(latitude + 1, longitude)
+                self.assertEqual(self.nearest(latitude, longitude, radius_km=2), [(0, user.id)])
+                self.assertEqual(self.nearest(latitude, longitude, limit=1), [(0, user.id)])
+
+
+@override_settings(**TEST_SETTINGS)
+class CompactMessagesTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.partner = make_user()
+        self.partner.groups.add(make_group())
+        self.messages = [Message.objects.create(sender=sender, receiver=receiver, text=str(index))
+                         for index, (sender, receiver) in enumerate([(self.user, self.partner),
+                                                                     (self.partner, self.user)] * 2)]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get(self, **params):
+        response = self.client.get('/api/messages/', {'receiver': self.partner.id, **params})
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def assertCompact(self, data, full):
+        self.assertEqual([item['id'] for item in data['results']], [message.id for message in self.messages])
+        for item, message in zip(data['results'], full):
+            self.assertEqual(item, {'id': message['id'], 'sender_id': message['sender']['id'],
+                                    'receiver_id': message['receiver']['id'], 'text': message['text'],
+                                    'created_at': message['created_at']})
+        # Każdy profil tylko raz, w tej samej postaci co w pełnej odpowiedzi
+        profiles = {str(message[role]['id']): message[role] for message in full for role in ('sender', 'receiver')}
+        self.assertEqual(data['users'], profiles)
+        self.assertEqual(set(data['users']), {str(self.user.id), str(self.partner.id)})
+
+    def test_full_thread(self):
+        data = self.get(compact='true')
+        self.assertEqual(set(data), {'results', 'users'})
+        self.assertCompact(data, self.get())
+
+    def test_paginated_thread(self):
+        data = self.get(compact='1', limit=10)
+        full = self.get(limit=10)
+        self.assertEqual(set(data), set(full) | {'users'})
+        self.assertEqual({key: data[key] for key in ('before_id', 'after_id', 'has_more')},
+                         {key: full[key] for key in ('before_id', 'after_id', 'has_more')})
+        self.assertCompact(data, full['results'])
+
+
+@override_settings(**TEST_SETTINGS)
+class SessionlessPathsTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.user.set_password('secret')
+        self.user.save(update_fields=['password'])
+        self.client = APIClient()
+
+    def request(self, method, path, data=None, **headers):
+        with CaptureQueriesContext(connection) as context:
+            response = getattr(self.client, method)(path, data, **headers)
+        session_queries = [query['sql'] for query in context.captured_queries if 'django_session' in query['sql']]
+        return response, session_queries
+
+    @override_settings(JWT_ONLY_LOGIN=True, SESSIONLESS_PATHS=['/api/accounts/'])
+    def test_login_and_account_requests_without_session(self):
+        response, session_queries = self.request('post', '/api/accounts/login',
+                                                 {'email': self.user.email, 'password': 'secret'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(session_queries, [])
+        self.assertEqual(dict(response.cookies), {})
+
+        # Klient z przeglądarki może nadal przesyłać starą sesję - nie jest odczytywana
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = 'stale'
+        response, session_queries = self.request('get', f'/api/accounts/person/{self.user.id}/',
+                                                 HTTP_AUTHORIZATION=f'Bearer {response.data["access"]}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(session_queries, [])
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, response.cookies)
+
+    @override_settings(JWT_ONLY_LOGIN=False)
+    def test_login_creates_session_without_jwt_only_login(self):
+        response, session_queries = self.request('post', '/api/accounts/login',
+                                                 {'email': self.user.email, 'password': 'secret'})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(session_queries, [])
+        self.assertIn(settings.SESSION_COOKIE_NAME, response.cookies)
+
+
+def png_data_uri(size):
+    picture = BytesIO()
+    Image.new('RGB', (size, size), (10, 120, 200)).save(picture, 'PNG')
+    return 'data:image/png;base64,' + base64.b64encode(picture.getvalue()).decode()
+
+
+@override_settings(**TEST_SETTINGS)
+class ProfilePictureTests(TestCase):
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        storage = override_settings(PROFILE_PICTURE_ROOT=root.name, PROFILE_THUMBNAIL_SIZE=64)
+        storage.enable()
+        self.addCleanup(storage.disable)
+        self.user = make_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def patch(self, picture):
+        return self.client.patch(f'/api/accounts/person/{self.user.id}/patch/', {'profile_picture': picture},
+                                 format='json')
+
+    def test_thumbnail_is_downscaled(self):
+        response = self.patch(png_data_uri(256))
+        self.assertEqual(response.status_code, 200, response.content)
+        thumbnail = response.json()['profile_thumbnail']
+        self.assertNotEqual(thumbnail, response.json()['profile_picture'])
+        with Image.open(media.file_path(thumbnail.rsplit('/', 1)[-1])) as image:
+            self.assertEqual(image.size, (64, 64))
+
+    def test_unreadable_image_is_rejected(self):
+        picture = 'data:image/png;base64,' + base64.b64encode(b'\x89PNG\r\n\x1a\n' + bytes(256)).decode()
+        self.assertEqual(self.patch(picture).status_code, 400)
+        with self.assertRaises(media.InvalidImage):
+            media.store_profile_picture(picture)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.profile_picture, '')
+
+    def legacy_picture(self):
+        # Wiersz sprzed magazynu zdjęć, z data URI, którego Pillow nie potrafi odczytać
+        picture = 'data:image/png;base64,' + base64.b64encode(b'not an image').decode()
+        MyUser.objects.filter(pk=self.user.pk).update(profile_picture=picture)
+        self.user.refresh_from_db()
+        return picture
+
+    def test_password_change_with_legacy_picture(self):
+        picture = self.legacy_picture()
+        self.user.set_password('secret')
+        self.user.save(update_fields=['password'])
+        response = self.client.post('/api/accounts/change-password',
+                                    {'current_password': 'secret', 'new_password': 'changed'}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('changed'))
+        self.assertEqual(self.user.profile_picture, picture)
+
+    def test_profile_patch_with_legacy_picture(self):
+        self.legacy_picture()
+        response = self.client.patch(f'/api/accounts/person/{self.user.id}/patch/', {'description': 'x'},
+                                     format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('profile_picture', response.json())
+        self.assertEqual(self.patch('').status_code, 200)
+
+    def test_migration_clears_legacy_picture(self):
+        self.legacy_picture()
+        call_command('migrate_profile_pictures', stdout=StringIO())
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.profile_picture, '')
+        self.user.save()
+
+
+class MemberCountAssertionsMixin:
+    def assertMemberCounts(self, *groups):
+        for group in groups:
+            group.refresh_from_db()
+            self.assertEqual(group.member_count, group.users.count(), group.name)
+
+
+@override_settings(**TEST_SETTINGS)
+class MemberCountTests(MemberCountAssertionsMixin, TestCase):
+    """Group.member_count utrzymywany przez REST.signals jest zawsze równy liczbie członków."""
+
+    def setUp(self):
+        self.user = make_user()
+        self.other = make_user()
+        self.groups = [make_group() for _ in range(3)]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def join(self, group, password='secret'):
+        return self.client.post('/api/group/join/', {'group_id': group.id, 'password': password}, format='json')
+
+    def leave(self, group):
+        return self.client.delete('/api/group/leave/', {'group_id': group.id}, format='json')
+
+    def test_join_and_rejoin(self):
+        group = self.groups[0]
+        self.assertEqual(self.join(group).status_code, 200)
+        self.assertEqual(self.join(group).status_code, 200)
+        self.assertEqual(self.join(group, password='wrong').status_code, 400)
+        self.other.groups.add(group)
+        self.assertMemberCounts(group)
+        self.assertEqual(group.member_count, 2)
+
+    def test_leave(self):
+        group = self.groups[0]
+        self.user.groups.add(group)
+        self.assertEqual(self.leave(group).status_code, 200)
+        # Opuszczenie grupy, do której użytkownik nie należy, nie zmienia licznika
+        self.assertEqual(self.leave(group).status_code, 200)
+        self.other.groups.remove(group)
+        self.assertMemberCounts(group)
+        self.assertEqual(group.member_count, 0)
+
+    def test_clear(self):
+        self.user.groups.add(*self.groups)
+        self.other.groups.add(*self.groups)
+        self.user.groups.clear()
+        self.assertMemberCounts(*self.groups)
+        self.groups[0].users.clear()
+        self.assertMemberCounts(*self.groups)
+        self.assertEqual([group.member_count for group in self.groups], [0, 1, 1])
+
+    def test_set(self):
+        first, second, third = self.groups
+        self.user.groups.set([first, second])
+        self.user.groups.set([second, third])
+        self.assertMemberCounts(*self.groups)
+        first.users.set([self.user, self.other])
+        second.users.set([self.other])
+        self.assertMemberCounts(*self.groups)
+        self.assertEqual([group.member_count for group in self.groups], [2, 1, 1])
+
+    def test_user_delete(self):
+        self.user.groups.add(*self.groups)
+        self.other.groups.add(self.groups[0])
+        self.user.delete()
+        self.assertMemberCounts(*self.groups)
+        self.assertEqual([group.member_count for group in self.groups], [1, 0, 0])
+
+    def test_group_delete(self):
+        deleted, kept, _ = self.groups
+        self.user.groups.add(deleted, kept)
+        deleted.delete()
+        self.assertMemberCounts(kept)
+        self.assertEqual(kept.member_count, 1)
+        # Członkostwa usuniętej grupy nie są już liczone przy usunięciu użytkownika
+        self.user.delete()
+        self.assertMemberCounts(kept)
+        self.assertEqual(kept.member_count, 0)
+
+    def test_join_completed_by_concurrent_request(self):
+        """Drugie dołączenie tego samego użytkownika kończy się, zanim pierwsze zablokuje grupę."""
+        group = self.groups[0]
+        check_password = Group.check_password
+        interleaved = []
+
+        def check_password_then_join(instance, raw_password):
+            if not interleaved:
+                interleaved.append(None)
+                interleaved[0] = self.join(group).status_code
+            return check_password(instance, raw_password)
+
+        with mock.patch.object(Group, 'check_password', check_password_then_join):
+            self.assertEqual(self.join(group).status_code, 200)
+        self.assertEqual(interleaved, [200])
+        self.assertMemberCounts(group)
+        self.assertEqual(group.member_count, 1)
+
+
+@override_settings(**TEST_SETTINGS)
+class ConcurrentJoinTests(MemberCountAssertionsMixin, TransactionTestCase):
+    """Równoległe żądania w osobnych połączeniach; blokada wiersza wymaga SELECT ... FOR UPDATE."""
+
+    def run_concurrently(self, users, group):
+        barrier = threading.Barrier(len(users))
+        statuses = []
+
+        def join(user):
+            client = APIClient()
+            client.force_authenticate(user)
+            try:
+                barrier.wait()
+                statuses.append(client.post('/api/group/join/', {'group_id': group.id, 'password': 'secret'},
+                                            format='json').status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=join, args=(user,)) for user in users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return statuses
+
+    @skipUnlessDBFeature('has_select_for_update')
+    def test_same_user_joins_concurrently(self):
+        user = make_user()
+        group = make_group()
+        self.assertEqual(self.run_concurrently([user] * 8, group), [200] * 8)
+        self.assertMemberCounts(group)
+        self.assertEqual(group.member_count, 1)
+
+    @skipUnlessDBFeature('has_select_for_update')
+    def test_different_users_join_concurrently(self):
+        users = [make_user() for _ in range(8)]
+        group = make_group()
+        self.assertEqual(self.run_concurrently(users, group), [200] * 8)
+        self.assertMemberCounts(group)
+        self.assertEqual(group.member_count, 8)
+
+
+@override_settings(**TEST_SETTINGS)
+class GroupMemberPaginationTests(TestCase):
+    def setUp(self):
+        self.group = make_group()
+        self.members = [make_user() for _ in range(7)]
+        self.group.users.add(*self.members)
+        self.client = APIClient()
+        self.client.force_authenticate(self.members[0])
+
+    def pages(self, ordering):
+        ids = []
+        params = {'ordering': ordering, 'limit': 3, 'fields': 'id'}
+        while True:
+            response = self.client.get(f'/api/groups/{self.group.id}/users/', params)
+            self.assertEqual(response.status_code, 200, response.content)
+            ids.extend(user['id'] for user in response.json()['results'])
+            if response.json()['next'] is None:
+                return ids
+            params['cursor'] = response.json()['next']
+
+    def test_id_ordering(self):
+        self.assertEqual(self.pages('id'), sorted(user.id for user in self.members))
+
+    def test_online_ordering_follows_presence(self):
+        tracker = PresenceTracker()
+        now = timezone.now()
+        for minutes, user in enumerate(self.members):
+            tracker.heartbeat(user.id, now - timedelta(minutes=minutes))
+        tracker.flush(now)
+        self.assertEqual(self.pages('online'), [user.id for user in self.members])
+        # update_last_activity przenosi użytkownika na początek listy
+        self.members[-1].update_last_activity()
+        self.assertEqual(self.pages('online')[0], self.members[-1].id)
+
+    def test_new_member_copies_last_activity(self):
+        user = make_user()
+        MyUser.objects.filter(id=user.id).update(last_activity=timezone.now() - timedelta(days=3))
+        self.group.users.add(user)
+        self.assertEqual(self.pages('online')[-1], user.id)
+
+
+@override_settings(**TEST_SETTINGS)
+class AlertCacheTests(TestCase):
+    """Cache aktywnych komunikatów jest unieważniany przez sygnały, niezależnie od ścieżki zmiany."""
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        self.user = make_user()
+        self.author = make_user()
+        self.group = make_group()
+        self.user.groups.add(self.group)
+
+    def active_ids(self):
+        return [alert['id'] for alert in alert_cache.active_alerts(self.user.id)]
+
+    def test_alert_created_outside_view(self):
+        self.assertEqual(self.active_ids(), [])
+        # Komunikat aktywny od razu, w oknie ważności wpisu już zapisanego w cache
+        with self.captureOnCommitCallbacks(execute=True):
+            alert = make_alert(self.author, self.group)
+        self.assertEqual(self.active_ids(), [alert.id])
+
+    def test_alert_moved_to_other_group(self):
+        other = make_group()
+        with self.captureOnCommitCallbacks(execute=True):
+            alert = make_alert(self.author, self.group)
+        self.assertEqual(self.active_ids(), [alert.id])
+        with self.captureOnCommitCallbacks(execute=True):
+            alert.group = other
+            alert.save()
+        self.assertEqual(self.active_ids(), [])
+
+    def test_cascade_delete(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            alert = make_alert(self.author, self.group)
+            make_alert(self.user, make_group())
+        self.assertEqual(self.active_ids(), [alert.id])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.delete()
+        self.assertEqual(self.active_ids(), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            alert = make_alert(self.user, self.group)
+        self.assertEqual(self.active_ids(), [alert.id])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.group.delete()
+        self.assertEqual(self.active_ids(), [])
+
+    def test_cache_serves_alerts_without_queries(self):
+        make_alert(self.author, self.group)
+        make_alert(self.author, self.group, starts_in=timedelta(minutes=5))
+        self.user.groups.add(make_group())
+        client = APIClient()
+        client.force_authenticate(self.user)
+        # Pusty cache: grupy użytkownika, komunikaty wszystkich grup i grupy autorów
+        with self.assertNumQueries(3):
+            cold = client.get('/api/groups/alerts/')
+        with self.assertNumQueries(0):
+            warm = client.get('/api/groups/alerts/')
+        self.assertEqual(cold.status_code, 200)
+        self.assertEqual(warm.json(), cold.json())
+
+    def test_future_alert_becomes_active(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            alert = make_alert(self.author, self.group, starts_in=timedelta(minutes=5))
+        self.assertEqual(self.active_ids(), [])
+        later = timezone.now() + timedelta(minutes=6)
+        self.assertEqual([item['id'] for item in alert_cache.active_alerts(self.user.id, now=later)], [alert.id])
+
+
+@skipUnless(configured_shared_cache_available(), 'wspólny cache z ustawień (Redis) jest niedostępny')
+@override_settings(CACHES=CONFIGURED_CACHES)
+class ConfiguredCacheAlertTests(AlertCacheTests):
+    """Jak AlertCacheTests, ale na cache z ustawień."""
+
+
+@skipUnless(configured_shared_cache_available(), 'wspólny cache z ustawień (Redis) jest niedostępny')
+@override_settings(CACHES=CONFIGURED_CACHES)
+class ConfiguredCacheListQueryCountTests(ListQueryCountTests):
+    """Jak ListQueryCountTests, ale na cache z ustawień."""
@@ -0,0 +1,171 @@
+"""
+Ograniczanie liczby żądań algorytmem token bucket.
+
+Każdy klient (użytkownik, a dla niezalogowanych adres IP) ma osobny bucket
+w każdym zakresie (throttle_scope widoku, domyślnie ``default``). Zakresy
+są opisane w THROTTLE_BUCKETS: ``rate`` w formacie DRF (np. ``30/min``) to
+tempo uzupełniania tokenów, a ``burst`` pojemność bucketu. DRF sprawdza
+ograniczenia przed wywołaniem metody widoku, więc odrzucone żądanie nie
+wykonuje żadnych zapytań widoku.
+
+Stan bucketów przechowuje THROTTLE_STORE: InProcessStore (słownik w
+procesie, bez blokad) albo CacheStore (cache Django, wspólny dla procesów).
+Liczniki przepuszczonych i odrzuconych żądań zwraca stats().
+"""
+import threading
+import time
+from collections import Counter
+from math import ceil
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+from rest_framework.throttling import BaseThrottle
+
+DEFAULT_SCOPE = 'default'
+DURATIONS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """Zamienia ``liczba/okres`` na liczbę tokenów na sekundę."""
+    num, period = rate.split('/')
+    return int(num) / DURATIONS[period[0]]
+
+
+def refill(state, burst, rate, now):
+    """Liczba tokenów bucketu o stanie (tokeny, czas, ...) w chwili now; brak stanu to pełny bucket."""
+    tokens, updated = state[:2] if state else (burst, now)
+    return min(burst, tokens + (now - updated) * rate)
+
+
+class InProcessStore:
+    """
+    Buckety w słowniku procesu. Stan bucketu to jedna krotka podmieniana
+    atomowo (GIL), więc nie są potrzebne blokady; przy równoczesnych
+    żądaniach tego samego klienta może przejść pojedyncze dodatkowe żądanie.
+    """
+
+    def __init__(self):
+        self.buckets = {}
+        self.max_entries = getattr(settings, 'THROTTLE_MAX_ENTRIES', 100000)
+        self.prune_at = self.max_entries
+
+    def take(self, key, burst, rate):
+        """Pobiera token; zwraca (czy przepuścić, sekundy do następnego tokenu)."""
+        now = time.monotonic()
+        tokens = refill(self.buckets.get(key), burst, rate, now)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        # Trzeci element to chwila pełnego uzupełnienia, po której wpis jest zbędny
+        self.buckets[key] = (tokens, now, now + (burst - tokens) / rate)
+        if len(self.buckets) > self.prune_at:
+            self.prune(now)
+        return (True, 0) if allowed else (False, (1 - tokens) / rate)
+
+    def prune(self, now):
+        for key, (_, _, full_at) in list(self.buckets.items()):
+            if full_at <= now:
+                self.buckets.pop(key, None)
+        # Kolejne przeglądanie dopiero po podwojeniu liczby pozostałych wpisów (i nie
+        # poniżej max_entries), więc jego koszt rozkłada się na wiele wstawień
+        self.prune_at = max(self.max_entries, 2 * len(self.buckets))
+
+    def __len__(self):
+        return len(self.buckets)
+
+
+class CacheStore:
+    """Buckety w cache THROTTLE_CACHE, wspólne dla procesów korzystających z tego samego cache."""
+
+    def __init__(self):
+        self.cache = caches[getattr(settings, 'THROTTLE_CACHE', 'default')]
+
+    def take(self, key, burst, rate):
+        now = time.time()
+        tokens = refill(self.cache.get(key), burst, rate, now)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        # Po czasie pełnego uzupełnienia wpis jest zbędny
+        self.cache.set(key, (tokens, now), ceil((burst - tokens) / rate) + 1)
+        return (True, 0) if allowed else (False, (1 - tokens) / rate)
+
+
+_store = None
+_store_lock = threading.Lock()
+_counters = Counter()
+
+
+def get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                store_class = getattr(settings, 'THROTTLE_STORE', 'REST.throttling.InProcessStore')
+                _store = import_string(store_class)()
+    return _store
+
+
+def set_store(store):
+    """Podmienia magazyn bucketów (np. w testach)."""
+    global _store
+    _store = store
+
+
+def get_bucket(scope):
+    """Zwraca (pojemność, tokeny na sekundę) zakresu albo None, gdy zakres nie jest ograniczany."""
+    buckets = getattr(settings, 'THROTTLE_BUCKETS', {})
+    config = buckets.get(scope, buckets.get(DEFAULT_SCOPE))
+    if config is None:
+        return None
+    rate = parse_rate(config['rate'])
+    return config.get('burst', max(1, round(rate * 60))), rate
+
+
+def consume(scope, ident):
+    """Pobiera token dla klienta ident w zakresie scope; zwraca (czy przepuścić, sekundy oczekiwania)."""
+    bucket = get_bucket(scope)
+    if bucket is None:
+        return True, 0
+    allowed, wait = get_store().take(f'throttle:{scope}:{ident}', *bucket)
+    _counters[scope, 'allowed' if allowed else 'throttled'] += 1
+    return allowed, wait
+
+
+def client_ident(request, throttle=None):
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return f'user:{user.pk}'
+    return f'ip:{(throttle or BaseThrottle()).get_ident(request)}'
+
+
+def stats():
+    """Liczniki przepuszczonych i odrzuconych żądań dla zakresów, od startu procesu."""
+    buckets = getattr(settings, 'THROTTLE_BUCKETS', {})
+    scopes = {}
+    for (scope, outcome), count in list(_counters.items()):
+        scopes.setdefault(scope, {'allowed': 0, 'throttled': 0})[outcome] = count
+    for scope, data in scopes.items():
+        data.update(buckets.get(scope, buckets.get(DEFAULT_SCOPE, {})))
+    store = get_store()
+    return {'store': type(store).__name__, 'buckets': len(store) if hasattr(store, '__len__') else None,
+            'scopes': scopes}
+
+
+def throttle_scope(scope):
+    """Nadaje zakres widokowi funkcyjnemu (@api_view), tak jak atrybut throttle_scope w APIView."""
+    def decorator(view):
+        view.cls.throttle_scope = scope
+        return view
+    return decorator
+
+
+class TokenBucketThrottle(BaseThrottle):
+    def allow_request(self, request, view):
+        scope = getattr(view, 'throttle_scope', None) or DEFAULT_SCOPE
+        allowed, self.retry_after = consume(scope, client_ident(request, self))
+        return allowed
+
+    def wait(self):
+        return self.retry_after
@@ -2,9 +2,10 @@ from django.urls import path
 from rest_framework_simplejwt import views as jwt_views
 
 from REST.views import LoginView, LogoutView, ChangePasswordView, RegistrationView, PersonInfo, \
-    MessageListCreateView, list_users_with_distance, UsersInGroup, \
+    MessageListCreateView, MessageWaitView, list_users_with_distance, UsersInGroup, \
     GroupCreateView, JoinGroupView, LeaveGroupView, GroupDetailView, list_users_by_recent_message, \
-    DeleteCurrentUserView, AlertListCreateView, BlockedUsersListView, UserAlertsListDeleteView
+    DeleteCurrentUserView, AlertListCreateView, BlockedUsersListView, UserAlertsListDeleteView, profile_picture_file, \
+    throttle_stats, profiling_stats
 
 urlpatterns = [
     path('accounts/register', RegistrationView.as_view(), name='register'),
@@ -17,6 +18,7 @@ urlpatterns = [
     path('accounts/person/<int:person_id>/patch/', PersonInfo.as_view(), name='person-update'),
     path('accounts/delete-account/', DeleteCurrentUserView.as_view(), name='delete-account'),
     path('messages/', MessageListCreateView.as_view(), name='message-list-create'),
+    path('messages/wait/', MessageWaitView.as_view(), name='message-wait'),
     path('list_users_with_distance/', list_users_with_distance, name='list_users_with_distance'),
     path('list_users_by_recent_message/', list_users_by_recent_message, name='list_users_by_recent_message'),
     path('groups/<int:group_id>/users/', UsersInGroup.as_view(), name='users-in-group'),
@@ -26,4 +28,7 @@ urlpatterns = [
     path('group/leave/', LeaveGroupView.as_view(), name='leave-group'),
     path('groups/alerts/', AlertListCreateView.as_view(), name='alert-list-create'),
     path('accounts/alerts/', UserAlertsListDeleteView.as_view(), name='user-alerts-list-delete'),
+    path('media/<str:file_name>', profile_picture_file, name='profile-picture'),
+    path('throttling/stats/', throttle_stats, name='throttle-stats'),
+    path('profiling/stats/', profiling_stats, name='profiling-stats'),
 ]
@@ -1,26 +1,41 @@
-from datetime import timedelta
-from math import radians, sin, cos, atan2, sqrt, floor
-
+import asyncio
+import base64
+import binascii
+import json
+from datetime import datetime
+from math import ceil, isfinite
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.auth import login, authenticate, logout
+from django.db import transaction
 from django.db.models import Max, Q
-from django.http import JsonResponse
+from django.http import JsonResponse, FileResponse, Http404, HttpResponse, HttpResponseNotModified
 from django.shortcuts import render, get_object_or_404
-from django.utils import timezone
+from django.views import View
 from rest_framework import status
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.exceptions import AuthenticationFailed
 from rest_framework.pagination import PageNumberPagination
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAuthenticated, IsAdminUser
+from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from REST.models import MyUser, Message, Group, Alert, BlockedUsers
+from REST import alert_cache, blocking, media, profiling, queries, realtime, throttling
+from REST.authentication import CachedJWTAuthentication
+from REST.geo import haversine_distances, nearest_users
+from REST.models import MyUser, Group, Alert, BlockedUsers, Conversation
+from REST.presence import tracker
+from REST.pubsub import get_backend
 from REST.serializers import PasswordChangeSerializer, RegistrationSerializer, PersonSerializer, \
-    MessageSerializer, UpdateMessagesSerializer, UserWithDistanceSerializer, GroupSerializer, \
-    GroupDetailSerializer, AlertSerializer, AlertSerializerSave, BlockedUsersSerializer, BlockedUsersListSerializer
+    MessageSerializer, UpdateMessagesSerializer, GroupSerializer, \
+    GroupDetailSerializer, AlertSerializerSave, BlockedUsersSerializer, BlockedUsersListSerializer, \
+    message_list_data, compact_message_list_data, user_with_distance_list_data, alert_list_data, \
+    PERSON_FIELDS, person_columns, projected_person_list_data
+from REST.throttling import throttle_scope
 from REST.utils import get_tokens_for_user
 
-from testChatREST import settings
-
 from django.utils.translation import gettext as _
 
 from django.core.exceptions import PermissionDenied
@@ -28,6 +43,7 @@ from django.core.exceptions import PermissionDenied
 
 class RegistrationView(APIView):
     permission_classes = [AllowAny]
+    throttle_scope = 'auth'
 
     def post(self, request):
         serializer = RegistrationSerializer(data=request.data)
@@ -39,18 +55,19 @@ class RegistrationView(APIView):
 
 class LoginView(APIView):
     permission_classes = [AllowAny]
+    throttle_scope = 'auth'
 
     def post(self, request):
         if 'email' not in request.data or 'password' not in request.data:
             return Response({'error': 'Credentials missing'}, status=status.HTTP_400_BAD_REQUEST)
         email = request.POST.get('email')
-        print('Email:', email)
         password = request.POST.get('password')
-        print('password:', password)
         user = authenticate(request, email=email, password=password)
         if user is not None:
-            login(request, user)
-            auth_data = get_tokens_for_user(request.user)
+            # API korzysta tylko z tokenów JWT; sesja jest tworzona jedynie poza trybem JWT_ONLY_LOGIN
+            if not settings.JWT_ONLY_LOGIN:
+                login(request, user)
+            auth_data = get_tokens_for_user(user)
             return Response({'message': _('Login Success'), 'username': user.username, 'localId': user.id,
                              'profile_picture': user.profile_picture,
                              'access_token_lifetime': settings.ACCESS_TOKEN_LIFETIME,
@@ -61,18 +78,20 @@ class LoginView(APIView):
 
 class LogoutView(APIView):
     def post(self, request):
-        logout(request)
+        if hasattr(request, 'session'):
+            logout(request)
         return Response({'message': _('Successfully Logged out')}, status=status.HTTP_200_OK)
 
 
 class ChangePasswordView(APIView):
     permission_classes = [IsAuthenticated]
+    throttle_scope = 'auth'
 
     def post(self, request):
         serializer = PasswordChangeSerializer(context={'request': request}, data=request.data)
         serializer.is_valid(raise_exception=True)
         request.user.set_password(serializer.validated_data['new_password'])
-        request.user.save()
+        request.user.save(update_fields=['password'])
         return Response({'message': _('The password has been changed')}, status=status.HTTP_200_OK)
 
 
@@ -88,17 +107,11 @@ class DeleteCurrentUserView(APIView):
 class PersonInfo(APIView):
     def get(self, request, person_id):
         try:
-            person = MyUser.objects.get(pk=person_id)
+            person = queries.people().get(pk=person_id)
             user_data = PersonSerializer(person).data
-            if timezone.now() - person.last_activity > timedelta(minutes=1):
-                user_data['online'] = False
-            else:
-                user_data['online'] = True
+            user_data['online'] = tracker.online_status([person])[person.id]
 
-            if self.is_blocked(request.user.id, person_id) or self.is_blocked(person_id, request.user.id):
-                user_data['blocked_user'] = True
-            else:
-                user_data['blocked_user'] = False
+            user_data['blocked_user'] = blocking.is_either_blocked(request.user.id, person_id)
 
         except MyUser.DoesNotExist:
             return Response(status=404)
@@ -113,80 +126,250 @@ class PersonInfo(APIView):
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-    def is_blocked(self, user_id, blocked_user_id):
-        """Zwraca True jeżeli user_id jest zablokowany przez blocked_user_id """
-        return BlockedUsers.objects.filter(user_id=blocked_user_id, blocked_user_id=user_id).exists()
+
+class MessageCursorPagination:
+    """
+    Stronicowanie kursorowe (keyset) wątku wiadomości po (created_at, id).
+
+    ``after_id`` zwraca wiadomości nowsze od wskazanej (tryb odpytywania),
+    ``before_id`` starsze (przewijanie historii), a samo ``limit`` ostatnie
+    wiadomości wątku.
+    """
+    page_size = 50
+    max_page_size = 200
+    cursor_params = ('before_id', 'after_id', 'limit')
+
+    def is_requested(self, request):
+        return any(param in request.query_params for param in self.cursor_params)
+
+    def get_limit(self, request):
+        limit = request.query_params.get('limit')
+        if limit is None:
+            return self.page_size
+        return max(1, min(int(limit), self.max_page_size))
+
+    def get_cursor(self, request, name):
+        value = request.query_params.get(name)
+        return int(value) if value is not None else None
+
+    def keyset_filter(self, queryset, message_id, newer):
+        """Filtr (created_at, id) > / < kursora, zgodny z indeksem message_thread_idx."""
+        created_at = queryset.filter(pk=message_id).values_list('created_at', flat=True).first()
+        if created_at is None:
+            return Q(id__gt=message_id) if newer else Q(id__lt=message_id)
+        return queries.thread_cursor(created_at, message_id, newer)
+
+    def paginate_thread(self, user_id, partner_id, request):
+        """Zwraca stronę wiadomości wątku w porządku chronologicznym; ValueError dla błędnych parametrów."""
+        self.limit = self.get_limit(request)
+        self.after_id = self.get_cursor(request, 'after_id')
+        self.before_id = before_id = self.get_cursor(request, 'before_id')
+
+        queryset = queries.thread_queryset(user_id, partner_id)
+        condition = Q()
+        if self.after_id is not None:
+            condition &= self.keyset_filter(queryset, self.after_id, newer=True)
+        if before_id is not None:
+            condition &= self.keyset_filter(queryset, before_id, newer=False)
+
+        # Najpierw klucze strony z indeksu wątku, potem tylko te wiadomości
+        newest_first = self.after_id is None
+        keys = queries.thread_page_keys(user_id, partner_id, condition, newest_first, self.limit + 1)
+        self.has_more = len(keys) > self.limit
+        keys = keys[:self.limit]
+        if newest_first:
+            keys.reverse()
+        messages = queryset.in_bulk([message_id for _, message_id in keys])
+        self.page = [messages[message_id] for _, message_id in keys if message_id in messages]
+        return self.page
+
+    def includes_newest(self):
+        """Czy strona kończy się najnowszą wiadomością wątku (strony historii nie zmieniają nieprzeczytanych)."""
+        if self.before_id is not None or not self.page:
+            return False
+        return self.after_id is None or not self.has_more
+
+    def get_paginated_data(self, data):
+        return {
+            'before_id': self.page[0].id if self.page else None,
+            'after_id': self.page[-1].id if self.page else self.after_id,
+            'has_more': self.has_more,
+            'results': data
+        }
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
 
 
 class MessageListCreateView(APIView):
     permission_classes = [IsAuthenticated]
+    throttle_scope = 'messages'
     serializer_class = MessageSerializer
+    pagination_class = MessageCursorPagination
 
     def get(self, request):
         sender = request.user.id
         receiver = request.query_params.get('receiver')
 
-        queryset = Message.objects.filter(sender=sender, receiver=receiver).order_by(
-            'created_at') | Message.objects.filter(sender=receiver, receiver=sender).order_by('created_at')
-        serializer = MessageSerializer(queryset, many=True)
-        return Response(serializer.data)
+        # Zwięzła postać (compact=true): każdy profil tylko raz w słowniku users
+        compact = request.query_params.get('compact', '').lower() in ('1', 'true')
+
+        paginator = self.pagination_class()
+        if paginator.is_requested(request):
+            try:
+                page = paginator.paginate_thread(sender, receiver, request)
+            except ValueError:
+                return Response({'error': _('Invalid cursor')}, status=status.HTTP_400_BAD_REQUEST)
+            # Odpytywanie bez nowych wiadomości i przewijanie historii nie wykonują UPDATE
+            if receiver is not None and paginator.includes_newest():
+                Conversation.objects.mark_read(sender, receiver)
+            if compact:
+                results, users = compact_message_list_data(page)
+                response = paginator.get_paginated_response(results)
+                response.data['users'] = users
+                return response
+            return paginator.get_paginated_response(message_list_data(page))
+
+        messages = queries.thread_messages(sender, receiver)
+        if receiver is not None and messages:
+            Conversation.objects.mark_read(sender, receiver)
+        if compact:
+            results, users = compact_message_list_data(messages)
+            return Response({'results': results, 'users': users})
+        return Response(message_list_data(messages))
 
     def post(self, request):
         data = request.data.copy()
         data['sender'] = request.user.id
         receiver = data.get('receiver')
 
-        # Sprawdź czy użytkownik jest zablokowany
-        if self.is_blocked(request.user.id, receiver) or self.is_blocked(receiver, request.user.id):
+        # Sprawdź czy użytkownik jest zablokowany (błędny odbiorca zostanie odrzucony przez serializer);
+        # bezpośrednio w bazie, aby świeżo dodana blokada działała od razu we wszystkich procesach
+        try:
+            receiver_id = int(receiver)
+        except (TypeError, ValueError):
+            receiver_id = None
+        if receiver_id is not None and blocking.is_blocked_in_db(request.user.id, receiver_id):
             raise PermissionDenied("Jesteś zablokowany przez tego użytkownika lub zablokowałeś tego użytkownika")
 
         serializer = UpdateMessagesSerializer(data=data)
         if serializer.is_valid():
-            serializer.save()
+            message = serializer.save()
+            transaction.on_commit(lambda: realtime.publish_message(message))
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-    def is_blocked(self, user_id, blocked_user_id):
-        """Zwraca True jeżeli user_id jest zablokowany przez blocked_user_id """
-        return BlockedUsers.objects.filter(user_id=blocked_user_id, blocked_user_id=user_id).exists()
-
 
-def haversine_distance(lat1, lon1, lat2, lon2):
-    lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
-    dlon = lon2 - lon1
-    dlat = lat2 - lat1
-    a = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlon / 2) ** 2
-    c = 2 * atan2(sqrt(a), sqrt(1 - a))
-    distance = 6371 * c  # Odległość w km
-    distance = floor(distance)  # Zaokrąglij w dół
-    return distance
+class MessageWaitView(View):
+    """
+    Long-poll dla klientów bez WebSocket: zwraca od razu wiadomości nowsze niż
+    after_id, a gdy ich brak, czeka (najwyżej timeout sekund) na powiadomienie
+    z MessageListCreateView.post przez REST.pubsub, bez ponownego odpytywania bazy.
+    Powiadomienia docierają tylko w obrębie procesu, chyba że REALTIME_BACKEND
+    jest współdzielony.
+    """
 
+    async def get(self, request):
+        try:
+            user = await sync_to_async(self.authenticate)(request)
+        except AuthenticationFailed:
+            user = None
+        if user is None:
+            return JsonResponse({'detail': _('Authentication credentials were not provided.')},
+                                status=status.HTTP_401_UNAUTHORIZED)
+        # Dla LastActivityMiddleware, tak jak robi to DRF po uwierzytelnieniu
+        request.user = user
+
+        allowed, wait = throttling.consume(MessageListCreateView.throttle_scope, throttling.client_ident(request))
+        if not allowed:
+            response = JsonResponse({'detail': _('Request was throttled.')}, status=status.HTTP_429_TOO_MANY_REQUESTS)
+            response['Retry-After'] = str(ceil(wait))
+            return response
 
+        try:
+            receiver = int(request.GET['receiver'])
+            int(request.GET['after_id'])
+            int(request.GET.get('limit', MessageCursorPagination.page_size))
+            timeout = float(request.GET.get('timeout', settings.LONG_POLL_TIMEOUT))
+            # min() przepuściłoby nan, które następnie trafiłoby do pętli oczekiwania
+            if not isfinite(timeout):
+                raise ValueError(timeout)
+            timeout = min(timeout, settings.LONG_POLL_MAX_TIMEOUT)
+        except (KeyError, ValueError):
+            return JsonResponse({'error': _('Invalid cursor')}, status=status.HTTP_400_BAD_REQUEST)
+
+        backend = get_backend()
+        # Subskrypcja przed odczytem, aby nie zgubić wiadomości zapisanej pomiędzy
+        subscription = backend.subscribe(user.id)
+        try:
+            data = await sync_to_async(self.fetch)(request, user.id, receiver)
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + timeout
+            while not data['results']:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    event = await asyncio.wait_for(subscription.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                if event is None:
+                    break
+                if event['type'] == 'message' and receiver in (event['message']['sender_id'],
+                                                               event['message']['receiver_id']):
+                    data = await sync_to_async(self.fetch)(request, user.id, receiver)
+        finally:
+            backend.unsubscribe(subscription)
+        return JsonResponse(data)
+
+    def authenticate(self, request):
+        result = CachedJWTAuthentication().authenticate(request)
+        return result[0] if result is not None else None
+
+    def fetch(self, request, user_id, receiver):
+        paginator = MessageCursorPagination()
+        page = paginator.paginate_thread(user_id, receiver, Request(request))
+        if paginator.includes_newest():
+            Conversation.objects.mark_read(user_id, receiver)
+        if request.GET.get('compact', '').lower() in ('1', 'true'):
+            results, users = compact_message_list_data(page)
+            data = paginator.get_paginated_data(results)
+            data['users'] = users
+            return data
+        return paginator.get_paginated_data(message_list_data(page))
+
+
+@throttle_scope('nearby')
 @api_view(['GET'])
 def list_users_with_distance(request):
     current_user = request.user
     base_user = get_object_or_404(MyUser, id=current_user.id)
 
     # Wyklucz użytkowników, którzy zablokowali aktualnego użytkownika
-    blocked_users = BlockedUsers.objects.filter(blocked_user=current_user.id).values_list('user', flat=True)
-    all_users = MyUser.objects.exclude(id=current_user.id).exclude(id__in=blocked_users)
-
-    serialized_users = []
-    for user in all_users:
-        distance = haversine_distance(base_user.latitude, base_user.longitude, user.latitude, user.longitude)
-        user_data = UserWithDistanceSerializer(user).data
+    blocked_users = blocking.blocked_me(current_user.id)
+    all_users = queries.other_people(current_user.id, blocked_users)
+
+    try:
+        radius_km = request.query_params.get('radius_km')
+        radius_km = float(radius_km) if radius_km is not None else None
+        limit = request.query_params.get('limit')
+        limit = int(limit) if limit is not None else None
+    except ValueError:
+        return Response({'error': _('Invalid search parameters')}, status=status.HTTP_400_BAD_REQUEST)
+    if (radius_km is not None and radius_km < 0) or (limit is not None and limit < 1):
+        return Response({'error': _('Invalid search parameters')}, status=status.HTTP_400_BAD_REQUEST)
+
+    # Tylko najbliżsi użytkownicy (w promieniu radius_km, najwyżej limit) są odczytywani i serializowani
+    nearest = nearest_users(all_users, base_user.latitude, base_user.longitude, radius_km=radius_km, limit=limit)
+
+    online = tracker.online_status([user for _, user in nearest])
+
+    serialized_users = user_with_distance_list_data([user for _, user in nearest])
+    for (distance, user), user_data in zip(nearest, serialized_users):
         user_data['distance'] = distance
+        user_data['online'] = online[user.id]
 
-        if timezone.now() - user.last_activity > timedelta(minutes=1):
-            user_data['online'] = False
-        else:
-            user_data['online'] = True
-
-        serialized_users.append(user_data)
-
-    sorted_users = sorted(serialized_users, key=lambda x: x['distance'])
-
-    return Response(sorted_users)
+    return Response(serialized_users)
 
 
 @api_view(['GET'])
@@ -194,60 +377,149 @@ def list_users_by_recent_message(request):
     current_user = request.user
     base_user = get_object_or_404(MyUser, id=current_user.id)
 
-    # Pobranie identyfikatorów użytkowników z ostatnich wysłanych/otrzymanych wiadomości
-    user_ids = Message.objects.filter(
-        Q(sender=current_user) | Q(receiver=current_user)
-    ).order_by('-created_at').values('sender_id', 'receiver_id').distinct()
-
-    # Wyodrębnienie unikalnych identyfikatorów użytkowników
-    unique_user_ids = set()
-    for entry in user_ids:
-        unique_user_ids.add(entry['sender_id'])
-        unique_user_ids.add(entry['receiver_id'])
-    if current_user.id in unique_user_ids:
-        unique_user_ids.remove(current_user.id)
-
-    # Pobranie użytkowników
-    users = MyUser.objects.filter(id__in=unique_user_ids)
-
-    # Sortowanie użytkowników
-    def get_latest_message_date(user):
-        latest_sent_message = user.sent_messages.order_by('created_at').last()
-        latest_received_message = user.received_messages.order_by('created_at').last()
+    # Rozmowy użytkownika posortowane od najnowszej wiadomości
+    conversations = list(queries.conversations(current_user.id))
+    users = [conversation.partner for conversation in conversations]
 
-        # Pobranie najnowszej daty z wysłanych i otrzymanych wiadomości
-        dates = [msg.created_at for msg in [latest_sent_message, latest_received_message] if msg]
-        return max(dates) if dates else None
+    distances = haversine_distances(base_user.latitude, base_user.longitude,
+                                    [user.latitude for user in users], [user.longitude for user in users])
+    online = tracker.online_status(users)
 
-    users = sorted(users, key=get_latest_message_date, reverse=True)
-
-    serialized_users = []
-
-    for user in users:
-        distance = haversine_distance(base_user.latitude, base_user.longitude, user.latitude, user.longitude)
-        user_data = UserWithDistanceSerializer(user).data
+    serialized_users = user_with_distance_list_data(users)
+    for conversation, user, distance, user_data in zip(conversations, users, distances, serialized_users):
         user_data['distance'] = distance
+        user_data['unread_count'] = conversation.unread_count
+        user_data['online'] = online[user.id]
 
-        if timezone.now() - user.last_activity > timedelta(minutes=1):
-            user_data['online'] = False
-        else:
-            user_data['online'] = True
+    return Response(serialized_users)
 
-        serialized_users.append(user_data)
 
-    return Response(serialized_users)
+def profile_picture_file(request, file_name):
+    """Udostępnia obraz z magazynu; nazwa zawiera skrót treści, więc może być buforowany bez końca."""
+    match = media.FILE_NAME_RE.match(file_name)
+    if match is None:
+        raise Http404
+    etag = f'"{match.group("digest")}{match.group("thumb") or ""}"'
+    if request.headers.get('If-None-Match') == etag:
+        response = HttpResponseNotModified()
+    else:
+        try:
+            picture = open(media.file_path(file_name), 'rb')
+        except FileNotFoundError:
+            raise Http404
+        content_type = {ext: content_type for content_type, ext in media.CONTENT_TYPES.items()}[match.group('ext')]
+        response = FileResponse(picture, content_type=content_type)
+    response['ETag'] = etag
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+
+class GroupMemberCursorPagination:
+    """
+    Stronicowanie kursorowe członków grupy. Kolejność ``ordering``:
+    ``id`` (domyślnie), ``online`` (ostatnio aktywni najpierw) lub ``distance``
+    (najbliżsi wywołującemu). Kursor jest nieprzezroczystym ciągiem z pola next.
+    Dla ``id`` i ``online`` strona jest odczytem zakresu indeksu Membership.
+    Dla ``distance`` kursor jest przesunięciem, więc koszt rośnie z numerem strony.
+    """
+    page_size = 50
+    max_page_size = 200
+    orderings = ('id', 'online', 'distance')
+    query_params = ('cursor', 'limit', 'fields', 'ordering')
+
+    def is_requested(self, request):
+        return any(param in request.query_params for param in self.query_params)
+
+    def encode_cursor(self, position):
+        return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+    def decode_cursor(self, request):
+        """Zwraca słownik pozycji z parametru cursor; ValueError dla błędnego kursora."""
+        cursor = request.query_params.get('cursor')
+        if cursor is None:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError) as error:
+            raise ValueError(error)
+        if not isinstance(position, dict):
+            raise ValueError(cursor)
+        return position
+
+    def get_fields(self, request):
+        fields = request.query_params.get('fields')
+        if fields is None:
+            return list(PERSON_FIELDS)
+        requested = set(fields.split(','))
+        if requested - set(PERSON_FIELDS) - {'online'}:
+            raise ValueError(fields)
+        return [field for field in PERSON_FIELDS if field in requested] + (['online'] if 'online' in requested else [])
+
+    def paginate(self, group, members, request, base_user):
+        """Zwraca listę (użytkownik, odległość lub None); ustawia self.next."""
+        limit = request.query_params.get('limit')
+        limit = self.page_size if limit is None else max(1, min(int(limit), self.max_page_size))
+        ordering = request.query_params.get('ordering', 'id')
+        if ordering not in self.orderings:
+            raise ValueError(ordering)
+        position = self.decode_cursor(request) or {}
+
+        if ordering == 'distance':
+            offset = int(position.get('offset', 0))
+            nearest = nearest_users(members, base_user.latitude, base_user.longitude, limit=offset + limit + 1)
+            page = [(user, distance) for distance, user in nearest[offset:offset + limit]]
+            has_more = len(nearest) > offset + limit
+            self.next = self.encode_cursor({'offset': offset + limit}) if has_more else None
+            return page
+
+        if position:
+            position = {'id': int(position['id'])} if ordering == 'id' else \
+                {'t': datetime.fromisoformat(position['t']), 'id': int(position['id'])}
+        # Najpierw klucze strony z indeksu członkostw, potem tylko ci użytkownicy
+        keys = list(queries.group_member_keys(group.id, ordering, position)[:limit + 1])
+        if len(keys) > limit:
+            user_id, last_activity = keys[limit - 1]
+            position = {'id': user_id} if ordering == 'id' else {'t': last_activity.isoformat(), 'id': user_id}
+            self.next = self.encode_cursor(position)
+        else:
+            self.next = None
+        users = members.in_bulk([user_id for user_id, _ in keys[:limit]])
+        return [(users[user_id], None) for user_id, _ in keys[:limit] if user_id in users]
 
 
 class UsersInGroup(APIView):
+    pagination_class = GroupMemberCursorPagination
+
     def get(self, request, group_id):
         try:
             group = Group.objects.get(pk=group_id)
         except Group.DoesNotExist:
             return Response(status=status.HTTP_404_NOT_FOUND)
 
-        users = group.users.all()
-        serializer = PersonSerializer(users, many=True)
-        return Response(serializer.data)
+        paginator = self.pagination_class()
+        if not paginator.is_requested(request):
+            users = queries.group_members(group)
+            serializer = PersonSerializer(users, many=True)
+            return Response(serializer.data)
+
+        try:
+            fields = paginator.get_fields(request)
+            base_user = MyUser.objects.only('latitude', 'longitude').get(id=request.user.id)
+            members = queries.group_member_page(group, person_columns(
+                [field for field in fields if field != 'online']), 'groups' in fields)
+            page = paginator.paginate(group, members, request, base_user)
+        except (ValueError, KeyError, TypeError):
+            return Response({'error': _('Invalid cursor')}, status=status.HTTP_400_BAD_REQUEST)
+
+        person_fields = [field for field in fields if field != 'online']
+        online = tracker.online_status([user for user, distance in page]) if 'online' in fields else {}
+        results = projected_person_list_data([user for user, distance in page], person_fields)
+        for (user, distance), user_data in zip(page, results):
+            if 'online' in fields:
+                user_data['online'] = online[user.id]
+            if distance is not None:
+                user_data['distance'] = distance
+        return Response({'next': paginator.next, 'results': results})
 
 
 class GroupCreateView(APIView):
@@ -264,6 +536,7 @@ class GroupCreateView(APIView):
 
 class JoinGroupView(APIView):
     permission_classes = [IsAuthenticated]
+    throttle_scope = 'auth'
 
     def post(self, request, format=None):
         group_id = request.data.get('group_id')
@@ -275,7 +548,10 @@ class JoinGroupView(APIView):
             return Response({'error': _('Group not found')}, status=status.HTTP_404_NOT_FOUND)
 
         if group.check_password(password):
-            request.user.groups.add(group)
+            with transaction.atomic():
+                # Blokada wiersza grupy: równoległe dołączenia nie zwiększą member_count dwukrotnie
+                Group.objects.select_for_update().only('id').get(id=group.id)
+                request.user.groups.add(group)
             return Response({'message': _('User added to group')}, status=status.HTTP_200_OK)
         else:
             return Response({'error': _('Incorrect password')}, status=status.HTTP_400_BAD_REQUEST)
@@ -288,8 +564,9 @@ class LeaveGroupView(APIView):
         group_id = request.data.get('group_id')
 
         try:
-            group = Group.objects.get(id=group_id)
-            request.user.groups.remove(group)
+            with transaction.atomic():
+                group = Group.objects.select_for_update().get(id=group_id)
+                request.user.groups.remove(group)
             return Response({'message': _('User removed from group')}, status=status.HTTP_200_OK)
         except Group.DoesNotExist:
             return Response({'error': _('Group not found')}, status=status.HTTP_404_NOT_FOUND)
@@ -327,24 +604,15 @@ class AlertListCreateView(APIView):
     pagination_class = CustomPagination
 
     def get(self, request, *args, **kwargs):
-        current_time = timezone.now()
-        user_groups = request.user.groups.all()
-
-        # Filtrowanie komunikatów na podstawie przynależności do grup oraz daty startu i końca
-        alerts = Alert.objects.filter(
-            group__in=user_groups,
-            start_date__lte=current_time,
-            end_date__gte=current_time
-        ).order_by('end_date')
+        # Aktywne komunikaty z grup użytkownika, składane z cache poszczególnych grup
+        alerts = alert_cache.active_alerts(request.user.id)
         paginator = self.pagination_class()
         page = paginator.paginate_queryset(alerts, request)
 
         if page is not None:
-            serializer = AlertSerializer(page, many=True)
-            return paginator.get_paginated_response(serializer.data)
+            return paginator.get_paginated_response(page)
 
-        serializer = AlertSerializer(alerts, many=True)
-        return Response(serializer.data)
+        return Response(alerts)
 
     def post(self, request, format=None):
         data = request.data.copy()
@@ -353,7 +621,8 @@ class AlertListCreateView(APIView):
         serializer = AlertSerializerSave(data=data)
         if serializer.is_valid():
             # Możesz dodać dodatkową logikę, np. sprawdzenie, czy użytkownik należy do grupy
-            serializer.save()
+            alert = serializer.save()
+            transaction.on_commit(lambda: realtime.publish_alert(alert, serializer.data))
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -364,12 +633,11 @@ class UserAlertsListDeleteView(APIView):
     def get(self, request, *args, **kwargs):
         user_id = request.user.id
 
-        alerts = Alert.objects.filter(
+        alerts = queries.alerts().filter(
             Q(user=user_id)
         ).order_by('end_date')
 
-        serializer = AlertSerializer(alerts, many=True)
-        return Response(serializer.data)
+        return Response(alert_list_data(alerts))
 
     def delete(self, request, *args, **kwargs):
         try:
@@ -387,7 +655,7 @@ class BlockedUsersListView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request, *args, **kwargs):
-        blocked_users = BlockedUsers.objects.filter(user=request.user)
+        blocked_users = queries.blocked_users(request.user)
         serializer = BlockedUsersListSerializer(blocked_users, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -397,7 +665,8 @@ class BlockedUsersListView(APIView):
 
         serializer = BlockedUsersSerializer(data=data)
         if serializer.is_valid():
-            serializer.save()
+            blocked = serializer.save()
+            blocking.invalidate(blocked.user_id, blocked.blocked_user_id)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -408,6 +677,29 @@ class BlockedUsersListView(APIView):
 
             blocked_user_obj = BlockedUsers.objects.get(user=user, blocked_user=blocked_user)
             blocked_user_obj.delete()
+            blocking.invalidate(blocked_user_obj.user_id, blocked_user_obj.blocked_user_id)
             return Response(status=status.HTTP_204_NO_CONTENT)
         except:
             return Response(status=status.HTTP_404_NOT_FOUND)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def throttle_stats(request):
+    """Liczniki ograniczania żądań w tym procesie, do strojenia THROTTLE_BUCKETS."""
+    return Response(throttling.stats())
+
+
+@api_view(['GET', 'DELETE'])
+@permission_classes([IsAdminUser])
+def profiling_stats(request):
+    """
+    Statystyki tras z ProfilingMiddleware w tym procesie; ?output=jsonl zwraca
+    jeden wiersz JSON na trasę, DELETE zeruje statystyki.
+    """
+    if request.method == 'DELETE':
+        profiling.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    if request.query_params.get('output') == 'jsonl':
+        return HttpResponse(''.join(profiling.jsonl_lines()), content_type='application/jsonl')
+    return Response(profiling.snapshot())
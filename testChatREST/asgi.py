@@ -13,4 +13,13 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'testChatREST.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Import po inicjalizacji Django (modele muszą być już załadowane)
+from REST.realtime import REALTIME_PATH, websocket_application  # noqa: E402
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'websocket' and scope['path'] == REALTIME_PATH:
+        return await websocket_application(scope, receive, send)
+    return await django_application(scope, receive, send)
@@ -9,6 +9,7 @@ https://docs.djangoproject.com/en/4.2/topics/settings/
 For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
+import os
 from datetime import timedelta
 from pathlib import Path
 
@@ -43,12 +44,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'REST.middleware.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
+    'REST.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
-    'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
-    'django.contrib.messages.middleware.MessageMiddleware',
+    'REST.middleware.CsrfViewMiddleware',
+    'REST.middleware.AuthenticationMiddleware',
+    'REST.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 
     'django.middleware.locale.LocaleMiddleware',
@@ -122,6 +124,22 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Haszowanie haseł (REST.hashing): pierwszy hasher tworzy nowe skróty, pozostałe tylko je
+# sprawdzają. Skróty z inną liczbą iteracji są przeliczane przy poprawnym logowaniu.
+PASSWORD_HASHERS = [
+    'REST.hashing.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+PASSWORD_HASH_ITERATIONS = 600000
+# Pula wątków haszowania i limit zadań oczekujących; po PASSWORD_HASHING_QUEUE_TIMEOUT
+# sekundach oczekiwania na miejsce w kolejce żądanie dostaje odpowiedź 503
+PASSWORD_HASHING_WORKERS = 4
+PASSWORD_HASHING_QUEUE_SIZE = 64
+PASSWORD_HASHING_QUEUE_TIMEOUT = 5
+
 # Internationalization
 # https://docs.djangoproject.com/en/4.2/topics/i18n/
 
@@ -138,6 +156,11 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Magazyn zdjęć profilowych (REST.media)
+PROFILE_PICTURE_ROOT = BASE_DIR / 'media'
+PROFILE_PICTURE_URL = '/api/media/'
+PROFILE_THUMBNAIL_SIZE = 128
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -150,10 +173,98 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated'
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
-    ]
+        'REST.authentication.CachedJWTAuthentication',
+    ],
+    'DEFAULT_THROTTLE_CLASSES': [
+        'REST.throttling.TokenBucketThrottle',
+    ],
 
 }
+# Cache lokalny dla procesu; przy wielu procesach należy wskazać wspólny backend
+# (np. Redis lub Memcached), aby unieważnienia były widoczne we wszystkich.
+# 'shared' jest wspólny dla procesów: Redis pod REDIS_URL, a bez niego tabela
+# w bazie (manage.py createcachetable)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Wspólny dla procesów cache blokad i komunikatów; musi to być Redis lub Memcached
+    # (REST.checks), aby odczyt z cache nie wykonywał zapytań do bazy
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('REDIS_URL', 'redis://127.0.0.1:6379/1'),
+    },
+    # Użytkownicy uwierzytelnieni tokenem (REST.authentication); przy wielu procesach
+    # unieważnienie dociera do pozostałych dopiero po AUTH_USER_CACHE_TIMEOUT
+    'users': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'users',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+AUTH_USER_CACHE = 'users'
+AUTH_USER_CACHE_TIMEOUT = 60
+
+# Cache zbiorów blokad (REST.blocking), wspólny dla procesów, i czas życia wpisów w sekundach
+BLOCKS_CACHE = 'shared'
+BLOCKS_CACHE_TIMEOUT = 300
+
+# Cache aktywnych komunikatów grup (REST.alert_cache), wspólny dla procesów,
+# i maksymalny czas życia listy komunikatów grupy w sekundach
+ALERTS_CACHE = 'shared'
+ALERTS_CACHE_TIMEOUT = 300
+
+# Zapis ostatniej aktywności użytkowników (REST.presence)
+PRESENCE_FLUSH_INTERVAL = timedelta(seconds=15)
+PRESENCE_WRITE_THRESHOLD = timedelta(seconds=30)
+# Użytkownik jest online, jeżeli był aktywny w tym oknie
+PRESENCE_ONLINE_WINDOW = timedelta(minutes=1)
+
+# Powiadomienia WebSocket (REST.realtime): backend publikacji i limit kolejki na połączenie
+REALTIME_BACKEND = 'REST.pubsub.InProcessBackend'
+REALTIME_QUEUE_SIZE = 100
+
+# Long-poll wiadomości (messages/wait/): domyślny i maksymalny czas oczekiwania w sekundach
+LONG_POLL_TIMEOUT = 25
+LONG_POLL_MAX_TIMEOUT = 55
+
+# Retencja danych (manage.py apply_retention): po jakim czasie i czy archiwizować przed usunięciem
+RETENTION_POLICIES = {
+    'alerts': {'after': timedelta(days=30), 'action': 'archive'},
+    'messages': {'after': timedelta(days=365), 'action': 'archive'},
+}
+RETENTION_ARCHIVE_DIR = BASE_DIR / 'archive'
+# Liczba wierszy usuwanych w jednej transakcji
+RETENTION_BATCH_SIZE = 1000
+
+# Ograniczanie żądań (REST.throttling): bucket na użytkownika lub IP w każdym zakresie
+# (throttle_scope widoku). rate to tempo uzupełniania, burst pojemność bucketu.
+# Przy wielu procesach THROTTLE_STORE = 'REST.throttling.CacheStore' ze wspólnym cache.
+THROTTLE_STORE = 'REST.throttling.InProcessStore'
+THROTTLE_BUCKETS = {
+    'default': {'rate': '120/min', 'burst': 60},
+    'messages': {'rate': '60/min', 'burst': 30},
+    'nearby': {'rate': '12/min', 'burst': 5},
+    'auth': {'rate': '10/min', 'burst': 5},
+}
+
+# Logowanie wyłącznie tokenami JWT: LoginView nie tworzy sesji, a dla ścieżek
+# SESSIONLESS_PATHS pomijane są middleware sesji, CSRF i komunikatów
+JWT_ONLY_LOGIN = True
+SESSIONLESS_PATHS = ['/api/accounts/']
+
+# Statystyki tras (REST.profiling): czasy, zapytania SQL, serializacja, rozmiar
+# odpowiedzi. Część żądań (PROFILING_CPROFILE_SAMPLE_RATE) jest profilowana
+# cProfile; profile żądań dłuższych niż PROFILING_SLOW_MS trafiają do
+# PROFILING_PROFILE_DIR. Przy PROFILING_DUMP_PATH statystyki są dopisywane do
+# pliku JSONL co PROFILING_DUMP_INTERVAL sekund.
+PROFILING_ENABLED = False
+PROFILING_SLOW_MS = 500
+PROFILING_CPROFILE_SAMPLE_RATE = 0.05
+PROFILING_PROFILE_DIR = BASE_DIR / 'profiles'
+PROFILING_DUMP_PATH = None
+PROFILING_DUMP_INTERVAL = 60
+
 AUTH_PROFILE_MODULE = 'REST.MyUser'
 AUTH_USER_MODEL = 'REST.MyUser'
 